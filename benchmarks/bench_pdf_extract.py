@@ -0,0 +1,78 @@
+"""
+Benchmarks PDF text extraction on synthetic multi-hundred-page PDFs.
+
+Compares the original single-threaded `content += page.get_text()` loop with helpers.pdf_extract.
+
+Usage:
+    python -m benchmarks.bench_pdf_extract --pages 200 500 --workers 4
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import fitz
+
+from helpers.pdf_extract import extract_pdf_text, iter_pdf_pages
+
+PARAGRAPH = ("Employers must withhold Pennsylvania personal income tax from compensation paid to resident "
+             "employees. The unemployment compensation taxable wage base and employee withholding rate change "
+             "for calendar quarters beginning on or after January 1. ")
+
+
+def make_pdf(path: str, pages: int, lines_per_page: int = 45) -> None:
+    """
+    Writes a synthetic text-heavy PDF with the given number of pages.
+    """
+    document = fitz.open()
+    for page_number in range(pages):
+        page = document.new_page()
+        text = f"Bulletin page {page_number + 1}\n\n" + "\n".join(PARAGRAPH[:95] for _ in range(lines_per_page))
+        page.insert_textbox(fitz.Rect(36, 36, 576, 756), text, fontsize=9)
+    document.save(path)
+    document.close()
+
+
+def legacy_extract(path: str) -> str:
+    content = ""
+    with open(path, "rb") as handle:
+        with fitz.open(stream=handle.read(), filetype="pdf") as pdf_document:
+            for page_number in range(pdf_document.page_count):
+                content += pdf_document.load_page(page_number).get_text()
+    return content
+
+
+def time_it(fn) -> tuple:
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF text extraction")
+    parser.add_argument("--pages", type=int, nargs="+", default=[200, 500])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    print(f"{'pages':>6} {'legacy s':>9} {'inline s':>9} {'pool s':>9} {'first page s':>13} {'chars':>10}")
+    for pages in args.pages:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, f"synthetic_{pages}.pdf")
+            make_pdf(path, pages)
+
+            legacy_time, legacy_text = time_it(lambda: legacy_extract(path))
+            inline_time, inline_text = time_it(lambda: extract_pdf_text(path, workers=1))
+            pool_time, pool_text = time_it(lambda: extract_pdf_text(path, workers=args.workers))
+            assert legacy_text == inline_text == pool_text
+
+            started = time.perf_counter()
+            generator = iter_pdf_pages(path, workers=args.workers)
+            next(generator)
+            first_page = time.perf_counter() - started
+            generator.close()
+
+            print(f"{pages:>6} {legacy_time:>9.3f} {inline_time:>9.3f} {pool_time:>9.3f} {first_page:>13.4f} {len(legacy_text):>10}")
+
+
+if __name__ == "__main__":
+    main()
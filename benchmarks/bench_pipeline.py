@@ -0,0 +1,153 @@
+"""
+End-to-end throughput benchmark for blob_llm_trigger and read_from_queue, fully offline.
+
+The LLM is a local OpenAI-compatible server with configurable latency, web pages come from a local static
+site (JavaScript pages are rendered by a fake WebDriver), Redis is in memory and the queue, Cosmos DB container
+and output bindings are in-memory stand-ins. Reports docs/sec, per-invocation p50/p95/p99 latency and peak RSS per scenario,
+plus the per-stage latencies recorded by helpers.metrics.
+
+Usage:
+    python -m benchmarks.bench_pipeline --docs 40 --concurrency 8 --llm-latency 0.3
+    python -m benchmarks.bench_pipeline --scenarios queue queue_recrawl --js-fraction 0.2 --json results.json
+    python -m benchmarks.bench_pipeline --scenarios blob_md --concurrency 16 --llm-rpm 600
+    LLM_PACKING=true python -m benchmarks.bench_pipeline --scenarios queue --doc-chars 1500 --urls-per-message 8
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import sys
+
+# Configure the repo modules for local stand-ins before they are imported
+os.environ.setdefault("USE_AZURE_OPENAI", "false")
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("LLM_MODEL", "fake-model")
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+os.environ.setdefault("METRICS_LOG", "false")
+os.environ.setdefault("PERSISTENCE_SINK", "binding")
+os.environ.setdefault("QUEUE_BACKEND", "storage")
+os.environ.pop("REDIS_HOST", None)
+
+from benchmarks import fakes  # noqa: E402
+from benchmarks.corpus import make_blob_corpus, make_site, page_state  # noqa: E402
+from benchmarks.harness import format_results, run_scenario, write_results  # noqa: E402
+
+SCENARIOS = ["blob_md", "blob_pdf", "queue", "queue_recrawl"]
+
+
+def stage_summary() -> dict:
+    from helpers import metrics
+    histograms = metrics.snapshot(drop_tags=("state",))["histograms"]
+    return {series: {key: stats[key] for key in ("count", "p50", "p95", "p99")}
+            for series, stats in histograms.items() if series.startswith("stage_latency_ms")}
+
+
+def prefilter_summary() -> dict:
+    from helpers import metrics
+    counters = metrics.snapshot(drop_tags=("state", "source"))["counters"]
+    return {series: value for series, value in counters.items() if series.startswith("prefilter_documents")}
+
+
+def resilience_summary() -> dict:
+    from helpers import metrics
+    counters = metrics.snapshot(drop_tags=("state",))["counters"]
+    return {series: value for series, value in counters.items()
+            if series.startswith(("retries", "rate_limited", "circuit_transitions", "prompt_tokens", "completion_tokens",
+                                  "llm_pack_fallback"))}
+
+
+def blob_work(name_and_data) -> int:
+    import blob_trigger
+    name, data = name_and_data
+    documents = fakes.InMemoryOut()
+    blob_trigger.blob_llm_trigger(fakes.FakeInputStream(name, data), documents)
+    return len(documents.get() or [])
+
+
+def queue_work(message: str) -> int:
+    import queue_triggers
+    with fakes.record_writers() as writers:
+        queue_triggers.read_from_queue(fakes.FakeQueueMessage(message))
+    return sum(writer.written for writer in writers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline throughput benchmark")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--docs", type=int, default=24, help="Blobs per blob scenario and pages per queue scenario")
+    parser.add_argument("--doc-chars", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent function invocations")
+    parser.add_argument("--llm-latency", type=float, default=0.25)
+    parser.add_argument("--llm-jitter", type=float, default=0.05)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-rpm", type=int, default=0, help="Requests per minute the fake LLM enforces (0 = none)")
+    parser.add_argument("--page-latency", type=float, default=0.02)
+    parser.add_argument("--render-latency", type=float, default=0.5, help="Fake browser render time per page")
+    parser.add_argument("--js-fraction", type=float, default=0.1, help="Share of pages that need the browser tier")
+    parser.add_argument("--urls-per-message", type=int, default=4)
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the functions' log output")
+    args = parser.parse_args()
+
+    pages, js_paths = make_site(args.docs, target_chars=args.doc_chars, js_fraction=args.js_fraction)
+    with fakes.FakeLLMServer(latency=args.llm_latency, jitter=args.llm_jitter, error_rate=args.llm_error_rate,
+                             requests_per_minute=args.llm_rpm) as llm_server, \
+            fakes.StaticSiteServer(pages, js_paths=js_paths, latency=args.page_latency) as site:
+        os.environ["OPENAI_BASE_URL"] = llm_server.openai_base_url
+        fakes.install_memory_redis()
+        fakes.install_fake_cosmos()
+        fakes.install_fake_webdriver(args.render_latency)
+        queue = fakes.install_fake_queue()
+
+        # The triggers load their dependencies on first invocation; load them up front so the first scenario does
+        # not pay for the imports, and before lowering the log level because helpers.llm configures logging
+        import helpers.llm, helpers.pdf_extract, helpers.queue_processing  # noqa: F401, E401
+        from helpers import metrics
+        from helpers.queue_fanout import batch_messages, make_queue_item
+        if not args.verbose:
+            logging.getLogger().setLevel(logging.WARNING)
+
+        # URL lists are fanned out per state (states/{state}/*.urls), so a message holds one state's URLs
+        messages = list(batch_messages(
+            (make_queue_item(page_state(path), site.base_url + path) for path in sorted(pages, key=page_state)),
+            args.urls_per_message))
+        scenarios = {
+            "blob_md": (make_blob_corpus(args.docs, "md", args.doc_chars), blob_work),
+            "blob_pdf": (make_blob_corpus(args.docs, "pdf", args.doc_chars), blob_work),
+            "queue": (messages, queue_work),
+            "queue_recrawl": (messages, queue_work),  # Same pages again: exercises the unchanged-content path
+        }
+
+        results = []
+        for name in args.scenarios:
+            items, work = scenarios[name]
+            metrics.get_registry().reset()
+            llm_before, site_before, limited_before = llm_server.requests, site.requests, llm_server.rate_limited
+            output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            with output:
+                result = run_scenario(name, items, work, concurrency=args.concurrency, extra=lambda: {
+                    "llm_requests": llm_server.requests - llm_before,
+                    "llm_rate_limited": llm_server.rate_limited - limited_before,
+                    "page_requests": site.requests - site_before,
+                    "queue_messages": len(queue.messages),
+                    "stages": stage_summary(),
+                    "prefilter": prefilter_summary(),
+                    "resilience": resilience_summary(),
+                })
+            results.append(result)
+
+    print(format_results(results))
+    for result in results:
+        print(f"\n{result.name}: {result.extra['llm_requests']} LLM requests "
+              f"({result.extra['llm_rate_limited']} rate limited), {result.extra['page_requests']} page requests")
+        for series, value in {**result.extra["prefilter"], **result.extra["resilience"]}.items():
+            print(f"  {series:60} {value}")
+        for series, stats in result.extra["stages"].items():
+            print(f"  {series:60} n={stats['count']:<5} p50={stats['p50']:<9} p95={stats['p95']:<9} p99={stats['p99']}")
+    if args.json:
+        write_results(results, args.json)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+Memory profile of text/markdown blob ingestion: peak RSS of reading a blob and running it through the prefilter
+and chunking (everything blob_llm_trigger does before the LLM calls), for growing blob sizes.
+
+"legacy" is the original `myblob.read().decode('utf-8')`; "stream" is helpers.text_stream.iter_text_segments.
+Each measurement runs in a fresh interpreter so peak RSS is not carried over. The streaming path should stay
+flat as the blob grows; the script exits 1 if its RSS growth varies by more than --tolerance-mb across sizes.
+
+Usage:
+    python -m benchmarks.bench_text_stream
+    python -m benchmarks.bench_text_stream --sizes-mb 16 64 256 --modes stream --max-memory-mb 8
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("LLM_TOKEN_ENCODING", "offline")  # Estimated token counts; no encoder download
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_blob(path: str, size_mb: int) -> None:
+    """
+    Writes a markdown dump of about size_mb MB made of bulletin-like documents.
+    """
+    from benchmarks.corpus import STATES, make_text_document
+    rng = random.Random(11)
+    documents = [make_text_document(rng, STATES[i % len(STATES)], 20000) for i in range(16)]
+    target = size_mb * 1024 * 1024
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < target:
+            document = rng.choice(documents) + "\n\n"
+            f.write(document)
+            written += len(document)
+
+
+def run_child(mode: str, path: str, max_memory_mb: float) -> dict:
+    import helpers.chunking
+    import helpers.prefilter
+    import helpers.text_stream
+    baseline = _peak_rss_mb()
+    started = time.perf_counter()
+
+    with open(path, "rb") as blob:
+        if mode == "legacy":
+            pages = [blob.read().decode("utf-8")]
+        else:
+            pages = helpers.text_stream.iter_text_segments(
+                blob, **helpers.text_stream.segment_settings(max_memory_mb=max_memory_mb))
+        screen = helpers.prefilter.PageScreen("PA", source="benchmark")
+        chunks = sum(1 for _ in helpers.chunking.iter_chunks(screen.filter(pages)))
+
+    return {"mode": mode, "chunks": chunks, "seconds": round(time.perf_counter() - started, 2),
+            "baseline_mb": round(baseline, 1), "peak_mb": round(_peak_rss_mb(), 1),
+            "growth_mb": round(_peak_rss_mb() - baseline, 1)}
+
+
+def measure(mode: str, path: str, max_memory_mb: float) -> dict:
+    result = subprocess.run([sys.executable, "-m", "benchmarks.bench_text_stream", "--child", mode, path,
+                             "--max-memory-mb", str(max_memory_mb)], cwd=REPO_ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{mode} run failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory profile of text blob ingestion")
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--modes", nargs="+", choices=["legacy", "stream"], default=["legacy", "stream"])
+    parser.add_argument("--max-memory-mb", type=float, default=16, help="BLOB_STREAM_MAX_MEMORY_MB for the reader")
+    parser.add_argument("--tolerance-mb", type=float, default=24,
+                        help="Allowed spread of the streaming RSS growth across sizes")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child[0], args.child[1], args.max_memory_mb)))
+        return 0
+
+    print(f"{'size MB':>8} {'mode':>7} {'chunks':>7} {'seconds':>8} {'baseline MB':>12} {'peak MB':>8} {'growth MB':>10}")
+    growth = {mode: [] for mode in args.modes}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size_mb in args.sizes_mb:
+            path = os.path.join(tmp, f"dump_{size_mb}.md")
+            write_blob(path, size_mb)
+            for mode in args.modes:
+                result = measure(mode, path, args.max_memory_mb)
+                growth[mode].append(result["growth_mb"])
+                print(f"{size_mb:>8} {mode:>7} {result['chunks']:>7} {result['seconds']:>8} "
+                      f"{result['baseline_mb']:>12} {result['peak_mb']:>8} {result['growth_mb']:>10}")
+            os.remove(path)
+
+    if "stream" in growth and len(growth["stream"]) > 1:
+        spread = max(growth["stream"]) - min(growth["stream"])
+        if spread > args.tolerance_mb:
+            print(f"\nFAIL: streaming RSS growth varies by {spread:.1f} MB across sizes (tolerance {args.tolerance_mb} MB)")
+            return 1
+        print(f"\nOK: streaming RSS growth varies by {spread:.1f} MB across sizes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Cold-start guard: measures how long `import function_app` takes in a fresh interpreter (python -X importtime)
+and fails when it exceeds the budget or when a heavy dependency is imported at startup instead of lazily
+inside the function that needs it.
+
+Usage:
+    python -m benchmarks.check_import_time
+    python -m benchmarks.check_import_time --runs 5 --budget-ms 600 --top 15
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Median cumulative import time allowed for function_app, in milliseconds
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "600"))
+
+# Modules only some invocations need; they must be loaded on first use, not by the host at startup
+FORBIDDEN_AT_STARTUP = ["fitz", "pymupdf", "openai", "tiktoken", "selenium", "redis", "pandas", "azure.identity",
+                        "lxml", "azure.storage.queue", "azure.cosmos", "helpers.llm", "helpers.fetcher"]
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module: str = "function_app") -> Tuple[Dict[str, int], List[Tuple[str, int]]]:
+    """
+    Imports `module` in a fresh interpreter and returns ({module: cumulative us}, top-level imports in order).
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=REPO_ROOT,
+                            capture_output=True, text=True, env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1"))
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    cumulative, top_level = {}, []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        name, cumulative_us = match.group(4), int(match.group(2))
+        cumulative[name] = max(cumulative.get(name, 0), cumulative_us)
+        if len(match.group(3)) <= 1:
+            top_level.append((name, cumulative_us))
+    return cumulative, top_level
+
+
+def loaded_at_startup(cumulative: Dict[str, int]) -> List[str]:
+    """
+    The FORBIDDEN_AT_STARTUP modules (or their submodules) found in a measure() result.
+    """
+    return sorted(name for name in FORBIDDEN_AT_STARTUP
+                  if any(module == name or module.startswith(name + ".") for module in cumulative))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the cold-start import time of function_app")
+    parser.add_argument("--module", default="function_app")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters to measure; the median is checked")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    args = parser.parse_args()
+
+    totals, runs = [], []
+    for _ in range(max(1, args.runs)):
+        cumulative, top_level = measure(args.module)
+        totals.append(cumulative.get(args.module, 0) / 1000)
+        runs.append((cumulative, top_level))
+    median = sorted(totals)[len(totals) // 2]
+    cumulative = runs[totals.index(median)][0]
+
+    print(f"import {args.module}: median {median:.1f} ms over {len(totals)} run(s) "
+          f"(min {min(totals):.1f}, max {max(totals):.1f}, budget {args.budget_ms:.0f} ms)")
+    print(f"\nSlowest imports (cumulative ms):")
+    for name, us in sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[1:args.top + 1]:
+        print(f"  {us / 1000:9.1f}  {name}")
+
+    loaded = loaded_at_startup(cumulative)
+    failed = False
+    if loaded:
+        failed = True
+        print(f"\nFAIL: imported at startup, should be lazy: {', '.join(loaded)}")
+    if median > args.budget_ms:
+        failed = True
+        print(f"\nFAIL: {median:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+    if not failed:
+        print("\nOK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
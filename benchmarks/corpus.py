@@ -0,0 +1,94 @@
+"""
+Synthetic corpus for the benchmarks: tax-bulletin style text/markdown documents, PDFs and linked HTML pages.
+Generation is seeded, so runs with the same arguments see the same corpus.
+"""
+import random
+from typing import Dict, List, Optional, Tuple
+
+import fitz
+
+STATES = ["PA", "NY", "CA", "TX", "OH", "NJ", "IL", "GA"]
+
+_SENTENCES = [
+    "Employers must withhold state personal income tax from compensation paid to resident employees.",
+    "The unemployment compensation taxable wage base increases for calendar quarters beginning on or after January 1.",
+    "The employee withholding rate for unemployment compensation remains unchanged.",
+    "Local earned income tax collectors must be notified of new work locations within thirty days.",
+    "Retirement distributions from eligible employer plans are excluded from taxable compensation.",
+    "Payments made under a garnishment order must be remitted with the quarterly reconciliation.",
+    "The department will publish revised withholding tables before the effective date.",
+    "Employers filing electronically must use the updated file format beginning with the first quarter.",
+    "Questions about this bulletin may be directed to the employer services division.",
+    "This notice supersedes all prior guidance on the treatment of fringe benefits.",
+]
+_HEADINGS = ["Background", "Withholding Changes", "Unemployment Compensation", "Effective Date",
+             "Filing Requirements", "Local Taxes", "Questions"]
+
+
+def make_text_document(rng: random.Random, state: str, target_chars: int = 4000, markdown: bool = True) -> str:
+    """
+    Returns a bulletin-like document of roughly target_chars characters with headings and paragraphs.
+    """
+    parts = [f"# {state} Employer Tax Bulletin {rng.randint(1, 99)}-{rng.randint(1, 12):02d}" if markdown
+             else f"{state} EMPLOYER TAX BULLETIN"]
+    size = len(parts[0])
+    while size < target_chars:
+        heading = rng.choice(_HEADINGS)
+        parts.append(f"## {heading}" if markdown else heading.upper())
+        paragraph = " ".join(rng.choice(_SENTENCES) for _ in range(rng.randint(3, 7)))
+        parts.append(paragraph)
+        size += len(heading) + len(paragraph) + 4
+    return "\n\n".join(parts)
+
+
+def make_pdf_bytes(text: str, lines_per_page: int = 45) -> bytes:
+    """
+    Lays the text out over as many PDF pages as it needs and returns the PDF bytes.
+    """
+    document = fitz.open()
+    lines = [line[i:i + 95] for line in text.split("\n") for i in range(0, max(len(line), 1), 95)]
+    for start in range(0, len(lines), lines_per_page):
+        page = document.new_page()
+        page.insert_textbox(fitz.Rect(36, 36, 576, 756), "\n".join(lines[start:start + lines_per_page]), fontsize=9)
+    data = document.tobytes()
+    document.close()
+    return data
+
+
+def make_blob_corpus(count: int, kind: str = "md", target_chars: int = 4000, seed: int = 7) -> List[Tuple[str, bytes]]:
+    """
+    Returns (blob name, content) pairs such as ("states/PA/bulletin-3.md", b"..."), for kind "md", "txt" or "pdf".
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        state = STATES[i % len(STATES)]
+        text = make_text_document(rng, state, target_chars, markdown=kind == "md")
+        data = make_pdf_bytes(text) if kind == "pdf" else text.encode("utf-8")
+        corpus.append((f"states/{state}/bulletin-{i}.{kind}", data))
+    return corpus
+
+
+def make_site(count: int, links_per_page: int = 5, target_chars: int = 3000, js_fraction: float = 0.0,
+              seed: int = 7) -> Tuple[Dict[str, str], set]:
+    """
+    Returns ({path: html}, js_paths) for a site of `count` linked pages. A js_fraction of the pages are marked
+    as client-side rendered (served as an empty app shell to the plain HTTP tier).
+    """
+    rng = random.Random(seed)
+    paths = [f"/tax/bulletins/{i}" for i in range(count)]
+    pages = {}
+    for i, path in enumerate(paths):
+        state = STATES[i % len(STATES)]
+        body = "".join(f"<p>{paragraph}</p>" for paragraph in
+                       make_text_document(rng, state, target_chars, markdown=False).split("\n\n"))
+        links = "".join(f'<li><a href="{rng.choice(paths)}">Related bulletin</a></li>' for _ in range(links_per_page))
+        pages[path] = (f"<html><head><title>{state} bulletin {i}</title></head><body><main>{body}</main>"
+                       f"<nav><ul>{links}<li><a href=\"/contact\">Contact</a></li></ul></nav></body></html>")
+    js_paths = set(rng.sample(paths, int(count * js_fraction))) if js_fraction else set()
+    return pages, js_paths
+
+
+def page_state(path: str, states: Optional[List[str]] = None) -> str:
+    states = states or STATES
+    return states[int(path.rsplit("/", 1)[-1]) % len(states)]
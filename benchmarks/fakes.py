@@ -0,0 +1,539 @@
+"""
+Local stand-ins for the services the functions talk to, so the pipeline can be benchmarked on a plain Linux box.
+
+- FakeLLMServer: OpenAI-compatible chat completions endpoint with configurable latency and canned TaxChange JSON.
+- StaticSiteServer: serves synthetic HTML pages, optionally as JavaScript shells that need the browser tier.
+- FakeWebDriver: the parts of a Selenium WebDriver that helpers.web_scraper uses, rendering via StaticSiteServer.
+- MemoryRedis: the subset of redis-py used by helpers.redis_handler, fetch_store, crawl_frontier and llm_cache.
+- InMemoryOut, FakeQueueClient, FakeCosmosContainer, FakeInputStream, FakeQueueMessage: binding and SDK stand-ins.
+"""
+import contextlib
+import fnmatch
+import io
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+_STATE_PATTERN = re.compile(r"\bState\W+([A-Z]{2})\b")
+_PACKED_DOCUMENT = re.compile(r'<document source_id="([^"]+)" state="([A-Z]{2})">')
+
+
+def canned_changes(state: str = "PA", count: int = 2) -> List[Dict[str, Any]]:
+    categories = [("Payroll Taxes", "Unemployment Insurance"), ("Income Tax", "Withholding Rates"),
+                  ("Payroll Taxes", "Local Earned Income Tax"), ("Retirement", "Pension Exclusions")]
+    return [{
+        "state": state,
+        "category": category,
+        "subcategory": subcategory,
+        "rationale": f"Synthetic change {i + 1} for benchmarking.",
+        "confidence": 90 - i,
+        "is_match": True,
+        "created_at": ""
+    } for i, (category, subcategory) in enumerate(categories[:count])]
+
+
+class _Server:
+    """
+    Runs a ThreadingHTTPServer on an ephemeral port in a daemon thread. Use as a context manager.
+    """
+    handler_class = BaseHTTPRequestHandler
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        handler = type("Handler", (self.handler_class,), {"owner": self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+class _LLMHandler(BaseHTTPRequestHandler):
+    owner = None
+
+    def do_POST(self):
+        owner = self.owner
+        owner.count()
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt = "".join(message.get("content", "") for message in body.get("messages", []))
+        time.sleep(max(0.0, random.gauss(owner.latency, owner.jitter)))
+
+        if owner.error_rate and random.random() < owner.error_rate:
+            with owner._lock:
+                owner.rate_limited += 1
+            return self._send(429, {"error": {"message": "Rate limit exceeded", "type": "rate_limit"}},
+                              {"Retry-After": "1"})
+        allowed, limit_headers = owner.take_request()
+        if not allowed:
+            return self._send(429, {"error": {"message": "Rate limit exceeded", "type": "rate_limit"}}, limit_headers)
+
+        packed = _PACKED_DOCUMENT.findall(prompt)
+        match = _STATE_PATTERN.search(prompt)
+        changes = canned_changes(match.group(1) if match else "PA", owner.changes_per_response)
+        if packed:
+            # Packed request: one entry per tagged document
+            content = json.dumps({"results": [{"source_id": source_id,
+                                               "changes": canned_changes(state, owner.changes_per_response)}
+                                              for source_id, state in packed]})
+        elif (body.get("response_format") or {}).get("type") in ("json_object", "json_schema"):
+            content = json.dumps({"changes": changes})  # JSON modes return a bare object, never fenced
+        else:
+            content = json.dumps(changes)
+            if owner.fenced:
+                content = f"```json\n{content}\n```"
+        prompt_tokens = max(1, len(prompt) // 4)
+        completion_tokens = max(1, len(content) // 4)
+        self._send(200, {
+            "id": f"chatcmpl-{owner.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model") or "fake",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        }, limit_headers or {"x-ratelimit-remaining-requests": "1000", "x-ratelimit-remaining-tokens": "1000000"})
+
+    def _send(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeLLMServer(_Server):
+    """
+    OpenAI-compatible /v1/chat/completions (and Azure /openai/deployments/*/chat/completions) endpoint.
+
+    Parameters:
+        latency (float): Mean seconds per completion.
+        jitter (float): Standard deviation of the latency.
+        error_rate (float): Fraction of requests answered with 429.
+        fenced (bool): Wrap the JSON in a ```json fence, like chat models often do.
+        requests_per_minute (int): Enforce a request quota like the real API: a token bucket refilled
+            continuously, x-ratelimit-* headers on every response and 429 + Retry-After once it is empty.
+    """
+    handler_class = _LLMHandler
+
+    def __init__(self, latency: float = 0.2, jitter: float = 0.05, error_rate: float = 0.0,
+                 changes_per_response: int = 2, fenced: bool = True, requests_per_minute: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.changes_per_response = changes_per_response
+        self.fenced = fenced
+        self.requests_per_minute = requests_per_minute
+        self.rate_limited = 0
+        self._quota = float(requests_per_minute)
+        self._quota_updated = time.monotonic()
+
+    def take_request(self):
+        """
+        Spends one request of the quota. Returns (allowed, rate limit headers); headers are None without a quota.
+        """
+        if not self.requests_per_minute:
+            return True, None
+        rate = self.requests_per_minute / 60.0
+        with self._lock:
+            now = time.monotonic()
+            self._quota = min(self.requests_per_minute, self._quota + (now - self._quota_updated) * rate)
+            self._quota_updated = now
+            allowed = self._quota >= 1
+            if allowed:
+                self._quota -= 1
+            else:
+                self.rate_limited += 1
+            remaining = int(self._quota)
+            reset = (self.requests_per_minute - self._quota) / rate
+        headers = {"x-ratelimit-limit-requests": str(self.requests_per_minute),
+                   "x-ratelimit-remaining-requests": str(remaining),
+                   "x-ratelimit-reset-requests": f"{reset:.3f}s"}
+        if not allowed:
+            headers["retry-after-ms"] = str(int((1 - self._quota) / rate * 1000) + 1)
+        return allowed, headers
+
+    @property
+    def openai_base_url(self) -> str:
+        return f"{self.base_url}/v1"
+
+
+class _SiteHandler(BaseHTTPRequestHandler):
+    owner = None
+
+    def do_GET(self):
+        owner = self.owner
+        owner.count()
+        time.sleep(owner.latency)
+        path = urlsplit(self.path).path
+        page = owner.pages.get(path)
+        if page is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        rendered = self.headers.get("X-Rendered") == "1"
+        html = page["html"] if rendered or not page.get("js") else owner.js_shell
+        data = html.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", f'"{hash(html) & 0xffffffff:x}"')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class StaticSiteServer(_Server):
+    """
+    Serves synthetic pages from a {path: html} mapping. Paths listed in js_paths are served as an empty
+    JavaScript app shell unless the request carries "X-Rendered: 1" (which FakeWebDriver sends).
+    """
+    handler_class = _SiteHandler
+    js_shell = "<html><body><div id=\"root\"></div><script src=\"/app.js\"></script></body></html>"
+
+    def __init__(self, pages: Dict[str, str], js_paths: Optional[set] = None, latency: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        js_paths = js_paths or set()
+        self.pages = {path: {"html": html, "js": path in js_paths} for path, html in pages.items()}
+        self.latency = latency
+
+    def urls(self) -> List[str]:
+        return [self.base_url + path for path in self.pages]
+
+
+class _FakeElement:
+    def __init__(self, text: str = "", href: Optional[str] = None):
+        self.text = text
+        self._href = href
+
+    def get_attribute(self, name: str):
+        return self._href if name == "href" else None
+
+
+class FakeWebDriver:
+    """
+    Stands in for a remote Chrome session: get() fetches the fully rendered page from StaticSiteServer after a
+    simulated render delay, and body text and <a> links are served from it.
+    """
+    def __init__(self, render_latency: float = 0.5):
+        self.render_latency = render_latency
+        self.current_url = "about:blank"
+        self._text, self._links = "", []
+        self.pages_loaded = 0
+
+    def get(self, url: str) -> None:
+        import requests
+        from helpers.fetcher import html_to_text_and_links
+        self.current_url = url
+        if url == "about:blank":
+            self._text, self._links = "", []
+            return
+        time.sleep(self.render_latency)
+        response = requests.get(url, headers={"X-Rendered": "1"}, timeout=30)
+        self._text, self._links = html_to_text_and_links(response.text, url)
+        self.pages_loaded += 1
+
+    def find_element(self, by, value):
+        return _FakeElement(text=self._text)
+
+    def find_elements(self, by, value):
+        return [_FakeElement(href=link) for link in self._links]
+
+    def set_page_load_timeout(self, seconds: float) -> None:
+        pass
+
+    def delete_all_cookies(self) -> None:
+        pass
+
+    def execute_script(self, script: str, *args) -> None:
+        return None
+
+    def quit(self) -> None:
+        pass
+
+
+def install_fake_webdriver(render_latency: float = 0.5) -> None:
+    """
+    Makes helpers.web_scraper create FakeWebDriver sessions instead of connecting to a Selenium grid.
+    """
+    import helpers.web_scraper as web_scraper
+    web_scraper.close_driver_pools()
+    web_scraper.create_driver = lambda selenium_url: FakeWebDriver(render_latency)
+
+
+class _MemoryPipeline:
+    def __init__(self, client: "MemoryRedis"):
+        self._client = client
+        self._calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._calls.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self) -> list:
+        calls, self._calls = self._calls, []
+        return [getattr(self._client, name)(*args, **kwargs) for name, args, kwargs in calls]
+
+
+class MemoryRedis:
+    """
+    In-memory subset of redis-py (strings, sets, hashes, counters) for the code paths the pipeline uses.
+    Expiry is accepted and ignored. Streams are not supported; use fakeredis for helpers.redis_streams.
+    """
+    def __init__(self):
+        self._data: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _key(key) -> str:
+        return key.decode("utf-8") if isinstance(key, bytes) else str(key)
+
+    @staticmethod
+    def _bytes(value) -> bytes:
+        return value if isinstance(value, bytes) else str(value).encode("utf-8")
+
+    def pipeline(self, transaction: bool = True) -> _MemoryPipeline:
+        return _MemoryPipeline(self)
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(self._key(key))
+            return value if isinstance(value, bytes) else None
+
+    def set(self, key, value, ex=None, **kwargs) -> bool:
+        with self._lock:
+            self._data[self._key(key)] = self._bytes(value)
+            return True
+
+    def mget(self, keys) -> list:
+        return [self.get(key) for key in keys]
+
+    def delete(self, *keys) -> int:
+        with self._lock:
+            return sum(1 for key in keys if self._data.pop(self._key(key), None) is not None)
+
+    def expire(self, key, seconds) -> bool:
+        return self._key(key) in self._data
+
+    def incr(self, key, amount: int = 1) -> int:
+        with self._lock:
+            value = int(self._data.get(self._key(key), b"0")) + amount
+            self._data[self._key(key)] = str(value).encode("utf-8")
+            return value
+
+    def type(self, key) -> bytes:
+        value = self._data.get(self._key(key))
+        if value is None:
+            return b"none"
+        return {bytes: b"string", set: b"set", dict: b"hash"}[type(value)]
+
+    def sadd(self, key, *members) -> int:
+        with self._lock:
+            current = self._data.setdefault(self._key(key), set())
+            added = [member for member in members if member not in current]
+            current.update(added)
+            return len(added)
+
+    def smismember(self, key, members) -> list:
+        with self._lock:
+            current = self._data.get(self._key(key), set())
+            return [1 if member in current else 0 for member in members]
+
+    def hset(self, key, field=None, value=None, mapping=None) -> int:
+        with self._lock:
+            current = self._data.setdefault(self._key(key), {})
+            items = dict(mapping or {})
+            if field is not None:
+                items[field] = value
+            new = sum(1 for name in items if name not in current)
+            current.update({name: self._bytes(item) for name, item in items.items()})
+            return new
+
+    def hgetall(self, key) -> dict:
+        with self._lock:
+            return {self._bytes(field): value for field, value in self._data.get(self._key(key), {}).items()}
+
+    def hmget(self, key, fields) -> list:
+        with self._lock:
+            current = self._data.get(self._key(key), {})
+            return [current.get(field) for field in fields]
+
+    def scan_iter(self, match: str = "*", count: int = None):
+        for key in list(self._data):
+            if fnmatch.fnmatchcase(key, match):
+                yield key.encode("utf-8")
+
+
+def install_memory_redis():
+    """
+    Points helpers.redis_handler at fakeredis when it is installed, or at MemoryRedis otherwise.
+    """
+    import helpers.redis_handler as rh
+    try:
+        import fakeredis
+        rh._client = fakeredis.FakeStrictRedis()
+    except ImportError:
+        rh._client = MemoryRedis()
+    return rh._client
+
+
+class InMemoryOut:
+    """
+    Stand-in for func.Out[...]: keeps every value the function sets.
+    """
+    def __init__(self):
+        self.values = []
+
+    def set(self, value) -> None:
+        self.values.append(value)
+
+    def get(self):
+        return self.values[-1] if self.values else None
+
+
+class FakeQueueClient:
+    """
+    Stand-in for azure.storage.queue.QueueClient that keeps sent messages in memory.
+    """
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.messages: List[str] = []
+        self._lock = threading.Lock()
+
+    def send_message(self, content: str):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.messages.append(content)
+        return {"id": str(len(self.messages))}
+
+
+def install_fake_queue(queue_name: str = "url-job-q", latency: float = 0.0) -> FakeQueueClient:
+    """
+    Makes helpers.queue_fanout send to an in-memory queue.
+    """
+    import helpers.queue_fanout as queue_fanout
+    client = FakeQueueClient(latency)
+    queue_fanout._queue_clients[(queue_name, "STORAGE_CONNECTION")] = client
+    return client
+
+
+class FakeCosmosContainer:
+    """
+    Stand-in for an azure-cosmos ContainerProxy: upserts into a dict keyed by id.
+    """
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.items: Dict[str, dict] = {}
+        self.upserts = 0
+        self._lock = threading.Lock()
+
+    def upsert_item(self, body: dict) -> dict:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.items[body["id"]] = body
+            self.upserts += 1
+        return body
+
+
+_recorded_writers = threading.local()
+
+
+def install_fake_cosmos(latency: float = 0.0) -> FakeCosmosContainer:
+    """
+    Makes helpers.persistence's SDK sink upsert into an in-memory container, and lets record_writers() see the
+    DocumentWriters created for it.
+    """
+    import helpers.persistence as persistence
+    container = FakeCosmosContainer(latency)
+    persistence._container = container
+    create_writer = persistence.create_writer
+
+    def recording_create_writer(*args, **kwargs):
+        writer = create_writer(*args, **kwargs)
+        writers = getattr(_recorded_writers, "writers", None)
+        if writers is not None:
+            writers.append(writer)
+        return writer
+
+    if not getattr(create_writer, "recording", False):
+        recording_create_writer.recording = True
+        persistence.create_writer = recording_create_writer
+    return container
+
+
+@contextlib.contextmanager
+def record_writers():
+    """
+    Collects the DocumentWriters created on this thread, e.g. to count the documents one invocation stored
+    in the shared container. Requires install_fake_cosmos().
+    """
+    _recorded_writers.writers = []
+    try:
+        yield _recorded_writers.writers
+    finally:
+        _recorded_writers.writers = None
+
+
+class FakeInputStream(io.BytesIO):
+    """
+    Stand-in for func.InputStream: a readable blob with a name ("states/PA/file.pdf") and length.
+    """
+    def __init__(self, name: str, data: bytes):
+        super().__init__(data)
+        self.name = name
+        self.length = len(data)
+        self.uri = f"https://fake.blob.core.windows.net/{name}"
+
+
+class FakeQueueMessage:
+    """
+    Stand-in for func.QueueMessage.
+    """
+    def __init__(self, body: str):
+        self._body = body.encode("utf-8")
+        self.id = str(id(self))
+        self.dequeue_count = 1
+
+    def get_body(self) -> bytes:
+        return self._body
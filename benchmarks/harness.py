@@ -0,0 +1,129 @@
+"""
+Runs a benchmark scenario on a thread pool and reports docs/sec, latency percentiles and peak memory.
+"""
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from pydantic import BaseModel, Field
+
+from helpers.metrics import percentile
+
+
+class ScenarioResult(BaseModel):
+    name: str
+    items: int = 0
+    docs: int = 0
+    errors: int = 0
+    concurrency: int = 1
+    wall_seconds: float = 0.0
+    docs_per_second: float = 0.0
+    items_per_second: float = 0.0
+    latency_p50: float = 0.0
+    latency_p95: float = 0.0
+    latency_p99: float = 0.0
+    latency_max: float = 0.0
+    peak_rss_mb: float = 0.0
+    rss_growth_mb: float = 0.0
+    extra: Dict[str, Any] = Field(default_factory=dict)
+
+
+def _current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        # Not Linux: fall back to the process-lifetime peak
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RssSampler:
+    """
+    Samples the resident set size in a background thread and keeps the peak seen while running.
+    """
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.start_mb = 0.0
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, _current_rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.start_mb = self.peak_mb = _current_rss_mb()
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, _current_rss_mb())
+
+
+def run_scenario(name: str, items: Iterable[Any], work: Callable[[Any], int], concurrency: int = 1,
+                 extra: Optional[Callable[[], Dict[str, Any]]] = None) -> ScenarioResult:
+    """
+    Calls work(item) for every item on `concurrency` threads, the way the Functions host runs concurrent
+    invocations. work returns the number of documents it produced.
+    """
+    items = list(items)
+    latencies: List[float] = []
+    result = ScenarioResult(name=name, items=len(items), concurrency=concurrency)
+    lock = threading.Lock()
+
+    def timed(item) -> None:
+        started = time.perf_counter()
+        docs, failed = 0, False
+        try:
+            docs = work(item) or 0
+        except Exception as e:
+            failed = True
+            print(f"[{name}] item failed: {e}", file=sys.stderr)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            result.docs += docs
+            result.errors += failed
+
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(timed, items))
+        result.wall_seconds = round(time.perf_counter() - started, 3)
+
+    latencies.sort()
+    result.docs_per_second = round(result.docs / result.wall_seconds, 2) if result.wall_seconds else 0.0
+    result.items_per_second = round(result.items / result.wall_seconds, 2) if result.wall_seconds else 0.0
+    result.latency_p50 = round(percentile(latencies, 50), 4)
+    result.latency_p95 = round(percentile(latencies, 95), 4)
+    result.latency_p99 = round(percentile(latencies, 99), 4)
+    result.latency_max = round(latencies[-1], 4) if latencies else 0.0
+    result.peak_rss_mb = round(rss.peak_mb, 1)
+    result.rss_growth_mb = round(rss.peak_mb - rss.start_mb, 1)
+    if extra is not None:
+        result.extra = extra()
+    return result
+
+
+def format_results(results: List[ScenarioResult]) -> str:
+    lines = [f"{'scenario':24} {'items':>6} {'docs':>6} {'err':>4} {'conc':>5} {'wall s':>8} {'docs/s':>8} "
+             f"{'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'peak MB':>8} {'+MB':>6}"]
+    for r in results:
+        lines.append(f"{r.name:24} {r.items:>6} {r.docs:>6} {r.errors:>4} {r.concurrency:>5} {r.wall_seconds:>8} "
+                     f"{r.docs_per_second:>8} {r.latency_p50:>8} {r.latency_p95:>8} {r.latency_p99:>8} "
+                     f"{r.peak_rss_mb:>8} {r.rss_growth_mb:>6}")
+    return "\n".join(lines)
+
+
+def write_results(results: List[ScenarioResult], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([r.model_dump() for r in results], f, indent=2)
@@ -1,11 +1,8 @@
 import azure.functions as func
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
 import json
-from uuid import uuid4
-import fitz
 import os
-import helpers.llm
 
 bp = func.Blueprint()  # Create a blueprint
 
@@ -45,7 +42,7 @@ def queue_blob_trigger(myblob: func.InputStream, outputQueueItem: func.Out[str])
         queue_item = {
             "state": state,
             "url": line.strip(),
-            "created_at": datetime.utcnow().isoformat(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
             "depth": 0  # Initial depth level
         }
         outputQueueItem.set(json.dumps(queue_item))
@@ -57,10 +54,17 @@ def queue_blob_trigger(myblob: func.InputStream, outputQueueItem: func.Out[str])
 
 @bp.function_name(name="Blob_LLM_Trigger")
 @bp.blob_trigger(arg_name="myblob", path="states/{state}/{name}", connection="STORAGE_CONNECTION")
-@bp.queue_output(arg_name="outputQueueItem", queue_name=QUEUE_NAME, connection="STORAGE_CONNECTION")
 @bp.cosmos_db_output(arg_name="documents", database_name="dfas", container_name="items", connection="COSMOS_DB_CONNECTION", create_if_not_exists=False)
-def blob_llm_trigger(myblob: func.InputStream, outputQueueItem: func.Out[str], documents: func.Out[func.Document]):
-    content = ""
+def blob_llm_trigger(myblob: func.InputStream, documents: func.Out[func.DocumentList]):
+    # Imported on first invocation rather than at host start: openai and PyMuPDF dominate the cold start
+    import helpers.llm
+    import helpers.pdf_extract
+    import helpers.persistence
+    import helpers.prefilter
+    import helpers.queue_fanout
+    import helpers.text_stream
+
+    pages = []
     # Extract state and name from the blob path inside the function
     state = myblob.name.split('/')[1]
     name = myblob.name.split('/')[2]  # Assuming the blob name comes after the state
@@ -69,31 +73,44 @@ def blob_llm_trigger(myblob: func.InputStream, outputQueueItem: func.Out[str], d
     # Log the info
     logging.info(f"Blob trigger processed blob\nState: {state}\nName: {name}\nBlob Size: {myblob.length} bytes")
 
+    if extension == '.urls':
+        # URL list: one URL per line, streamed and fanned out to the queue in batched messages
+        sent = helpers.queue_fanout.send_items(
+            helpers.queue_fanout.make_queue_item(state, url) for url in helpers.queue_fanout.iter_url_lines(myblob)
+        )
+        logging.info(f"Processed URL list '{name}' into {sent} queue message(s) for state '{state}'.")
+        return
+
     if extension in ['.txt', '.md']:
-        # Read blob content only for text or markdown files
-        content = myblob.read().decode('utf-8')
+        # Text is decoded as it is read and handed on in paragraph-bounded segments, so a large dump is never held
+        # as one string and extraction starts on the first segment. The binding still delivers the raw blob in
+        # memory, so the host's memory limit caps the blob size (see helpers.text_stream.iter_text_segments).
+        pages = helpers.text_stream.iter_text_segments(myblob, **helpers.text_stream.segment_settings_from_env())
     elif extension == '.pdf':
-        # Handle PDF files using PyMuPDF (Fitz)
-        with fitz.open(stream=myblob.read(), filetype="pdf") as pdf_document:
-            for page_number in range(pdf_document.page_count):
-                page = pdf_document.load_page(page_number)
-                content += page.get_text()
-
-    response, json_response, pydantic_response = helpers.llm.call_llm_api(content, state)
-
-    cosmos_dict = {
-        "id": str(uuid4()),
-        "state": state,
-        "url": f"blob: {myblob.name}",
-        "created_at": datetime.utcnow().isoformat(),
-        "depth": "",
-        "llm_response": json_response,
-        "scraped_urls": ""
-    }
+        # Handle PDF files using PyMuPDF (Fitz). Pages are streamed so chunking starts before the whole PDF is decoded
+        pages = helpers.pdf_extract.iter_pdf_pages(myblob, **helpers.pdf_extract.page_selection_from_env())
+
+    # Large documents are split into token-bounded chunks, extracted in parallel and merged.
+    # The content is hashed on the way through so the document id is stable across replays.
+    # Pages are screened locally on the way to the LLM: only relevant paragraphs are sent, and nothing is
+    # sent for documents with no tax content. If any chunk fails the whole call raises, failing the invocation so
+    # the blob is retried rather than stored with part of its changes.
+    hasher = helpers.persistence.ContentHasher()
+    screen = helpers.prefilter.PageScreen(state, source="blob")
+    responses, json_response, pydantic_response, chunk_reports = helpers.llm.call_llm_api_chunked(
+        screen.filter(hasher.wrap(pages)), state)
+    if not screen.result.relevant:
+        logging.info(f"Prefilter skipped blob '{name}' for state '{state}': {screen.result.reason}")
+        return
+    logging.info(f"Prefilter kept {screen.result.kept_chars} of {screen.result.original_chars} characters of '{name}'")
+    logging.info(f"Extracted {len(pydantic_response.changes)} changes from {len(chunk_reports)} chunk(s) of '{name}'")
+
+    cosmos_docs = helpers.persistence.build_documents(state, f"blob: {myblob.name}", json_response, hasher.hexdigest())
             
-    # Prepare the document for Cosmos DB
-    logging.info(f"Document being sent to Cosmos DB: {json.dumps(cosmos_dict, indent=2)}")
-    documents.set(func.Document.from_dict(cosmos_dict))
+    # Prepare the documents for Cosmos DB; deterministic ids make the write an upsert
+    logging.info(f"Documents being sent to Cosmos DB: {json.dumps(cosmos_docs, indent=2)}")
+    with helpers.persistence.create_writer(documents) as writer:
+        writer.add(cosmos_docs)
 
     
     logging.info(f"Completed processing blob '{name}' for state '{state}' and added to Cosmos DB.")
@@ -119,7 +136,7 @@ def queue_blob_trigger(myblob: func.InputStream):
         queue_item = {
             "state": state,
             "url": line.strip(),  # Ensure no extra spaces
-            "created_at": datetime.utcnow().isoformat()
+            "created_at": datetime.now(timezone.utc).isoformat()
         }
     
         queue_message = json.dumps(queue_item) # Convert payload to JSON string
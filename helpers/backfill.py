@@ -0,0 +1,436 @@
+"""
+Bulk extraction over a manifest of URLs and local files, with a SQLite checkpoint so interrupted runs resume.
+
+Examples:
+    python -m helpers.backfill manifest.csv --output results.jsonl --workers 8
+    python -m helpers.backfill manifest.json --output results.jsonl --store
+    python -m helpers.backfill manifest.csv --output results.jsonl --export-only
+
+Parquet output (an --output ending in .parquet, or --format parquet) needs pyarrow, an optional dependency
+that is not in requirements.txt so the function app does not ship it: pip install pyarrow.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from pydantic import BaseModel, Field
+
+import helpers.fetcher
+import helpers.llm
+import helpers.pdf_extract
+import helpers.persistence
+import helpers.prefilter
+import helpers.text_stream
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", "4"))  # Documents processed at once
+BACKFILL_MAX_ATTEMPTS = int(os.getenv("BACKFILL_MAX_ATTEMPTS", "3"))  # Failed documents are retried on resume until this
+BACKFILL_STORE_BATCH = int(os.getenv("BACKFILL_STORE_BATCH", "100"))  # Documents per Cosmos DB flush with --store
+
+FILE_EXTENSIONS = (".pdf", ".txt", ".md")
+PARQUET_BATCH_ROWS = 10000
+
+
+class ManifestItem(BaseModel):
+    """
+    One document to extract: a URL or a local file, for a state.
+    """
+    state: str
+    source: str
+    kind: str  # "url" or "file"
+
+    @property
+    def key(self) -> str:
+        return hashlib.sha1(f"{self.state}|{self.source}".encode("utf-8")).hexdigest()
+
+
+class ExtractionRecord(BaseModel):
+    """
+    The outcome of one manifest item, as checkpointed and written to the output.
+    """
+    state: str
+    source: str
+    kind: str
+    status: str  # "done", "skipped" (prefilter) or "failed"
+    content_hash: Optional[str] = None
+    changes: List[dict] = Field(default_factory=list)
+    chunks: int = 0
+    original_chars: int = 0
+    kept_chars: int = 0
+    elapsed: float = 0.0
+    error: Optional[str] = None
+    completed_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+
+
+def _manifest_item(state: str, source: str, base_dir: str) -> Iterator[ManifestItem]:
+    state, source = state.strip().upper(), source.strip()
+    if not state or not source:
+        return
+    if source.lower().startswith(("http://", "https://")):
+        yield ManifestItem(state=state, source=source, kind="url")
+        return
+    path = source if os.path.isabs(source) else os.path.normpath(os.path.join(base_dir, source))
+    if os.path.isdir(path):
+        # A directory stands for every supported file below it, in a stable order
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(FILE_EXTENSIONS):
+                    yield ManifestItem(state=state, source=os.path.join(root, name), kind="file")
+    elif path.lower().endswith(FILE_EXTENSIONS):
+        yield ManifestItem(state=state, source=path, kind="file")
+    else:
+        logger.warning(f"Skipping unsupported manifest entry for {state}: {source}")
+
+
+def read_manifest(path: str) -> Iterator[ManifestItem]:
+    """
+    Reads a manifest of URLs and local files per state. Supported layouts:
+        - .json: {"PA": ["https://...", "docs/pa/"], "NY": [...]}
+        - .jsonl: one {"state": "PA", "source": "https://..."} (or "url"/"path") per line
+        - anything else (.csv, .tsv, .txt): "state,source" lines; a header row and # comments are skipped
+    Relative file paths are resolved against the manifest's directory, and a directory stands for every .pdf,
+    .txt and .md file below it.
+    """
+    base_dir = os.path.dirname(os.path.abspath(path))
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, "r", encoding="utf-8") as f:
+        if extension == ".json":
+            for state, sources in json.load(f).items():
+                for source in ([sources] if isinstance(sources, str) else sources):
+                    yield from _manifest_item(state, source, base_dir)
+        elif extension == ".jsonl":
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    yield from _manifest_item(entry["state"], entry.get("source") or entry.get("url") or entry.get("path") or "", base_dir)
+        else:
+            for row in csv.reader((line for line in f if line.strip() and not line.lstrip().startswith("#")),
+                                  delimiter="\t" if extension == ".tsv" else ","):
+                if len(row) < 2 or (row[0].strip().lower() == "state" and row[1].strip().lower() in ("source", "url", "path")):
+                    continue
+                yield from _manifest_item(row[0], row[1], base_dir)
+
+
+class Checkpoint:
+    """
+    SQLite record of every finished item and its result. Only used from the thread that owns it.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                key TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                source TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                exported INTEGER NOT NULL DEFAULT 0,
+                stored INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT NOT NULL
+            )""")
+        self.connection.commit()
+
+    def finished_keys(self, max_attempts: int) -> set:
+        """
+        Keys that need no more work: done, skipped, or failed max_attempts times.
+        """
+        rows = self.connection.execute(
+            "SELECT key FROM items WHERE status IN ('done', 'skipped') OR attempts >= ?", (max_attempts,))
+        return {row[0] for row in rows}
+
+    def record(self, item: ManifestItem, record: ExtractionRecord) -> None:
+        self.connection.execute("""
+            INSERT INTO items (key, state, source, status, attempts, result, error, exported, stored, updated_at)
+            VALUES (?, ?, ?, ?, 1, ?, ?, 0, 0, ?)
+            ON CONFLICT(key) DO UPDATE SET status = excluded.status, attempts = items.attempts + 1,
+                result = excluded.result, error = excluded.error, exported = 0, stored = 0,
+                updated_at = excluded.updated_at""",
+            (item.key, item.state, item.source, record.status, record.model_dump_json(), record.error,
+             record.completed_at))
+        self.connection.commit()
+
+    def mark(self, column: str, keys: Iterable[str]) -> None:
+        assert column in ("exported", "stored")
+        self.connection.executemany(f"UPDATE items SET {column} = 1 WHERE key = ?", [(key,) for key in keys])
+        self.connection.commit()
+
+    def iter_records(self, where: str = "status IN ('done', 'skipped')") -> Iterator[tuple]:
+        """
+        Yields (key, ExtractionRecord) for the matching rows, in insertion order.
+        """
+        for key, result in self.connection.execute(f"SELECT key, result FROM items WHERE {where} ORDER BY rowid"):
+            yield key, ExtractionRecord.model_validate_json(result)
+
+    def summary(self) -> Dict[str, int]:
+        return dict(self.connection.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall())
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def _item_pages(item: ManifestItem, allow_selenium: bool) -> Iterable[str]:
+    if item.kind == "url":
+        fetched = helpers.fetcher.fetch(item.source, allow_selenium=allow_selenium)
+        if fetched.error:
+            raise RuntimeError(f"Fetch failed: {fetched.error}")
+        return [fetched.text]
+    if item.source.lower().endswith(".pdf"):
+        return helpers.pdf_extract.iter_pdf_pages(item.source, **helpers.pdf_extract.page_selection_from_env())
+
+    def text_segments():
+        with open(item.source, "rb") as f:
+            yield from helpers.text_stream.iter_text_segments(f, **helpers.text_stream.segment_settings_from_env())
+    return text_segments()
+
+
+def process_item(item: ManifestItem, allow_selenium: bool = True) -> ExtractionRecord:
+    """
+    Scrapes or reads one item, screens it with the prefilter and extracts its tax changes. Never raises:
+    errors are returned as a "failed" record.
+    """
+    started = time.perf_counter()
+    record = ExtractionRecord(state=item.state, source=item.source, kind=item.kind, status="failed")
+    try:
+        hasher = helpers.persistence.ContentHasher()
+        screen = helpers.prefilter.PageScreen(item.state, source="backfill")
+        _, json_response, _, reports = helpers.llm.call_llm_api_chunked(
+            screen.filter(hasher.wrap(_item_pages(item, allow_selenium))), item.state)
+        record.content_hash = hasher.hexdigest()
+        record.original_chars, record.kept_chars = screen.result.original_chars, screen.result.kept_chars
+        record.status = "done" if screen.result.relevant else "skipped"
+        record.changes = json_response if screen.result.relevant else []
+        record.chunks = len(reports)
+    except helpers.llm.ChunkedExtractionError as e:
+        # A partial extraction is not checkpointed; the item stays failed and is retried on resume
+        record.chunks = len(e.reports)
+        record.error = str(e)
+    except Exception as e:
+        record.error = str(e)
+    record.elapsed = round(time.perf_counter() - started, 3)
+    return record
+
+
+class JsonLinesOutput:
+    """
+    Appends records to a JSON Lines file, one per line, flushed as they are written.
+    """
+    def __init__(self, path: str, mode: str = "a"):
+        self.file = sys.stdout if path == "-" else open(path, mode, encoding="utf-8")
+
+    def write(self, record: ExtractionRecord) -> None:
+        self.file.write(record.model_dump_json() + "\n")
+        self.file.flush()
+
+    def close(self) -> None:
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+def export_parquet(checkpoint: Checkpoint, path: str) -> int:
+    """
+    Writes every finished record in the checkpoint to a Parquet file (changes as a JSON string column).
+    Returns the number of rows written. Requires pyarrow.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([("state", pa.string()), ("source", pa.string()), ("kind", pa.string()),
+                        ("status", pa.string()), ("content_hash", pa.string()), ("changes", pa.string()),
+                        ("chunks", pa.int32()), ("original_chars", pa.int64()), ("kept_chars", pa.int64()),
+                        ("elapsed", pa.float64()), ("error", pa.string()), ("completed_at", pa.string())])
+    rows, written = [], 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for _, record in checkpoint.iter_records():
+            row = record.model_dump()
+            row["changes"] = json.dumps(row["changes"])
+            rows.append(row)
+            if len(rows) >= PARQUET_BATCH_ROWS:
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+                written, rows = written + len(rows), []
+        if rows:
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            written += len(rows)
+    return written
+
+
+class BackfillRun:
+    """
+    Runs the manifest through a worker pool. Results are checkpointed as soon as each item finishes, then
+    appended to the JSON Lines output and, with a Cosmos DB writer, upserted in batches. The checkpoint marks
+    what was exported and stored, so a crash between the steps is caught up on the next run (at least once;
+    document ids are deterministic, so repeats are upserts).
+    """
+    def __init__(self, checkpoint: Checkpoint, output: Optional[JsonLinesOutput] = None, writer=None,
+                 workers: int = None, max_attempts: int = None, allow_selenium: bool = True):
+        self.checkpoint = checkpoint
+        self.output = output
+        self.writer = writer
+        self.workers = workers or BACKFILL_WORKERS
+        self.max_attempts = max_attempts or BACKFILL_MAX_ATTEMPTS
+        self.allow_selenium = allow_selenium
+        self.counts = {"done": 0, "skipped": 0, "failed": 0, "resumed": 0}
+        self._unstored: List[str] = []
+
+    def _handle(self, key: str, record: ExtractionRecord) -> None:
+        if self.output is not None:
+            self.output.write(record)
+            self.checkpoint.mark("exported", [key])
+        if self.writer is not None and record.status == "done":
+            self.writer.add(helpers.persistence.build_documents(
+                record.state, record.source, record.changes, record.content_hash, created_at=record.completed_at))
+            self._unstored.append(key)
+            if len(self._unstored) >= self.writer.max_batch:
+                self._flush_store()
+
+    def _flush_store(self) -> None:
+        if self.writer is not None and self._unstored:
+            self.writer.flush()
+            self.checkpoint.mark("stored", self._unstored)
+            self._unstored = []
+
+    def catch_up(self) -> None:
+        """
+        Exports and stores results a previous run checkpointed but did not get to write.
+        """
+        if self.output is not None:
+            for key, record in list(self.checkpoint.iter_records("status IN ('done', 'skipped') AND exported = 0")):
+                self.output.write(record)
+                self.checkpoint.mark("exported", [key])
+        if self.writer is not None:
+            for key, record in list(self.checkpoint.iter_records("status = 'done' AND stored = 0")):
+                self.writer.add(helpers.persistence.build_documents(
+                    record.state, record.source, record.changes, record.content_hash, created_at=record.completed_at))
+                self._unstored.append(key)
+            self._flush_store()
+
+    def run(self, items: Iterable[ManifestItem], progress_every: int = 100) -> Dict[str, int]:
+        finished = self.checkpoint.finished_keys(self.max_attempts)
+        self.catch_up()
+        started = time.perf_counter()
+        processed = 0
+
+        def collect(done) -> None:
+            nonlocal processed
+            for future in done:
+                item = pending.pop(future)
+                record = future.result()
+                self.checkpoint.record(item, record)
+                self.counts[record.status] += 1
+                if record.status == "failed":
+                    logger.warning(f"Failed {item.state} {item.source}: {record.error}")
+                else:
+                    self._handle(item.key, record)
+                processed += 1
+                if processed % progress_every == 0:
+                    rate = processed / (time.perf_counter() - started)
+                    print(f"Processed {processed} item(s) ({rate:.2f}/s): {self.counts}", file=sys.stderr)
+
+        pending = {}
+        seen = set()
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            for item in items:
+                if item.key in finished or item.key in seen:
+                    self.counts["resumed"] += item.key in finished
+                    continue
+                seen.add(item.key)
+                pending[executor.submit(process_item, item, self.allow_selenium)] = item
+                # A bounded window of submitted items keeps memory flat for very large manifests
+                if len(pending) >= self.workers * 2:
+                    collect(wait(list(pending), return_when=FIRST_COMPLETED)[0])
+            collect(wait(list(pending))[0])
+        except KeyboardInterrupt:
+            # Keep the LLM work already paid for: let the running items finish and checkpoint them
+            print("Interrupted; finishing the items in progress. Run the same command again to resume.", file=sys.stderr)
+            for future in pending:
+                future.cancel()
+            collect([future for future in wait(list(pending))[0] if not future.cancelled()])
+            raise
+        finally:
+            executor.shutdown(wait=True)
+            self._flush_store()
+        return self.counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract tax changes from a manifest of URLs and files, resumably.")
+    parser.add_argument("manifest", help="Manifest of (state, URL or file) entries: .csv/.tsv/.txt, .json or .jsonl")
+    parser.add_argument("--output", default="backfill.jsonl", help="Results file, .jsonl (default) or .parquet; - for stdout")
+    parser.add_argument("--format", choices=["auto", "jsonl", "parquet"], default="auto",
+                        help="Output format (auto: from the --output extension)")
+    parser.add_argument("--checkpoint", help="SQLite checkpoint file (default: <output>.checkpoint.sqlite)")
+    parser.add_argument("--workers", type=int, default=None, help="Documents processed at once (BACKFILL_WORKERS)")
+    parser.add_argument("--max-attempts", type=int, default=None, help="Attempts per document across runs (BACKFILL_MAX_ATTEMPTS)")
+    parser.add_argument("--states", nargs="+", help="Only process these states")
+    parser.add_argument("--limit", type=int, help="Stop after this many manifest entries")
+    parser.add_argument("--store", action="store_true", help="Also upsert the documents into Cosmos DB (COSMOS_DB_CONNECTION)")
+    parser.add_argument("--no-selenium", action="store_true", help="Never escalate URLs to the browser tier")
+    parser.add_argument("--export-only", action="store_true", help="Only write the checkpointed results to --output")
+    parser.add_argument("--verbose", action="store_true", help="Log every fetch, LLM call and metric")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    output_format = args.format if args.format != "auto" else (
+        "parquet" if args.output.lower().endswith(".parquet") else "jsonl")
+    if output_format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            parser.error("Parquet output needs pyarrow (pip install pyarrow); use a .jsonl --output instead")
+        if args.output == "-":
+            parser.error("Parquet output needs a file path")
+    checkpoint = Checkpoint(args.checkpoint or (
+        "backfill.checkpoint.sqlite" if args.output == "-" else f"{args.output}.checkpoint.sqlite"))
+
+    output = JsonLinesOutput(args.output, mode="w" if args.export_only else "a") if output_format == "jsonl" else None
+    try:
+        if not args.export_only:
+            writer = None
+            if args.store:
+                # Flushed explicitly every BACKFILL_STORE_BATCH documents, so the checkpoint knows what was stored
+                writer = helpers.persistence.DocumentWriter(
+                    helpers.persistence.ContainerSink(helpers.persistence.get_cosmos_container()),
+                    max_batch=BACKFILL_STORE_BATCH, max_interval=float("inf"))
+            items = read_manifest(args.manifest)
+            if args.states:
+                states = {state.upper() for state in args.states}
+                items = (item for item in items if item.state in states)
+            if args.limit:
+                items = (item for _, item in zip(range(args.limit), items))
+            run = BackfillRun(checkpoint, output=output, writer=writer, workers=args.workers,
+                              max_attempts=args.max_attempts, allow_selenium=not args.no_selenium)
+            counts = run.run(items)
+            print(f"This run: {counts['done']} extracted, {counts['skipped']} skipped by the prefilter, "
+                  f"{counts['failed']} failed, {counts['resumed']} already done", file=sys.stderr)
+        elif output is not None:
+            for key, record in checkpoint.iter_records():
+                output.write(record)
+
+        if output_format == "parquet":
+            rows = export_parquet(checkpoint, args.output)
+            print(f"Wrote {rows} row(s) to {args.output}", file=sys.stderr)
+        print(f"Checkpoint {checkpoint.path}: {checkpoint.summary()}", file=sys.stderr)
+    finally:
+        if output is not None:
+            output.close()
+        checkpoint.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import logging
+import os
+import re
+import threading
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_TOKENS = int(os.getenv("LLM_CHUNK_TOKENS", "8000"))
+DEFAULT_OVERLAP_TOKENS = int(os.getenv("LLM_CHUNK_OVERLAP_TOKENS", "200"))
+
+# Lines that look like the start of a new section in statutes, bulletins and markdown
+_HEADING = re.compile(r"^\s*(#{1,6}\s|(?i:section|sec\.|article|chapter|part|title)\s+[\w.-]+|§+\s*\d|[A-Z][A-Z0-9 ,.&'-]{3,}$)")
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?;:])\s+")
+
+_encoder = None
+_encoder_lock = threading.Lock()
+_encoder_loaded = False
+
+
+def _get_encoder():
+    """
+    Returns a tiktoken encoder if tiktoken and its encoding files are available, otherwise None.
+    """
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        with _encoder_lock:
+            if not _encoder_loaded:
+                try:
+                    import tiktoken
+                    _encoder = tiktoken.get_encoding(os.getenv("LLM_TOKEN_ENCODING", "cl100k_base"))
+                except Exception as e:
+                    logger.warning(f"tiktoken unavailable, falling back to estimated token counts: {e}")
+                    _encoder = None
+                _encoder_loaded = True
+    return _encoder
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts tokens with tiktoken when available, otherwise estimates ~4 characters per token.
+    """
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+class Chunk(BaseModel):
+    """
+    A token-bounded slice of a document, with the (1-based) page span it was taken from.
+    """
+    index: int
+    text: str
+    token_count: int
+    start_page: int
+    end_page: int
+
+
+def _split_oversized(text: str, max_tokens: int) -> List[str]:
+    """
+    Splits a single paragraph that is larger than max_tokens, first on sentences and then on words.
+    """
+    pieces, current, current_tokens = [], [], 0
+    for sentence in _SENTENCE_BREAK.split(text):
+        sentence_tokens = count_tokens(sentence)
+        if sentence_tokens > max_tokens:
+            words = sentence.split()
+            step = max(1, len(words) * max_tokens // sentence_tokens)
+            sub_sentences = [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+        else:
+            sub_sentences = [sentence]
+        for sub in sub_sentences:
+            sub_tokens = count_tokens(sub)
+            if current and current_tokens + sub_tokens > max_tokens:
+                pieces.append(" ".join(current))
+                current, current_tokens = [], 0
+            current.append(sub)
+            current_tokens += sub_tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def _iter_units(pages: Iterable[str], max_tokens: int) -> Iterator[Tuple[int, str, int, bool]]:
+    """
+    Yields (page_number, text, token_count, is_heading) paragraph units that each fit in max_tokens.
+    """
+    for page_number, page in enumerate(pages, start=1):
+        if not page:
+            continue
+        for paragraph in _PARAGRAPH_BREAK.split(page):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            is_heading = bool(_HEADING.match(paragraph.splitlines()[0]))
+            tokens = count_tokens(paragraph)
+            if tokens <= max_tokens:
+                yield page_number, paragraph, tokens, is_heading
+            else:
+                for i, piece in enumerate(_split_oversized(paragraph, max_tokens)):
+                    yield page_number, piece, count_tokens(piece), is_heading and i == 0
+
+
+def iter_chunks(pages: Iterable[str], max_tokens: Optional[int] = None,
+                overlap_tokens: Optional[int] = None) -> Iterator[Chunk]:
+    """
+    Splits a document into token-bounded chunks, lazily, as pages arrive.
+
+    Chunks are built from whole paragraphs. A chunk that is at least half full is closed early when a new
+    section heading starts, and each chunk repeats up to overlap_tokens of trailing paragraphs from the
+    previous one so matches that straddle a boundary are still seen in context.
+
+    Parameters:
+        pages: Iterable of page texts (a plain document can be passed as a one-element list).
+        max_tokens (int): Token budget per chunk (LLM_CHUNK_TOKENS, default 8000).
+        overlap_tokens (int): Tokens of trailing context to repeat (LLM_CHUNK_OVERLAP_TOKENS, default 200).
+    """
+    max_tokens = max_tokens or DEFAULT_CHUNK_TOKENS
+    overlap_tokens = DEFAULT_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+
+    index = 0
+    units: List[Tuple[int, str, int]] = []
+    total = 0
+
+    def emit() -> Chunk:
+        return Chunk(index=index, text="\n\n".join(unit[1] for unit in units), token_count=total,
+                     start_page=units[0][0], end_page=units[-1][0])
+
+    for page_number, text, tokens, is_heading in _iter_units(pages, max_tokens):
+        section_break = is_heading and total >= max_tokens // 2
+        if units and (total + tokens > max_tokens or section_break):
+            yield emit()
+            index += 1
+            # Carry over trailing paragraphs as overlap, unless the new unit starts a section
+            carried, carried_tokens = [], 0
+            if not section_break:
+                for unit in reversed(units):
+                    if carried_tokens + unit[2] > overlap_tokens or carried_tokens + unit[2] + tokens > max_tokens:
+                        break
+                    carried.insert(0, unit)
+                    carried_tokens += unit[2]
+            units, total = carried, carried_tokens
+        units.append((page_number, text, tokens))
+        total += tokens
+
+    if units:
+        yield emit()
+
+
+def chunk_text(text: str, max_tokens: Optional[int] = None, overlap_tokens: Optional[int] = None) -> List[Chunk]:
+    """
+    Convenience wrapper around iter_chunks for a single string.
+    """
+    return list(iter_chunks([text], max_tokens=max_tokens, overlap_tokens=overlap_tokens))
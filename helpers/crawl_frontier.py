@@ -0,0 +1,267 @@
+import json
+import logging
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+from pydantic import BaseModel, Field
+
+import helpers.redis_handler as rh
+
+logger = logging.getLogger(__name__)
+
+FRONTIER_TTL_SECONDS = int(os.getenv("FRONTIER_TTL_SECONDS", str(7 * 86400)))
+
+_TRACKING_PARAMS = {"gclid", "fbclid", "msclkid", "dclid", "yclid", "mc_cid", "mc_eid", "_ga", "_gl", "ref",
+                    "jsessionid", "phpsessid", "sessionid", "sid", "cfid", "cftoken"}
+_TRACKING_PREFIXES = ("utm_", "hsa_", "pk_", "mtm_")
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+_SKIP_EXTENSIONS = re.compile(r"\.(jpe?g|png|gif|svg|ico|webp|css|js|zip|gz|mp[34]|mov|avi|woff2?|ttf|exe|dmg)$", re.IGNORECASE)
+
+# Path/anchor keywords that suggest tax content, and ones that suggest navigation boilerplate
+_POSITIVE_KEYWORDS = {"tax": 3, "withholding": 4, "payroll": 4, "employer": 3, "unemployment": 3, "wage": 2,
+                      "bulletin": 3, "notice": 2, "legislation": 3, "law": 2, "statute": 3, "regulation": 2,
+                      "revenue": 2, "credit": 2, "pension": 2, "retirement": 2, "benefit": 1, "garnishment": 3,
+                      "levy": 2, "rate": 1, "change": 2, "update": 1, "new": 1, "pdf": 1}
+_NEGATIVE_KEYWORDS = {"contact": -3, "login": -4, "signin": -4, "career": -3, "job": -2, "privacy": -3,
+                      "accessibility": -3, "sitemap": -2, "search": -2, "calendar": -2, "event": -2, "media": -1,
+                      "facebook": -5, "twitter": -5, "linkedin": -5, "youtube": -5, "instagram": -5}
+_KEYWORDS = {**_POSITIVE_KEYWORDS, **_NEGATIVE_KEYWORDS}
+_WORDS = re.compile(r"[a-z]+")
+
+
+def canonicalize_url(url: str, base: Optional[str] = None) -> Optional[str]:
+    """
+    Returns a canonical form of a URL for de-duplication, or None if it is not a crawlable http(s) URL.
+
+    Resolves relative URLs, lower-cases scheme and host, drops default ports, fragments, tracking and session
+    parameters, sorts the remaining query parameters and removes trailing slashes and duplicate slashes.
+    """
+    if not url:
+        return None
+    url = urljoin(base, url.strip()) if base else url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS or not parts.hostname:
+        return None
+
+    host = parts.hostname.lower().rstrip(".")
+    netloc = host if port in (None, _DEFAULT_PORTS[scheme]) else f"{host}:{port}"
+    path = re.sub(r"/{2,}", "/", parts.path or "/")
+    if len(path) > 1:
+        path = path.rstrip("/")
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in _TRACKING_PARAMS and not key.lower().startswith(_TRACKING_PREFIXES)
+    ))
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def score_url(url: str) -> int:
+    """
+    Relevance score for crawl ordering, from tax-related keywords in the URL path and query.
+    """
+    parts = urlsplit(url)
+    words = _WORDS.findall(f"{parts.path} {parts.query}".lower())
+    score = 0
+    for word in words:
+        # Whole words only (so "tax" does not match "taxonomy" nor "law" "lawn"), allowing a plural "s"/"es"
+        for form in (word, word.removesuffix("s"), word.removesuffix("es")):
+            if form in _KEYWORDS:
+                score += _KEYWORDS[form]
+                break
+    return score
+
+
+class FrontierConfig(BaseModel):
+    """
+    Crawl limits for one state. Defaults can be overridden per state through CRAWL_FRONTIER_CONFIG, a JSON
+    object keyed by state (or "default"), e.g. {"default": {"max_depth": 1}, "PA": {"domain_budget": 500}}.
+    """
+    max_depth: int = 1
+    domain_budget: int = 200  # Pages per (state, domain) within FRONTIER_TTL_SECONDS
+    max_links_per_page: int = 50
+    same_domain_only: bool = True
+    allowed_domains: List[str] = Field(default_factory=list)  # Extra domains allowed besides the source's
+    include_patterns: List[str] = Field(default_factory=list)  # If set, a URL must match one of them
+    exclude_patterns: List[str] = Field(default_factory=list)
+    min_score: int = 0
+
+
+def load_config(state: str) -> FrontierConfig:
+    try:
+        overrides = json.loads(os.getenv("CRAWL_FRONTIER_CONFIG", "{}"))
+    except ValueError as e:
+        logger.error(f"Invalid CRAWL_FRONTIER_CONFIG, using defaults: {e}")
+        overrides = {}
+    settings = dict(overrides.get("default", {}))
+    settings.update(overrides.get(state.upper(), {}))
+    return FrontierConfig(**settings)
+
+
+# In-process fallback used when Redis is unavailable, so a Redis outage does not flood the queue
+_local_seen: Dict[str, set] = {}
+_local_lock = threading.Lock()
+
+
+class Frontier:
+    """
+    Decides which links found on a page become new crawl work for a state.
+
+    URLs are canonicalized, filtered by depth, domain and include/exclude patterns, checked against a per-state
+    Redis set of URLs already seen, capped by per-domain page budgets, and returned most relevant first.
+    """
+    def __init__(self, state: str, config: Optional[FrontierConfig] = None):
+        self.state = state.upper()
+        self.config = config or load_config(self.state)
+        self._include = [re.compile(pattern) for pattern in self.config.include_patterns]
+        self._exclude = [re.compile(pattern) for pattern in self.config.exclude_patterns]
+
+    @property
+    def seen_key(self) -> str:
+        return f"frontier:seen:{self.state}"
+
+    def _budget_key(self, domain: str) -> str:
+        return f"frontier:budget:{self.state}:{domain}"
+
+    def _allowed(self, url: str, source_domain: str) -> bool:
+        domain = urlsplit(url).hostname or ""
+        if self.config.same_domain_only and domain != source_domain and not any(
+                domain == allowed or domain.endswith("." + allowed) for allowed in self.config.allowed_domains):
+            return False
+        if _SKIP_EXTENSIONS.search(urlsplit(url).path):
+            return False
+        if self._include and not any(pattern.search(url) for pattern in self._include):
+            return False
+        return not any(pattern.search(url) for pattern in self._exclude)
+
+    def mark_seen(self, urls: Iterable[str]) -> List[bool]:
+        """
+        Adds URLs to the state's seen set. Returns, per URL, whether it was new.
+        """
+        urls = list(urls)
+        if not urls:
+            return []
+        try:
+            pipe = rh.get_client().pipeline(transaction=False)
+            for url in urls:
+                pipe.sadd(self.seen_key, url)
+            pipe.expire(self.seen_key, FRONTIER_TTL_SECONDS)
+            return [bool(added) for added in pipe.execute()[:-1]]
+        except rh.redis.RedisError as error:
+            logger.warning(f"Frontier falling back to in-process seen set: {error}")
+            with _local_lock:
+                seen = _local_seen.setdefault(self.seen_key, set())
+                new = [url not in seen for url in urls]
+                seen.update(urls)
+            return new
+
+    def unseen(self, urls: List[str]) -> List[str]:
+        """
+        Returns the URLs that are not in the state's seen set yet, without adding them.
+        """
+        if not urls:
+            return []
+        try:
+            flags = rh.get_client().smismember(self.seen_key, urls)
+        except rh.redis.RedisError as error:
+            logger.warning(f"Frontier falling back to in-process seen set: {error}")
+            with _local_lock:
+                seen = _local_seen.get(self.seen_key, set())
+                flags = [url in seen for url in urls]
+        return [url for url, is_member in zip(urls, flags) if not is_member]
+
+    def release(self, urls: Iterable[str]) -> None:
+        """
+        Undoes filter_links for URLs that could not be enqueued: removes them from the seen set and gives back
+        their domain budget, so the next crawl of the source page finds them again.
+        """
+        urls = list(urls)
+        if not urls:
+            return
+        try:
+            rh.get_client().srem(self.seen_key, *urls)
+        except rh.redis.RedisError as error:
+            logger.warning(f"Frontier could not release {len(urls)} URL(s) in Redis: {error}")
+        with _local_lock:
+            _local_seen.get(self.seen_key, set()).difference_update(urls)
+        self._return_budget(urls)
+
+    def _take_budget(self, urls: List[str]) -> List[str]:
+        """
+        Counts URLs against their domain's page budget and returns the ones that fit. The ones that do not fit
+        are not counted.
+        """
+        if not urls:
+            return []
+        try:
+            pipe = rh.get_client().pipeline(transaction=False)
+            for url in urls:
+                key = self._budget_key(urlsplit(url).hostname)
+                pipe.incr(key)
+                pipe.expire(key, FRONTIER_TTL_SECONDS)
+            counts = pipe.execute()[0::2]
+        except rh.redis.RedisError as error:
+            logger.warning(f"Frontier could not check domain budgets, applying per-page cap only: {error}")
+            return urls
+        self._return_budget([url for url, count in zip(urls, counts) if count > self.config.domain_budget])
+        return [url for url, count in zip(urls, counts) if count <= self.config.domain_budget]
+
+    def _return_budget(self, urls: List[str]) -> None:
+        if not urls:
+            return
+        try:
+            pipe = rh.get_client().pipeline(transaction=False)
+            for url in urls:
+                pipe.decr(self._budget_key(urlsplit(url).hostname))
+            pipe.execute()
+        except rh.redis.RedisError as error:
+            logger.warning(f"Frontier could not return the domain budget of {len(urls)} URL(s): {error}")
+
+    def filter_links(self, links: Iterable[str], source_url: str, depth: int) -> List[str]:
+        """
+        Returns the canonical URLs from `links` that should be crawled at depth + 1, most relevant first.
+
+        The returned URLs are claimed (marked seen and counted against their domain budget) so concurrent
+        workers do not enqueue them twice; call release() with them if enqueueing fails.
+
+        Parameters:
+            links: Raw hrefs found on the page (relative or absolute).
+            source_url (str): The page the links were found on.
+            depth (int): Depth of the source page.
+        """
+        if depth + 1 > self.config.max_depth:
+            return []
+
+        source = canonicalize_url(source_url)
+        source_domain = urlsplit(source).hostname if source else ""
+        candidates, unique = [], set()
+        for link in links:
+            url = canonicalize_url(link, base=source_url)
+            if url and url != source and url not in unique and self._allowed(url, source_domain):
+                unique.add(url)
+                candidates.append(url)
+
+        scored = sorted(((score_url(url), url) for url in candidates), key=lambda item: -item[0])
+        ranked = [url for score, url in scored if score >= self.config.min_score]
+
+        # Only the links we are about to enqueue are marked seen, so links cut off by the per-page cap or the
+        # domain budget can be found again later. mark_seen is atomic per URL, which also drops links another
+        # worker claimed since unseen() ran; their budget is given back.
+        fresh = self.unseen(ranked)[:self.config.max_links_per_page]
+        within_budget = self._take_budget(fresh)
+        new_flags = self.mark_seen(([source] if source else []) + within_budget)
+        if source:
+            new_flags = new_flags[1:]
+        accepted = [url for url, is_new in zip(within_budget, new_flags) if is_new]
+        self._return_budget([url for url, is_new in zip(within_budget, new_flags) if not is_new])
+
+        logger.info(f"Frontier [{self.state}] {source_url}: {len(candidates)} candidate links, "
+                    f"{len(fresh)} new, {len(accepted)} accepted at depth {depth + 1}")
+        return accepted
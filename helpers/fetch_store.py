@@ -0,0 +1,118 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+from pydantic import BaseModel
+
+import helpers.redis_handler as rh
+from helpers import metrics
+from helpers.llm_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+FETCH_META_PREFIX = "fetchmeta:"
+FETCH_META_TTL_SECONDS = int(os.getenv("FETCH_META_TTL_SECONDS", str(30 * 86400)))
+
+
+class FetchMetadata(BaseModel):
+    """
+    What we last saw for a URL: HTTP validators and a fingerprint of its normalized text.
+    """
+    url: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+    fetched_at: Optional[str] = None
+
+
+# Worker-wide counters for conditional fetching
+_stats = {"not_modified": 0, "fingerprint_unchanged": 0, "changed": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def get_stats() -> dict:
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _key(url: str) -> str:
+    return FETCH_META_PREFIX + hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+def content_fingerprint(text: str) -> str:
+    """
+    sha256 of the normalized page text, so whitespace-only changes do not count as new content.
+    """
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def get_metadata(url: str) -> Optional[FetchMetadata]:
+    """
+    Returns the stored fetch metadata for a URL, or None if the URL has not been processed before.
+    """
+    stored = rh.get_data(_key(url))
+    if not stored:
+        return None
+    try:
+        return FetchMetadata(**json.loads(stored))
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Ignoring unreadable fetch metadata for {url}: {e}")
+        return None
+
+
+def conditional_headers(metadata: Optional[FetchMetadata]) -> dict:
+    """
+    If-None-Match / If-Modified-Since headers for re-fetching a URL we have seen before.
+    """
+    headers = {}
+    if metadata is not None:
+        if metadata.etag:
+            headers["If-None-Match"] = metadata.etag
+        if metadata.last_modified:
+            headers["If-Modified-Since"] = metadata.last_modified
+    return headers
+
+
+def is_unchanged(metadata: Optional[FetchMetadata], fetched) -> bool:
+    """
+    True when a fetch returned 304 or the same content fingerprint as last time. Records the outcome in the
+    worker counters and the fetch_unchanged metric.
+    """
+    if metadata is not None:
+        reason = None
+        if fetched.not_modified:
+            reason = "not_modified"
+        elif fetched.text and metadata.content_hash == content_fingerprint(fetched.text):
+            reason = "fingerprint_unchanged"
+        if reason:
+            _count(reason)
+            metrics.increment("fetch_unchanged", reason=reason)
+            return True
+    _count("changed")
+    return False
+
+
+def save_metadata(fetched) -> None:
+    """
+    Stores the validators and content fingerprint of a processed fetch. Call this only after the content has
+    been fully processed, so a failed run is retried rather than skipped as unchanged.
+    """
+    if not fetched.text:
+        return
+    metadata = FetchMetadata(
+        url=fetched.url,
+        etag=fetched.etag,
+        last_modified=fetched.last_modified,
+        content_hash=content_fingerprint(fetched.text),
+        fetched_at=datetime.now(timezone.utc).isoformat(),
+    )
+    rh.store_data(_key(fetched.url), metadata.model_dump(), ex=FETCH_META_TTL_SECONDS)
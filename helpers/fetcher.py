@@ -0,0 +1,280 @@
+import logging
+import os
+import re
+import threading
+import time
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+import requests
+from pydantic import BaseModel, Field
+from requests.adapters import HTTPAdapter
+
+from helpers import metrics, resilience
+
+logger = logging.getLogger(__name__)
+
+FETCH_CONNECT_TIMEOUT = float(os.getenv("FETCH_CONNECT_TIMEOUT", "5"))
+FETCH_READ_TIMEOUT = float(os.getenv("FETCH_READ_TIMEOUT", "20"))
+FETCH_MIN_TEXT_CHARS = int(os.getenv("FETCH_MIN_TEXT_CHARS", "200"))
+# Hosts known to render their content with JavaScript, comma separated (e.g. "tax.example.gov,apps.example.gov")
+FETCH_JS_HOSTS = {host.strip().lower() for host in os.getenv("FETCH_JS_HOSTS", "").split(",") if host.strip()}
+# Attempts per URL for connection errors, timeouts and 429/502/503/504, and the longest Retry-After honoured
+FETCH_MAX_ATTEMPTS = int(os.getenv("FETCH_MAX_ATTEMPTS", "3"))
+FETCH_RETRY_MAX_WAIT = float(os.getenv("FETCH_RETRY_MAX_WAIT", "10"))
+USER_AGENT = os.getenv("FETCH_USER_AGENT", "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                                           "Chrome/124.0 Safari/537.36 dfas-funcs")
+
+try:
+    import lxml.html as lxml_html
+except ImportError:  # Fall back to the (slower) standard library parser
+    lxml_html = None
+
+try:
+    import brotli  # noqa: F401  (urllib3 decodes "br" only when a brotli package is installed)
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+_RETRY_STATUSES = {429, 502, 503, 504}
+_SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "head"}
+_BLOCK_TAGS = {"p", "div", "br", "li", "ul", "ol", "tr", "table", "section", "article", "header", "footer",
+               "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "dd", "dt", "nav", "main", "aside", "form"}
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+_SPACES = re.compile(r"[ \t\r\f\v]+")
+_JS_SHELL = re.compile(r"""<div[^>]+id=["'](root|app|__next|__nuxt)["'][^>]*>\s*</div>|ng-app|data-reactroot""", re.IGNORECASE)
+_NOSCRIPT_JS = re.compile(r"<noscript[^>]*>[^<]*(enable|requires?|turn on)\s+javascript", re.IGNORECASE)
+
+
+class FetchResult(BaseModel):
+    """
+    The outcome of fetching one URL, including which tier served it and why it escalated, if it did.
+    """
+    url: str
+    final_url: Optional[str] = None
+    tier: str = "http"  # "http" or "selenium"
+    status_code: Optional[int] = None
+    content_type: Optional[str] = None
+    text: str = ""
+    links: List[str] = Field(default_factory=list)
+    escalation_reason: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    not_modified: bool = False  # True when a conditional request came back 304
+    elapsed: float = 0.0
+    error: Optional[str] = None
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the worker-wide HTTP session with a keep-alive connection pool (FETCH_POOL_SIZE connections per host).
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                pool_size = int(os.getenv("FETCH_POOL_SIZE", "20"))
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({"User-Agent": USER_AGENT, "Accept-Encoding": ACCEPT_ENCODING,
+                                        "Accept": "text/html,application/xhtml+xml,application/pdf;q=0.9,*/*;q=0.8"})
+                _session = session
+    return _session
+
+
+class _TextAndLinks(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts, self.links, self._skip = [], [], 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(href)
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS and self._skip:
+            self._skip -= 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def _clean_text(text: str) -> str:
+    text = _SPACES.sub(" ", text)
+    return _BLANK_LINES.sub("\n\n", "\n".join(line.strip() for line in text.split("\n"))).strip()
+
+
+def _absolute_links(base_url: str, hrefs: List[str]) -> List[str]:
+    links = []
+    for href in hrefs:
+        href = href.strip()
+        if not href or href.startswith(("javascript:", "mailto:", "tel:", "#")):
+            continue
+        links.append(urljoin(base_url, href))
+    return links
+
+
+def html_to_text_and_links(html: str, base_url: str) -> Tuple[str, List[str]]:
+    """
+    Extracts the visible text and the absolute <a href> links of an HTML document.
+    Uses lxml when installed and the standard library parser otherwise.
+    """
+    if lxml_html is not None:
+        try:
+            root = lxml_html.document_fromstring(html)
+            hrefs = root.xpath("//a/@href")
+            for element in list(root.iter(*_SKIP_TAGS)):
+                element.drop_tree()
+            for element in root.iter(*_BLOCK_TAGS):
+                element.tail = "\n" + (element.tail or "")
+            return _clean_text(root.text_content()), _absolute_links(base_url, hrefs)
+        except Exception as e:  # lxml rejects some malformed documents the lenient parser copes with
+            logger.debug(f"lxml could not parse {base_url}: {e}")
+
+    parser = _TextAndLinks()
+    parser.feed(html)
+    parser.close()
+    return _clean_text("".join(parser.parts)), _absolute_links(base_url, parser.links)
+
+
+def needs_javascript(url: str, html: str, text: str) -> Optional[str]:
+    """
+    Returns why a page fetched over plain HTTP should be re-rendered in a browser, or None if it looks complete.
+    """
+    if urlparse(url).netloc.lower() in FETCH_JS_HOSTS:
+        return "known_js_host"
+    if len(text) < FETCH_MIN_TEXT_CHARS:
+        if _NOSCRIPT_JS.search(html):
+            return "noscript_shell"
+        if _JS_SHELL.search(html):
+            return "js_app_shell"
+        return "empty_body"
+    return None
+
+
+def _get_with_retry(url: str, headers: Optional[dict]) -> requests.Response:
+    """
+    GETs a URL, retrying connection errors, timeouts and 429/502/503/504 responses with jittered backoff or the
+    site's Retry-After, behind a circuit breaker per host. After the last attempt a retryable status is returned
+    like any other response, so the caller can still escalate.
+    """
+    def attempt():
+        response = get_session().get(url, headers=headers, timeout=(FETCH_CONNECT_TIMEOUT, FETCH_READ_TIMEOUT))
+        if response.status_code in _RETRY_STATUSES:
+            raise resilience.RetryableResponse(response, resilience.retry_after_seconds(response.headers))
+        return response
+
+    try:
+        return resilience.call_with_retry(
+            attempt, f"http:{urlparse(url).netloc.lower()}",
+            retry_on=(requests.exceptions.ConnectionError, requests.exceptions.Timeout, resilience.RetryableResponse),
+            max_attempts=FETCH_MAX_ATTEMPTS, max_delay=FETCH_RETRY_MAX_WAIT, max_retry_after=FETCH_RETRY_MAX_WAIT,
+            # Throttling means the host is up; only errors and 5xx count towards opening its circuit
+            is_failure=lambda e: not (isinstance(e, resilience.RetryableResponse) and e.response.status_code == 429))
+    except resilience.RetryableResponse as e:
+        return e.response
+
+
+def fetch_http(url: str, headers: Optional[dict] = None) -> Tuple[FetchResult, Optional[str]]:
+    """
+    Fetches a URL over the pooled HTTP session. Returns the result and the raw HTML (None for non-HTML responses).
+    """
+    started = time.perf_counter()
+    result = FetchResult(url=url, tier="http")
+    response = _get_with_retry(url, headers)
+    result.final_url = response.url
+    result.status_code = response.status_code
+    result.content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    result.etag = response.headers.get("ETag")
+    result.last_modified = response.headers.get("Last-Modified")
+    result.not_modified = response.status_code == 304
+
+    html = None
+    if response.status_code == 200:
+        if result.content_type == "application/pdf":
+            from helpers.pdf_extract import extract_pdf_text
+            try:
+                result.text = extract_pdf_text(response.content, separator="\n")
+            except Exception as e:  # Corrupt or encrypted PDFs; re-rendering in a browser would not help
+                result.error = f"PDF extraction failed: {e}"
+        elif result.content_type in ("text/plain", "text/markdown"):
+            result.text = response.text
+        else:
+            html = response.text
+            result.text, result.links = html_to_text_and_links(html, response.url)
+    result.elapsed = round(time.perf_counter() - started, 3)
+    return result, html
+
+
+def fetch(url: str, allow_selenium: bool = True, scraper=None, headers: Optional[dict] = None) -> FetchResult:
+    """
+    Fetches a page through the cheapest tier that can serve it.
+
+    The pooled HTTP session is tried first. The page is re-fetched with Selenium only when the HTTP tier fails
+    or needs_javascript() says the content is rendered client side. FetchResult.tier records which tier served
+    the page and FetchResult.escalation_reason why it escalated.
+
+    Parameters:
+        url (str): The URL to fetch.
+        allow_selenium (bool): Set to False to never escalate to the browser.
+        scraper (WebScraper): Optional scraper to use for the Selenium tier.
+        headers (dict): Extra request headers for the HTTP tier, e.g. conditional headers from helpers.fetch_store.
+    """
+    started = time.perf_counter()
+    reason = None
+    result = FetchResult(url=url)
+    try:
+        result, html = fetch_http(url, headers=headers)
+        if result.status_code in (401, 403, 429) or (result.status_code or 0) >= 500:
+            reason = f"http_{result.status_code}"
+        elif result.not_modified or result.error:
+            pass
+        elif result.status_code != 200:
+            result.error = f"HTTP {result.status_code}"
+        elif html is not None:
+            reason = needs_javascript(result.final_url or url, html, result.text)
+    except requests.exceptions.RequestException as e:
+        result.error = str(e)
+        reason = "http_error"
+    except resilience.CircuitOpenError as e:
+        # The host has been failing; the browser would only wait out the same outage
+        result.error = str(e)
+
+    if reason and allow_selenium:
+        if scraper is None:
+            from helpers.web_scraper import WebScraper
+            scraper = WebScraper()
+        # FetchResult.elapsed is the browser's own time; the scrape metric below also covers the HTTP attempt
+        selenium_started = time.perf_counter()
+        text, links = scraper.scrape_url_and_extract_links(url)
+        result = FetchResult(url=url, final_url=url, tier="selenium", text=text, links=links,
+                             escalation_reason=reason, elapsed=round(time.perf_counter() - selenium_started, 3),
+                             error=None if text else "empty selenium result")
+    elif reason:
+        result.escalation_reason = reason
+        if reason.startswith("http_") and not result.error:
+            result.error = f"HTTP {result.status_code}"  # Would have escalated, but the browser is not allowed
+
+    metrics.observe("stage_latency_ms", (time.perf_counter() - started) * 1000, stage="scrape", tier=result.tier,
+                    status="error" if result.error else "ok")
+
+    logger.info(f"Fetched {url} via {result.tier} tier in {result.elapsed}s "
+                f"(status={result.status_code}, chars={len(result.text)}, links={len(result.links)}"
+                + (f", escalated: {result.escalation_reason}" if result.escalation_reason else "") + ")")
+    return result
@@ -1,13 +1,23 @@
-from openai import OpenAI, AzureOpenAI
-from azure.identity import DefaultAzureCredential
+from openai import OpenAI, AzureOpenAI, AsyncOpenAI, AsyncAzureOpenAI
 import openai
-import argparse
+import httpx
+import asyncio
+import hashlib
 import os
+import threading
+import time
+import weakref
 import json
 import logging
-from typing import List, Optional, Union, Any
+from functools import lru_cache
+from typing import Dict, List, Optional, Union, Any, AsyncIterator, Iterable, Tuple
 from pydantic import BaseModel, Field, field_validator
 from datetime import datetime, timezone
+from helpers import metrics, resilience
+from helpers.structured_output import StructuredOutputError, list_adapter, parse_items, strict_json_schema, validate_items
+from helpers.llm_cache import cache_enabled, get_result_cache, make_cache_key
+from helpers.chunking import Chunk, count_tokens, iter_chunks
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -39,6 +49,19 @@ class TaxChangeResponse(BaseModel):
     """
     changes: List[TaxChange]
 
+class SourceChanges(BaseModel):
+    """
+    The tax law changes found in one document of a packed request.
+    """
+    source_id: str
+    changes: List[TaxChange]
+
+class PackedTaxChangeResponse(BaseModel):
+    """
+    Response of a packed request: the changes of every document, keyed by source id.
+    """
+    results: List[SourceChanges]
+
 def get_pydantic_function_signature():
     # Dynamically generate the schema from the Pydantic model
     schema = TaxChange.model_json_schema()
@@ -51,6 +74,81 @@ def get_pydantic_function_signature():
     }
 
 
+# Output mode requested from the API: "json_schema" (strict structured outputs), "json_object" (JSON mode),
+# "text" (prompt instructions only) or "auto" (json_schema where the API version supports it, else json_object)
+LLM_RESPONSE_FORMAT = os.getenv("LLM_RESPONSE_FORMAT", "auto").lower()
+# Extra completions requested when a response cannot be parsed even after the local repair pass
+LLM_PARSE_RETRIES = int(os.getenv("LLM_PARSE_RETRIES", "1"))
+# Attempts per completion for rate limits, timeouts and 5xx; retries go through helpers.resilience, so the
+# SDK's own retries (LLM_CLIENT_MAX_RETRIES) are off by default to avoid retrying twice
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "6"))
+LLM_CLIENT_MAX_RETRIES = int(os.getenv("LLM_CLIENT_MAX_RETRIES", "0"))
+# Longest Retry-After honoured before giving up and failing the message, in seconds
+LLM_RETRY_MAX_WAIT = float(os.getenv("LLM_RETRY_MAX_WAIT", "60"))
+
+# Errors worth another attempt. Rate limits do not count against the circuit breaker: the API is up, just busy
+_LLM_RETRYABLE = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+# Prompt packing (call_llm_api_packed, opt-in for the queue with LLM_PACKING=true): short documents share one
+# request so the fixed prompt is paid once per pack instead of once per document
+LLM_PACKING = os.getenv("LLM_PACKING", "false").lower() == "true"
+LLM_PACK_TOKENS = int(os.getenv("LLM_PACK_TOKENS", "6000"))  # Document tokens per packed request
+LLM_PACK_MAX_DOCUMENTS = int(os.getenv("LLM_PACK_MAX_DOCUMENTS", "8"))
+LLM_PACK_MAX_DOCUMENT_TOKENS = int(os.getenv("LLM_PACK_MAX_DOCUMENT_TOKENS", "1500"))  # Larger documents go alone
+LLM_PACK_OUTPUT_TOKENS = int(os.getenv("LLM_PACK_OUTPUT_TOKENS", "600"))  # Completion budget per packed document
+
+# Structured outputs are available on Azure OpenAI from this API version on
+_JSON_SCHEMA_MIN_AZURE_VERSION = "2024-08-01"
+
+_JSON_OUTPUT_INSTRUCTION = ('Return the result as a JSON object with a single key "changes" holding the list of tax '
+                            'change objects in the output format described below (the "no match" object included).')
+_PACKED_OUTPUT_INSTRUCTION = ('The context holds several documents, each in a <document source_id="..." state="..."> tag. '
+                              'Analyse every document on its own, for the state named in its tag only. Return a JSON '
+                              'object with a single key "results": a list with one entry per document, '
+                              '{"source_id": "<the source_id of its tag>", "changes": [...]}, where "changes" holds that '
+                              "document's tax change objects in the output format described below (the \"no match\" "
+                              'object included).')
+# Stands in for {state} in the prompt of a packed request; each document carries its own state
+_PACKED_STATE = "given per document in its <document> tag"
+
+
+def get_azure_api_version() -> str:
+    return os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-01")
+
+
+def response_format_mode(is_azure: bool) -> str:
+    """
+    Resolves LLM_RESPONSE_FORMAT to the mode used for the current client.
+    """
+    if LLM_RESPONSE_FORMAT != "auto":
+        return LLM_RESPONSE_FORMAT
+    if is_azure and get_azure_api_version()[:10] < _JSON_SCHEMA_MIN_AZURE_VERSION:
+        return "json_object"
+    return "json_schema"
+
+
+@lru_cache(maxsize=None)
+def get_response_format(mode: str, packed: bool = False) -> Optional[dict]:
+    """
+    Returns the response_format request parameter for a mode, built from TaxChangeResponse (PackedTaxChangeResponse
+    for packed requests) and the extract_tax_changes signature. None for "text".
+    """
+    if mode == "json_schema":
+        signature = get_pydantic_function_signature()
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": signature["name"] + ("_packed" if packed else ""),
+                "description": signature["description"],
+                "schema": strict_json_schema(PackedTaxChangeResponse if packed else TaxChangeResponse),
+                "strict": True,
+            },
+        }
+    if mode == "json_object":
+        return {"type": "json_object"}
+    return None
+
+
 
 # Read the prompt file and return the content
 def read_prompt_file(prompt_file: str = "llm_prompt.md") -> str:
@@ -60,6 +158,74 @@ def read_prompt_file(prompt_file: str = "llm_prompt.md") -> str:
         return file.read()
 
 
+# Prompt templates keyed by file name -> (mtime, text, sha256). Reloaded only when the file changes on disk.
+_prompt_cache = {}
+_prompt_lock = threading.Lock()
+
+
+def _load_prompt(prompt_file: str) -> tuple:
+    file_path = os.path.join(os.path.dirname(__file__), prompt_file)
+    mtime = os.path.getmtime(file_path)
+    cached = _prompt_cache.get(prompt_file)
+    if cached is not None and cached[0] == mtime:
+        return cached
+
+    with _prompt_lock:
+        cached = _prompt_cache.get(prompt_file)
+        if cached is None or cached[0] != mtime:
+            text = read_prompt_file(prompt_file)
+            cached = (mtime, text, hashlib.sha256(text.encode("utf-8")).hexdigest())
+            _prompt_cache[prompt_file] = cached
+            logger.info(f"Loaded prompt template '{prompt_file}' (mtime={mtime})")
+    return cached
+
+
+def get_prompt_template(prompt_file: str = "llm_prompt.md") -> str:
+    """
+    Returns the prompt template, reading it from disk only on first use or when the file's mtime changes.
+    """
+    return _load_prompt(prompt_file)[1]
+
+
+def get_prompt_hash(prompt_file: str = "llm_prompt.md") -> str:
+    """
+    Returns the sha256 of the current prompt template, used to key cached LLM results.
+    """
+    return _load_prompt(prompt_file)[2]
+
+
+def render_prompt(prompt_text: str, state: str, prompt_file: str = "llm_prompt.md") -> str:
+    """
+    Fills the {state} and {context} placeholders of the cached prompt template.
+    """
+    return get_prompt_template(prompt_file).replace("{state}", state).replace("{context}", prompt_text)
+
+
+def _http_client_settings() -> dict:
+    """
+    Connection pool and timeout settings for the HTTP client shared by the LLM clients.
+    """
+    return {
+        "max_connections": int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+        "max_keepalive_connections": int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10")),
+        "keepalive_expiry": float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60")),
+        "timeout": float(os.getenv("LLM_TIMEOUT", "120")),
+        "connect_timeout": float(os.getenv("LLM_CONNECT_TIMEOUT", "10")),
+    }
+
+
+def _build_http_client() -> httpx.Client:
+    settings = _http_client_settings()
+    return openai.DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=settings["max_connections"],
+            max_keepalive_connections=settings["max_keepalive_connections"],
+            keepalive_expiry=settings["keepalive_expiry"],
+        ),
+        timeout=httpx.Timeout(settings["timeout"], connect=settings["connect_timeout"]),
+    )
+
+
 def initialize_clients():
     use_azure = os.getenv("USE_AZURE_OPENAI", "false").lower() == "true"
     logger.info(f"Using Azure OpenAI: {use_azure}")
@@ -67,16 +233,234 @@ def initialize_clients():
     if use_azure:
         client = AzureOpenAI(
             api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-            api_version="2024-02-01",
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
+            api_version=get_azure_api_version(),
+            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+            http_client=_build_http_client(),
+            max_retries=LLM_CLIENT_MAX_RETRIES
         )
     else:
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=_build_http_client(),
+                        max_retries=LLM_CLIENT_MAX_RETRIES)
     
     return client
 
 
-def call_llm_api(prompt_text: str, state: str, model: str = None):
+# Module-level client registry so every invocation in a worker reuses the same keep-alive connection pool.
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _client_key() -> tuple:
+    return (
+        os.getenv("USE_AZURE_OPENAI", "false").lower(),
+        os.getenv("AZURE_OPENAI_ENDPOINT"),
+        os.getenv("AZURE_OPENAI_API_KEY"),
+        os.getenv("OPENAI_API_KEY"),
+    )
+
+
+def get_client():
+    """
+    Returns the shared LLM client for the current configuration, creating it on first use.
+    """
+    key = _client_key()
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = initialize_clients()
+                _clients[key] = client
+    return client
+
+
+def reset_clients():
+    """
+    Closes and forgets every cached client. Mainly useful when credentials are rotated.
+    """
+    with _clients_lock:
+        for client in _clients.values():
+            try:
+                client.close()
+            except Exception as e:
+                logger.warning(f"Error closing LLM client: {e}")
+        _clients.clear()
+
+
+def _completion_request(client, prompt: str, model: str, packed: bool = False) -> dict:
+    """
+    Builds the chat completion arguments shared by the sync, async and packed code paths.
+    """
+    # AOAI call uses the model from the deployment specified in the .env file, OpenAI uses the model param passed in
+    is_azure = isinstance(client, (AzureOpenAI, AsyncAzureOpenAI))
+    request = {
+        "model": os.getenv("AZURE_OPENAI_DEPLOYMENT") if is_azure else model,
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": int(os.getenv("LLM_MAX_TOKENS", "2000")),
+        "temperature": 0.0
+    }
+    response_format = get_response_format(response_format_mode(is_azure), packed)
+    if packed:
+        # The prompt file describes the output for one document; a pack always needs its keyed layout spelled out
+        request["messages"].insert(0, {"role": "system", "content": _PACKED_OUTPUT_INSTRUCTION})
+    elif response_format is not None:
+        # JSON modes return an object, so the prompt's bare list is wrapped in {"changes": [...]}
+        request["messages"].insert(0, {"role": "system", "content": _JSON_OUTPUT_INSTRUCTION})
+    if response_format is not None:
+        request["response_format"] = response_format
+    return request
+
+
+def _completion_content(response, state: str) -> Optional[str]:
+    """
+    The text of a chat completion. Raises StructuredOutputError if the model refused.
+    """
+    choice = response.choices[0]
+    refusal = getattr(getattr(choice, "message", None), "refusal", None)
+    if refusal:
+        metrics.increment("llm_parse", outcome="refused", state=state)
+        raise StructuredOutputError(f"Model refused: {refusal}")
+    return choice.text if hasattr(choice, 'text') else choice.message.content
+
+
+def _parse_completion(response, state: str):
+    """
+    Turns a chat completion into the (raw_response, json_response, pydantic_response) triple.
+
+    Items that fail validation are dropped and logged rather than failing the whole document.
+    Raises StructuredOutputError if no JSON can be recovered from the response.
+    """
+    choice = response.choices[0]
+    raw_response = _completion_content(response, state)
+    try:
+        parsed = parse_items(raw_response, TaxChange)
+    except StructuredOutputError:
+        metrics.increment("llm_parse", outcome="failed", state=state)
+        raise
+
+    if parsed.invalid:
+        metrics.increment("llm_invalid_items", len(parsed.invalid), state=state)
+        for item in parsed.invalid:
+            logger.warning(f"Dropped invalid tax change #{item.index} for state '{state}': {item.error}")
+    outcome = "partial" if parsed.invalid else "repaired" if parsed.repaired else "ok"
+    if parsed.repaired:
+        logger.info(f"Repaired malformed JSON in LLM response for state '{state}' "
+                    f"(finish_reason={getattr(choice, 'finish_reason', None)})")
+    metrics.increment("llm_parse", outcome=outcome, state=state)
+    return raw_response, parsed.json_items, TaxChangeResponse(changes=parsed.items)
+
+
+def get_llm_rate_limiter(model: str) -> resilience.AdaptiveRateLimiter:
+    """
+    Returns the worker-wide adaptive limiter for a model or deployment. It starts from LLM_REQUESTS_PER_MINUTE
+    and LLM_TOKENS_PER_MINUTE (0 = unknown) and follows the x-ratelimit-* headers of every response.
+    """
+    return resilience.get_rate_limiter(
+        f"llm:{model}",
+        int(os.getenv("LLM_REQUESTS_PER_MINUTE", "0")),
+        int(os.getenv("LLM_TOKENS_PER_MINUTE", "0")),
+    )
+
+
+def _request_tokens(request: dict) -> int:
+    return sum(count_tokens(message["content"]) for message in request["messages"]) + request["max_tokens"]
+
+
+def _error_headers(error: BaseException):
+    response = getattr(error, "response", None)
+    return getattr(response, "headers", None)
+
+
+def _llm_retry_after(error: BaseException) -> Optional[float]:
+    return resilience.retry_after_seconds(_error_headers(error))
+
+
+def _llm_is_failure(error: BaseException) -> bool:
+    return not isinstance(error, openai.RateLimitError)
+
+
+def _record_response(limiter: resilience.AdaptiveRateLimiter, raw, reserved: int):
+    """
+    Feeds a raw completion's rate limit headers and token usage back into the limiter and returns the completion.
+    """
+    limiter.update_from_headers(raw.headers)
+    response = raw.parse()
+    limiter.settle(reserved, getattr(getattr(response, "usage", None), "total_tokens", None))
+    return response
+
+
+def _create_completion(client, request: dict, state: str):
+    """
+    One chat completion through the shared adaptive rate limiter, retried with backoff on rate limits,
+    timeouts and server errors, behind the "llm" circuit breaker.
+    """
+    limiter = get_llm_rate_limiter(request["model"])
+    reserved = _request_tokens(request)
+
+    def attempt():
+        limiter.acquire(reserved)
+        try:
+            with metrics.timer("llm", state=state):
+                raw = client.chat.completions.with_raw_response.create(**request)
+        except openai.RateLimitError as e:
+            limiter.penalize(headers=e.response.headers)
+            raise
+        return _record_response(limiter, raw, reserved)
+
+    return resilience.call_with_retry(
+        attempt, "llm", retry_on=_LLM_RETRYABLE, max_attempts=LLM_MAX_ATTEMPTS, max_retry_after=LLM_RETRY_MAX_WAIT,
+        retry_after=_llm_retry_after, is_failure=_llm_is_failure)
+
+
+async def _create_completion_async(client, request: dict, state: str):
+    """
+    Async version of _create_completion.
+    """
+    limiter = get_llm_rate_limiter(request["model"])
+    reserved = _request_tokens(request)
+
+    async def attempt():
+        await limiter.acquire_async(reserved)
+        try:
+            with metrics.timer("llm", state=state):
+                raw = await client.chat.completions.with_raw_response.create(**request)
+        except openai.RateLimitError as e:
+            limiter.penalize(headers=e.response.headers)
+            raise
+        return _record_response(limiter, raw, reserved)
+
+    return await resilience.call_with_retry_async(
+        attempt, "llm", retry_on=_LLM_RETRYABLE, max_attempts=LLM_MAX_ATTEMPTS, max_retry_after=LLM_RETRY_MAX_WAIT,
+        retry_after=_llm_retry_after, is_failure=_llm_is_failure)
+
+
+def _cached_result(cache_key: Optional[str]):
+    """
+    Returns the cached (raw_response, json_response, pydantic_response) triple for a key, or None on a miss.
+    """
+    if cache_key is None:
+        return None
+    cached = get_result_cache().get(cache_key)
+    if cached is None:
+        return None
+    json_response = cached["json_response"]
+    return cached["raw_response"], json_response, TaxChangeResponse(changes=list_adapter(TaxChange).validate_python(json_response))
+
+
+def _cache_key_for(prompt_text: str, state: str, request: dict, use_cache: bool,
+                   prompt_hash: Optional[str] = None) -> Optional[str]:
+    if not (use_cache and cache_enabled()):
+        return None
+    return make_cache_key(prompt_text, state, request["model"], prompt_hash or get_prompt_hash())
+
+
+def _store_result(cache_key: Optional[str], result: tuple) -> None:
+    if cache_key is not None:
+        raw_response, json_response, _ = result
+        get_result_cache().set(cache_key, {"raw_response": raw_response, "json_response": json_response})
+
+
+def call_llm_api(prompt_text: str, state: str, model: str = None, use_cache: bool = True):
     """
     Calls the LLM API with a given prompt and model, and returns the response in three formats.
     
@@ -84,6 +468,7 @@ def call_llm_api(prompt_text: str, state: str, model: str = None):
         prompt_text (str): The prompt text to send to the API.
         state (str): The State for which the tax changes are being requested.
         model (str): The model to use. If None, will default to the environment model.
+        use_cache (bool): Serve and store the result through the LLM result cache (see helpers.llm_cache).
     
     Returns:
         tuple: A tuple containing:
@@ -91,49 +476,557 @@ def call_llm_api(prompt_text: str, state: str, model: str = None):
             - json_response (dict): The response parsed as JSON.
             - pydantic_response (TaxChangeResponse): The response parsed into the Pydantic model.
     """
-    client = initialize_clients()
+    client = get_client()
     model = model if model is not None else os.getenv("LLM_MODEL")
 
-    prompt_file_text = read_prompt_file()  # Get the prompt text from the file
-    prompt = prompt_file_text.replace("{state}", state)
-    prompt = prompt_file_text.replace("{context}", prompt_text)
+    prompt = render_prompt(prompt_text, state)  # Cached prompt template with state and context filled in
     #prompt = f"{prompt_file_text}\n\n--------\nCONTEXT:\n\n{prompt_text}"  # Set up the prompt
 
+    request = _completion_request(client, prompt, model)
+    cache_key = _cache_key_for(prompt_text, state, request, use_cache)
+    cached = _cached_result(cache_key)
+    if cached is not None:
+        logger.info(f"LLM cache hit for state '{state}'")
+        return cached
+
     try:
-        # AOAI call uses the model from the deployment specified in the .env file
-        if isinstance(client, AzureOpenAI):
-            response = client.chat.completions.create(
-                model=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=2000,
-                temperature=0.0
-            )
-        else:
-            # OpenAI call uses the model param passed in
-            response = client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=2000,
-                temperature=0.0
-            )
-
-        raw_response = response.choices[0].text if hasattr(response.choices[0], 'text') else response.choices[0].message.content
-        # Clean the response content if required (assuming JSON is returned as a formatted string)
-        json_response = json.loads(raw_response.strip('```json\n').strip('\n```'))
-        
-        # Parse the JSON response into a Pydantic model
-        pydantic_response = TaxChangeResponse(changes=[TaxChange(**item) for item in json_response])
-
-        # Return all three: raw response, JSON response, and Pydantic object
-        return raw_response, json_response, pydantic_response
+        for attempt in range(LLM_PARSE_RETRIES + 1):
+            response = _create_completion(client, request, state)
+            metrics.record_tokens(getattr(response, "usage", None), state=state)
+
+            # Return all three: raw response, JSON response, and Pydantic object
+            try:
+                with metrics.timer("parse", state=state):
+                    result = _parse_completion(response, state)
+                break
+            except StructuredOutputError as e:
+                if attempt >= LLM_PARSE_RETRIES:
+                    raise
+                logger.warning(f"Unparseable LLM response for state '{state}', retrying ({attempt + 1}/{LLM_PARSE_RETRIES}): {e}")
+        _store_result(cache_key, result)
+        return result
 
     except Exception as e:
-        print(f"An error occurred: {e}")
+        logger.error(f"LLM call failed for state '{state}': {e}")
         raise
 
 
+# ---------------------------------------------------------------------------
+# Async pipeline
+# ---------------------------------------------------------------------------
+
+def initialize_async_client():
+    use_azure = os.getenv("USE_AZURE_OPENAI", "false").lower() == "true"
+    settings = _http_client_settings()
+    http_client = openai.DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=settings["max_connections"],
+            max_keepalive_connections=settings["max_keepalive_connections"],
+            keepalive_expiry=settings["keepalive_expiry"],
+        ),
+        timeout=httpx.Timeout(settings["timeout"], connect=settings["connect_timeout"]),
+    )
+
+    if use_azure:
+        return AsyncAzureOpenAI(
+            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+            api_version=get_azure_api_version(),
+            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+            http_client=http_client,
+            max_retries=LLM_CLIENT_MAX_RETRIES
+        )
+    return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client, max_retries=LLM_CLIENT_MAX_RETRIES)
+
+
+# Async clients are bound to the event loop that created their connection pool, so they are cached per loop.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """
+    Returns the shared async LLM client for the running event loop, creating it on first use.
+    """
+    loop = asyncio.get_running_loop()
+    key = _client_key()
+    per_loop = _async_clients.setdefault(loop, {})
+    if key not in per_loop:
+        per_loop[key] = initialize_async_client()
+    return per_loop[key]
+
+
+async def call_llm_api_async(prompt_text: str, state: str, model: str = None, use_cache: bool = True):
+    """
+    Async version of call_llm_api. Returns the same (raw_response, json_response, pydantic_response) triple.
 
+    Parameters:
+        prompt_text (str): The prompt text to send to the API.
+        state (str): The State for which the tax changes are being requested.
+        model (str): The model to use. If None, will default to the environment model.
+        use_cache (bool): Serve and store the result through the LLM result cache.
+    """
+    client = get_async_client()
+    model = model if model is not None else os.getenv("LLM_MODEL")
+    prompt = render_prompt(prompt_text, state)
+    request = _completion_request(client, prompt, model)
+    cache_key = _cache_key_for(prompt_text, state, request, use_cache)
+    # The cache's Redis tier is a blocking client; keep its round trips off the event loop
+    cached = await asyncio.to_thread(_cached_result, cache_key) if cache_key is not None else None
+    if cached is not None:
+        return cached
 
+    try:
+        for attempt in range(LLM_PARSE_RETRIES + 1):
+            response = await _create_completion_async(client, request, state)
+            metrics.record_tokens(getattr(response, "usage", None), state=state)
+            try:
+                with metrics.timer("parse", state=state):
+                    result = _parse_completion(response, state)
+                break
+            except StructuredOutputError as e:
+                if attempt >= LLM_PARSE_RETRIES:
+                    raise
+                logger.warning(f"Unparseable LLM response for state '{state}', retrying ({attempt + 1}/{LLM_PARSE_RETRIES}): {e}")
+        if cache_key is not None:
+            await asyncio.to_thread(_store_result, cache_key, result)
+        return result
     except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
-        exit(1)
\ No newline at end of file
+        logger.error(f"LLM call failed for state '{state}': {e}")
+        raise
+
+
+class BatchResult(BaseModel):
+    """
+    Outcome of one (text, state) item of a batch run.
+    """
+    index: int
+    state: str
+    raw_response: Optional[str] = None
+    json_response: Any = None
+    response: Optional[TaxChangeResponse] = None
+    error: Optional[str] = None
+    elapsed: float = 0.0
+
+
+async def call_llm_api_batch(items: Iterable[Tuple[str, str]], model: str = None,
+                             max_concurrency: Optional[int] = None) -> AsyncIterator[BatchResult]:
+    """
+    Runs many (text, state) extractions concurrently and yields a BatchResult for each one as it completes.
+    Requests are paced by the model's shared adaptive rate limiter (see get_llm_rate_limiter).
+
+    Parameters:
+        items: Iterable of (prompt_text, state) pairs.
+        model (str): The model to use. If None, will default to the environment model.
+        max_concurrency (int): Maximum number of in-flight requests (LLM_MAX_CONCURRENCY, default 8).
+    """
+    max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_one(index: int, prompt_text: str, state: str) -> BatchResult:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                raw_response, json_response, pydantic_response = await call_llm_api_async(
+                    prompt_text, state, model=model)
+                return BatchResult(index=index, state=state, raw_response=raw_response, json_response=json_response,
+                                   response=pydantic_response, elapsed=time.perf_counter() - started)
+            except Exception as e:
+                return BatchResult(index=index, state=state, error=str(e), elapsed=time.perf_counter() - started)
+
+    tasks = [asyncio.create_task(run_one(index, text, state)) for index, (text, state) in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def run_llm_batch(items: Iterable[Tuple[str, str]], **kwargs) -> List[BatchResult]:
+    """
+    Synchronous helper around call_llm_api_batch. Returns the results ordered by input index.
+    """
+    async def collect():
+        return [result async for result in call_llm_api_batch(items, **kwargs)]
+
+    return sorted(asyncio.run(collect()), key=lambda result: result.index)
+
+
+# ---------------------------------------------------------------------------
+# Chunked (map-reduce) extraction for large documents
+# ---------------------------------------------------------------------------
+
+def _change_key(change: TaxChange) -> tuple:
+    return (change.state.strip().upper(), change.category.strip().lower(), change.subcategory.strip().lower())
+
+
+def merge_tax_changes(responses: Iterable[TaxChangeResponse]) -> TaxChangeResponse:
+    """
+    Merges per-chunk responses into one, de-duplicating on (state, category, subcategory).
+
+    For duplicates the match with the highest confidence wins. "No match" placeholders are only kept when no
+    chunk produced a real match.
+    """
+    merged = {}
+    no_match = None
+    for response in responses:
+        for change in response.changes:
+            if not change.is_match and not change.category.strip():
+                if no_match is None or change.confidence > no_match.confidence:
+                    no_match = change
+                continue
+            key = _change_key(change)
+            current = merged.get(key)
+            if current is None or (change.is_match, change.confidence) > (current.is_match, current.confidence):
+                merged[key] = change
+
+    changes = list(merged.values())
+    if not changes and no_match is not None:
+        changes = [no_match]
+    return TaxChangeResponse(changes=changes)
+
+
+class ChunkReport(BaseModel):
+    """
+    Per-chunk timing and token accounting for a chunked extraction.
+    """
+    index: int
+    start_page: int
+    end_page: int
+    tokens: int
+    elapsed: float = 0.0
+    changes: int = 0
+    error: Optional[str] = None
+
+
+class ChunkedExtractionError(RuntimeError):
+    """
+    Raised by call_llm_api_chunked when any chunk failed, so a partial merge is never taken for the document's
+    complete result. The per-chunk reports are kept in `reports`.
+    """
+    def __init__(self, message: str, reports: List[ChunkReport]):
+        super().__init__(message)
+        self.reports = reports
+
+
+def call_llm_api_chunked(pages: Union[str, Iterable[str]], state: str, model: str = None,
+                         max_chunk_tokens: Optional[int] = None, overlap_tokens: Optional[int] = None,
+                         max_workers: Optional[int] = None):
+    """
+    Extracts tax changes from a document of any size by splitting it into token-bounded chunks, calling the
+    LLM for each chunk in parallel and merging the per-chunk results.
+
+    Pages may be a generator; chunks are submitted as soon as they are formed and at most 2 x max_workers
+    chunks are held in memory at once.
+
+    Parameters:
+        pages: The document text, or an iterable of page texts.
+        state (str): The State for which the tax changes are being requested.
+        model (str): The model to use. If None, will default to the environment model.
+        max_chunk_tokens (int): Token budget per chunk (LLM_CHUNK_TOKENS).
+        overlap_tokens (int): Overlap between consecutive chunks (LLM_CHUNK_OVERLAP_TOKENS).
+        max_workers (int): Parallel LLM calls (LLM_MAX_CONCURRENCY, default 8).
+
+    Returns:
+        tuple: A tuple containing:
+            - raw_responses (List[str]): The raw response of every chunk, in chunk order.
+            - json_response (list): The merged changes as JSON-compatible dicts.
+            - pydantic_response (TaxChangeResponse): The merged, de-duplicated changes.
+            - reports (List[ChunkReport]): Per-chunk timings and token counts.
+
+    Raises:
+        ChunkedExtractionError: If any chunk failed.
+    """
+    if isinstance(pages, str):
+        pages = [pages]
+    max_workers = max_workers or int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+    def run_chunk(chunk: Chunk):
+        started = time.perf_counter()
+        result = call_llm_api(chunk.text, state, model=model)
+        return result, time.perf_counter() - started
+
+    reports, results = {}, {}
+    pending = {}
+
+    def collect(done) -> None:
+        for future in done:
+            chunk = pending.pop(future)
+            report = reports[chunk.index]
+            try:
+                result, elapsed = future.result()
+                report.elapsed = elapsed
+                report.changes = len(result[2].changes)
+                results[chunk.index] = result
+            except Exception as e:
+                report.error = str(e)
+                logger.error(f"Chunk {chunk.index} (pages {chunk.start_page}-{chunk.end_page}) failed: {e}")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for chunk in iter_chunks(pages, max_tokens=max_chunk_tokens, overlap_tokens=overlap_tokens):
+            reports[chunk.index] = ChunkReport(index=chunk.index, start_page=chunk.start_page,
+                                               end_page=chunk.end_page, tokens=chunk.token_count)
+            pending[executor.submit(run_chunk, chunk)] = chunk
+            if len(pending) >= max_workers * 2:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(wait(list(pending))[0])
+
+    ordered_reports = [reports[index] for index in sorted(reports)]
+    for report in ordered_reports:
+        logger.info(f"Chunk {report.index}: pages {report.start_page}-{report.end_page}, {report.tokens} tokens, "
+                    f"{report.elapsed:.2f}s, {report.changes} changes" + (f", error: {report.error}" if report.error else ""))
+
+    failed = [report for report in ordered_reports if report.error]
+    if failed:
+        raise ChunkedExtractionError(f"{len(failed)} of {len(ordered_reports)} chunk(s) failed for state '{state}': "
+                                     f"{failed[0].error}", ordered_reports)
+
+    ordered = [results[index] for index in sorted(results)]
+    pydantic_response = merge_tax_changes(result[2] for result in ordered)
+    json_response = [change.model_dump() for change in pydantic_response.changes]
+    return [result[0] for result in ordered], json_response, pydantic_response, ordered_reports
+
+
+# ---------------------------------------------------------------------------
+# Prompt packing: several short documents per request
+# ---------------------------------------------------------------------------
+
+# Tokens of the <document> tag wrapped around each packed document
+_PACK_TAG_TOKENS = 16
+
+
+class PackedDocument(BaseModel):
+    """
+    One document for call_llm_api_packed.
+    """
+    source_id: str
+    state: str
+    text: str
+
+
+class PackedResult(BaseModel):
+    """
+    Outcome of one document of call_llm_api_packed, in the shape of call_llm_api's triple.
+    """
+    source_id: str
+    state: str
+    raw_response: Optional[str] = None
+    json_response: Any = None
+    response: Optional[TaxChangeResponse] = None
+    error: Optional[str] = None
+    packed: bool = False  # Served by a packed request rather than a single request or the cache
+    elapsed: float = 0.0
+
+
+class _PackedEntry(BaseModel):
+    # Lenient view of a SourceChanges entry: the changes are validated one by one so a bad item only drops itself
+    source_id: str
+    changes: list
+
+
+def plan_packs(documents: List[PackedDocument], pack_tokens: Optional[int] = None, max_documents: Optional[int] = None,
+               max_document_tokens: Optional[int] = None) -> Tuple[List[List[int]], List[int]]:
+    """
+    Groups documents into packs by first-fit decreasing on their token counts.
+
+    Parameters:
+        documents: The documents to plan.
+        pack_tokens (int): Document tokens per pack (LLM_PACK_TOKENS).
+        max_documents (int): Documents per pack (LLM_PACK_MAX_DOCUMENTS).
+        max_document_tokens (int): Larger documents are sent alone (LLM_PACK_MAX_DOCUMENT_TOKENS).
+
+    Returns:
+        tuple: (packs as lists of positions in `documents`, positions to send as single requests)
+    """
+    pack_tokens = pack_tokens or LLM_PACK_TOKENS
+    max_documents = max_documents or LLM_PACK_MAX_DOCUMENTS
+    max_document_tokens = max_document_tokens or LLM_PACK_MAX_DOCUMENT_TOKENS
+    sizes = [count_tokens(document.text) + _PACK_TAG_TOKENS for document in documents]
+
+    singles = [index for index, size in enumerate(sizes) if size > min(max_document_tokens, pack_tokens)]
+    bins = []  # [positions, tokens]
+    for index in sorted(set(range(len(documents))) - set(singles), key=lambda i: -sizes[i]):
+        for pack in bins:
+            if len(pack[0]) < max_documents and pack[1] + sizes[index] <= pack_tokens:
+                pack[0].append(index)
+                pack[1] += sizes[index]
+                break
+        else:
+            bins.append([[index], sizes[index]])
+
+    packs = []
+    for positions, _ in bins:
+        if len(positions) == 1 or max_documents == 1:
+            singles.extend(positions)  # A pack of one is just a single request
+        else:
+            packs.append(sorted(positions))
+    return sorted(packs), sorted(singles)
+
+
+def render_packed_context(documents: List[PackedDocument], tags: List[str]) -> str:
+    """
+    The context of a packed request: every document wrapped in a <document source_id="..." state="..."> tag.
+    """
+    return "\n\n".join(f'<document source_id="{tag}" state="{document.state}">\n{document.text}\n</document>'
+                       for tag, document in zip(tags, documents))
+
+
+def split_packed_response(raw_response: Optional[str], documents: List[PackedDocument], tags: List[str],
+                          label: str) -> Dict[int, tuple]:
+    """
+    Splits a packed response into per-document (raw_response, json_response, pydantic_response) triples keyed
+    by position in the pack. Documents the response has no entry for are left out.
+
+    Each change takes its document's state, so a model mixing up documents cannot file a change under the wrong
+    state. Invalid changes are dropped and logged like in call_llm_api. Raises StructuredOutputError if no
+    result list can be recovered.
+    """
+    parsed = parse_items(raw_response, _PackedEntry, list_key="results")
+    positions = {tag: position for position, tag in enumerate(tags)}
+    entries: Dict[int, list] = {}
+    for entry in parsed.items:
+        position = positions.get(entry.source_id.strip())
+        if position is None:
+            logger.warning(f"Packed response has an entry for unknown source id '{entry.source_id}'; ignored")
+            continue
+        entries.setdefault(position, []).extend(entry.changes)
+
+    split = {}
+    for position, changes in entries.items():
+        state = documents[position].state
+        for change in changes:
+            if isinstance(change, dict):
+                change["state"] = state
+        valid, json_items, invalid = validate_items(changes, TaxChange)
+        if invalid:
+            metrics.increment("llm_invalid_items", len(invalid), state=state)
+            for item in invalid:
+                logger.warning(f"Dropped invalid tax change #{item.index} for '{documents[position].source_id}': {item.error}")
+        split[position] = (json.dumps(json_items), json_items, TaxChangeResponse(changes=valid))
+    outcome = "partial" if len(split) < len(documents) else "repaired" if parsed.repaired else "ok"
+    metrics.increment("llm_parse", outcome=outcome, state=label)
+    return split
+
+
+def _call_pack(documents: List[PackedDocument], model: Optional[str]) -> Dict[int, tuple]:
+    """
+    Extracts a pack of documents in one request. Returns the triples of the documents the response covered.
+    """
+    client = get_client()
+    tags = [f"d{position + 1}" for position in range(len(documents))]
+    states = {document.state for document in documents}
+    label = states.pop() if len(states) == 1 else "mixed"
+    prompt = render_prompt(render_packed_context(documents, tags), _PACKED_STATE)
+    request = _completion_request(client, prompt, model, packed=True)
+    request["max_tokens"] = max(request["max_tokens"], LLM_PACK_OUTPUT_TOKENS * len(documents))
+
+    for attempt in range(LLM_PARSE_RETRIES + 1):
+        response = _create_completion(client, request, label)
+        metrics.record_tokens(getattr(response, "usage", None), state=label)
+        try:
+            with metrics.timer("parse", state=label):
+                return split_packed_response(_completion_content(response, label), documents, tags, label)
+        except StructuredOutputError as e:
+            if attempt >= LLM_PARSE_RETRIES:
+                metrics.increment("llm_parse", outcome="failed", state=label)
+                logger.warning(f"Unparseable packed response for {len(documents)} documents, sending them one by one: {e}")
+                return {}
+            logger.warning(f"Unparseable packed response, retrying ({attempt + 1}/{LLM_PARSE_RETRIES}): {e}")
+
+
+def _packed_prompt_hash() -> str:
+    """
+    Cache key version for results extracted in a pack: the prompt template plus the packed output instruction.
+    """
+    return hashlib.sha256(f"{get_prompt_hash()}\x00{_PACKED_OUTPUT_INSTRUCTION}".encode("utf-8")).hexdigest()
+
+
+def call_llm_api_packed(documents: Iterable[PackedDocument], model: str = None, use_cache: bool = True,
+                        max_workers: Optional[int] = None, pack_tokens: Optional[int] = None,
+                        max_documents: Optional[int] = None,
+                        max_document_tokens: Optional[int] = None) -> List[PackedResult]:
+    """
+    Extracts tax changes from many documents, packing short ones several to a request so the fixed prompt is
+    paid once per pack. Each document is tagged with its source id and state, the model answers with one entry
+    per source id, and the response is split back into per-document results.
+
+    Documents over max_document_tokens are sent as single requests, and so is any document a packed response
+    leaves out or that could not be parsed, and every document of a pack whose request fails. Results are cached
+    per document. Results extracted in a pack are kept under their own key: a single request's result serves a
+    later packed call, but a packed result is never served to call_llm_api.
+
+    Parameters:
+        documents: The documents, each with a source id (unique within the call) and a state.
+        model (str): The model to use. If None, will default to the environment model.
+        use_cache (bool): Serve and store results through the LLM result cache.
+        max_workers (int): Parallel requests (LLM_MAX_CONCURRENCY, default 8).
+        pack_tokens, max_documents, max_document_tokens: Packing limits, see plan_packs.
+
+    Returns:
+        List[PackedResult]: One result per document, in input order. Failures are reported in PackedResult.error.
+    """
+    documents = list(documents)
+    model = model if model is not None else os.getenv("LLM_MODEL")
+    max_workers = max_workers or int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    results: List[Optional[PackedResult]] = [None] * len(documents)
+    request_model = os.getenv("AZURE_OPENAI_DEPLOYMENT") if isinstance(get_client(), AzureOpenAI) else model
+
+    def cache_key(document: PackedDocument, packed: bool = False) -> Optional[str]:
+        return _cache_key_for(document.text, document.state, {"model": request_model}, use_cache,
+                              prompt_hash=_packed_prompt_hash() if packed else None)
+
+    def finish(position: int, triple: Optional[tuple], started: float, packed: bool = False, error: str = None) -> None:
+        document = documents[position]
+        result = PackedResult(source_id=document.source_id, state=document.state, packed=packed, error=error,
+                              elapsed=round(time.perf_counter() - started, 3))
+        if triple is not None:
+            result.raw_response, result.json_response, result.response = triple
+            if packed:
+                _store_result(cache_key(document, packed=True), triple)
+        results[position] = result
+
+    pending_positions = []
+    for position, document in enumerate(documents):
+        cached = _cached_result(cache_key(document))
+        if cached is None:
+            cached = _cached_result(cache_key(document, packed=True))
+        if cached is not None:
+            finish(position, cached, time.perf_counter())
+        else:
+            pending_positions.append(position)
+
+    pending_documents = [documents[position] for position in pending_positions]
+    packs, singles = plan_packs(pending_documents, pack_tokens, max_documents, max_document_tokens)
+    packs = [[pending_positions[index] for index in pack] for pack in packs]
+    singles = [pending_positions[index] for index in singles]
+    logger.info(f"Packing {len(pending_positions)} document(s) into {len(packs)} packed and {len(singles)} single "
+                f"request(s); {len(documents) - len(pending_positions)} served from the cache")
+
+    def run_single(position: int, started: float) -> None:
+        document = documents[position]
+        try:
+            finish(position, call_llm_api(document.text, document.state, model=model, use_cache=use_cache), started)
+        except Exception as e:
+            logger.error(f"Extraction failed for '{document.source_id}': {e}")
+            finish(position, None, started, error=str(e))
+
+    def run_pack(positions: List[int]) -> None:
+        started = time.perf_counter()
+        metrics.observe("llm_pack_documents", len(positions))
+        try:
+            split = _call_pack([documents[position] for position in positions], model)
+        except Exception as e:
+            logger.error(f"Packed request for {len(positions)} document(s) failed, sending them singly: {e}")
+            split = {}
+        for index, position in enumerate(positions):
+            if index in split:
+                finish(position, split[index], started, packed=True)
+            else:
+                metrics.increment("llm_pack_fallback", state=documents[position].state)
+                run_single(position, started)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run_pack, pack) for pack in packs]
+        futures += [executor.submit(run_single, position, time.perf_counter()) for position in singles]
+        wait(futures)
+    return results
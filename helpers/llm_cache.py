@@ -0,0 +1,178 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes scraped text so cosmetic differences (unicode forms, whitespace, line breaks) hash the same.
+    """
+    if not text:
+        return ""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def make_cache_key(text: str, state: str, model: str, prompt_hash: str) -> str:
+    """
+    Content-addressed key for an LLM result: hash of the normalized context, state, model/deployment and prompt.
+    """
+    digest = hashlib.sha256()
+    for part in (normalize_text(text), (state or "").upper(), model or "", prompt_hash or ""):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU with a per-entry TTL and both entry-count and byte-size limits.
+    """
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = 86400):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, size: int = 0) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class LLMResultCache:
+    """
+    Two-tier cache for LLM extraction results: an in-process LRU in front of a shared Redis tier.
+
+    Values are plain JSON-serializable dicts (raw_response and json_response) so they can be shared across workers.
+    """
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024, ttl_seconds: int = 7 * 86400,
+                 use_redis: bool = True, redis_prefix: str = "llmcache:"):
+        self.local = LRUCache(max_entries=max_entries, max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+        self.ttl_seconds = ttl_seconds
+        self.use_redis = use_redis
+        self.redis_prefix = redis_prefix
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        value = self.local.get(key)
+        if value is not None:
+            self._count("local_hits")
+            return value
+
+        if self.use_redis:
+            import helpers.redis_handler as rh
+            stored = rh.get_data(self.redis_prefix + key)
+            if stored:
+                try:
+                    value = json.loads(stored)
+                except ValueError as e:
+                    logger.warning(f"Discarding unreadable cache entry {key}: {e}")
+                    value = None
+                if value is not None:
+                    self.local.set(key, value, size=len(stored))
+                    self._count("redis_hits")
+                    return value
+
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value: dict) -> None:
+        serialized = json.dumps(value)
+        self.local.set(key, value, size=len(serialized))
+        if self.use_redis:
+            import helpers.redis_handler as rh
+            rh.store_data(self.redis_prefix + key, value, ex=self.ttl_seconds)
+        self._count("stores")
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+        if counter != "stores":
+            from helpers import metrics
+            metrics.record_cache("llm", counter)
+
+    def stats(self) -> dict:
+        hits = self.local_hits + self.redis_hits
+        lookups = hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.local.evictions,
+            "local_entries": len(self.local),
+            "hit_ratio": hits / lookups if lookups else 0.0,
+        }
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def cache_enabled() -> bool:
+    return os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+
+
+def get_result_cache() -> LLMResultCache:
+    """
+    Returns the worker-wide LLM result cache, configured from the environment on first use.
+    """
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = LLMResultCache(
+                    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")),
+                    max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+                    ttl_seconds=int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 86400))),
+                    use_redis=os.getenv("LLM_CACHE_REDIS", "true" if os.getenv("REDIS_HOST") else "false").lower() == "true",
+                )
+    return _result_cache
@@ -0,0 +1,259 @@
+import atexit
+import functools
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Emit every observation as a structured "Metric:" log line (picked up as custom dimensions by Application Insights)
+METRICS_LOG = os.getenv("METRICS_LOG", "true").lower() == "true"
+# Samples kept per series for local percentiles; older samples are dropped first
+METRICS_MAX_SAMPLES = int(os.getenv("METRICS_MAX_SAMPLES", "10000"))
+# When set, the local percentile summary is written to this JSON file at exit (e.g. after a load test)
+METRICS_EXPORT_PATH = os.getenv("METRICS_EXPORT_PATH")
+
+SeriesKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _series_key(name: str, tags: Dict[str, Any]) -> SeriesKey:
+    return name, tuple(sorted((key, str(value)) for key, value in tags.items() if value is not None))
+
+
+def _series_name(key: SeriesKey) -> str:
+    name, tags = key
+    return name + ("{" + ",".join(f"{tag}={value}" for tag, value in tags) + "}" if tags else "")
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted sequence.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class MetricsRegistry:
+    """
+    In-process histograms and counters, keyed by metric name and tags.
+    """
+    def __init__(self, max_samples: int = None):
+        self.max_samples = max_samples or METRICS_MAX_SAMPLES
+        self._histograms: Dict[SeriesKey, Deque[float]] = {}
+        self._totals: Dict[SeriesKey, list] = {}  # [count, sum, min, max] over all samples, not just the kept ones
+        self._counters: Dict[SeriesKey, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, **tags) -> None:
+        key = _series_key(name, tags)
+        with self._lock:
+            samples = self._histograms.get(key)
+            if samples is None:
+                samples = self._histograms[key] = deque(maxlen=self.max_samples)
+                self._totals[key] = [0, 0.0, value, value]
+            samples.append(value)
+            totals = self._totals[key]
+            totals[0] += 1
+            totals[1] += value
+            totals[2] = min(totals[2], value)
+            totals[3] = max(totals[3], value)
+
+    def increment(self, name: str, value: float = 1, **tags) -> None:
+        key = _series_key(name, tags)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def snapshot(self, drop_tags: Tuple[str, ...] = ()) -> Dict[str, Any]:
+        """
+        Returns count, sum, min, max, mean and p50/p95/p99 per histogram series, and the counter totals.
+        Series that only differ in drop_tags (e.g. ("state",)) are merged.
+        """
+        def merged(key: SeriesKey) -> SeriesKey:
+            return key[0], tuple(tag for tag in key[1] if tag[0] not in drop_tags)
+
+        with self._lock:
+            histograms, counters = {}, {}
+            for key, samples in self._histograms.items():
+                values, totals = histograms.setdefault(merged(key), ([], [0, 0.0, None, None]))
+                values.extend(samples)
+                count, total, low, high = self._totals[key]
+                totals[0] += count
+                totals[1] += total
+                totals[2] = low if totals[2] is None else min(totals[2], low)
+                totals[3] = high if totals[3] is None else max(totals[3], high)
+            for key, value in self._counters.items():
+                counters[merged(key)] = counters.get(merged(key), 0) + value
+        for values, _ in histograms.values():
+            values.sort()
+        summary = {"histograms": {}, "counters": {_series_name(key): value for key, value in sorted(counters.items())}}
+        for key, (values, (count, total, low, high)) in sorted(histograms.items()):
+            summary["histograms"][_series_name(key)] = {
+                "count": count,
+                "sum": round(total, 3),
+                "min": round(low, 3),
+                "max": round(high, 3),
+                "mean": round(total / count, 3) if count else 0.0,
+                "p50": round(percentile(values, 50), 3),
+                "p95": round(percentile(values, 95), 3),
+                "p99": round(percentile(values, 99), 3),
+            }
+        return summary
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._totals.clear()
+            self._counters.clear()
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    return _registry
+
+
+def _emit(kind: str, name: str, value: float, tags: Dict[str, Any]) -> None:
+    if not METRICS_LOG:
+        return
+    record = {"metric": name, "type": kind, "value": round(value, 3) if isinstance(value, float) else value}
+    record.update({key: value for key, value in tags.items() if value is not None})
+    logger.info(f"Metric: {json.dumps(record)}", extra={"custom_dimensions": record})
+
+
+def observe(name: str, value: float, **tags) -> None:
+    _registry.observe(name, value, **tags)
+    _emit("histogram", name, value, tags)
+
+
+def increment(name: str, value: float = 1, **tags) -> None:
+    _registry.increment(name, value, **tags)
+    _emit("counter", name, value, tags)
+
+
+class timer:
+    """
+    Records how long a pipeline stage took as the stage_latency_ms histogram, tagged with the stage, the outcome
+    ("ok" or "error") and any extra tags. Works as a context manager and as a decorator:
+
+        with metrics.timer("llm", state=state):
+            ...
+
+        @metrics.timer("cosmos_write")
+        def flush(...):
+            ...
+    """
+    def __init__(self, stage: str, **tags):
+        self.stage = stage
+        self.tags = tags
+        self.elapsed = 0.0
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self._started
+        observe("stage_latency_ms", self.elapsed * 1000, stage=self.stage,
+                status="error" if exc_type else "ok", **self.tags)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(self.stage, **self.tags):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def _usage_value(usage: Any, field: str) -> int:
+    value = usage.get(field) if isinstance(usage, dict) else getattr(usage, field, None)
+    return int(value or 0)
+
+
+def record_tokens(usage: Any, **tags) -> Optional[Dict[str, int]]:
+    """
+    Records prompt, completion and total token counts from an OpenAI usage object (or dict).
+    Returns the counts, or None if there is no usage.
+    """
+    if usage is None:
+        return None
+    counts = {
+        "prompt_tokens": _usage_value(usage, "prompt_tokens"),
+        "completion_tokens": _usage_value(usage, "completion_tokens"),
+    }
+    counts["total_tokens"] = _usage_value(usage, "total_tokens") or counts["prompt_tokens"] + counts["completion_tokens"]
+    for field, value in counts.items():
+        _registry.increment(field, value, **tags)
+        _registry.observe(f"llm_{field}", value, **tags)
+    _emit("tokens", "llm_tokens", counts["total_tokens"], dict(tags, **counts))
+    return counts
+
+
+def record_cache(cache: str, outcome: str, **tags) -> None:
+    """
+    Counts a cache lookup, e.g. record_cache("llm", "local_hits").
+    """
+    increment("cache_lookups", cache=cache, outcome=outcome, **tags)
+
+
+def record_queue_lag(created_at: Optional[str], **tags) -> Optional[float]:
+    """
+    Records the time between a work item being created (its ISO 8601 created_at) and now, in seconds.
+    Timestamps without a timezone are treated as UTC, which is how messages queued before the switch to
+    timezone-aware timestamps carry them.
+    """
+    if not created_at:
+        return None
+    try:
+        created = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return None
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    lag = (datetime.now(timezone.utc) - created).total_seconds()
+    observe("queue_lag_seconds", lag, **tags)
+    return lag
+
+
+def snapshot(drop_tags: Tuple[str, ...] = ()) -> Dict[str, Any]:
+    return _registry.snapshot(drop_tags)
+
+
+def export(path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Writes the local percentile summary to `path` (default METRICS_EXPORT_PATH) as JSON and returns it.
+    """
+    summary = snapshot()
+    path = path or METRICS_EXPORT_PATH
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+
+def format_summary(summary: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Renders a snapshot as a plain-text table for load test output.
+    """
+    summary = summary or snapshot()
+    lines = [f"{'series':60} {'count':>7} {'p50':>10} {'p95':>10} {'p99':>10} {'max':>10}"]
+    for series, stats in summary["histograms"].items():
+        lines.append(f"{series[:60]:60} {stats['count']:>7} {stats['p50']:>10} {stats['p95']:>10} "
+                     f"{stats['p99']:>10} {stats['max']:>10}")
+    for series, value in summary["counters"].items():
+        lines.append(f"{series[:60]:60} {value:>7}")
+    return "\n".join(lines)
+
+
+if METRICS_EXPORT_PATH:
+    atexit.register(export)
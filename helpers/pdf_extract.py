@@ -0,0 +1,203 @@
+import io
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
+
+import fitz
+
+from helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
+# Document a worker process last extracted from, kept open for the following batches of the same file
+_worker_document = None
+_worker_path = None
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def select_pages(page_count: int, page_range: Optional[Tuple[int, int]] = None, max_pages: Optional[int] = None,
+                 first_n: Optional[int] = None, last_n: Optional[int] = None) -> List[int]:
+    """
+    Returns the 0-based page numbers to extract.
+
+    Parameters:
+        page_count (int): Number of pages in the document.
+        page_range (tuple): Optional (start, end) 1-based inclusive page range.
+        max_pages (int): Optional cap on the number of pages, applied last.
+        first_n (int), last_n (int): Keep only the first N and/or last N pages of the selection.
+    """
+    start, end = page_range if page_range else (1, page_count)
+    pages = list(range(max(start, 1) - 1, min(end, page_count)))
+
+    if first_n is not None or last_n is not None:
+        head = pages[:first_n or 0]
+        tail = pages[max(0, len(pages) - last_n):] if last_n else []
+        pages = sorted(set(head) | set(tail))
+
+    if max_pages is not None:
+        pages = pages[:max_pages]
+    return pages
+
+
+def page_selection_from_env() -> dict:
+    """
+    Page selection settings for triggers: PDF_MAX_PAGES, PDF_FIRST_PAGES and PDF_LAST_PAGES (unset = no limit).
+    """
+    def optional_int(name: str) -> Optional[int]:
+        value = os.getenv(name)
+        return int(value) if value else None
+
+    return {
+        "max_pages": optional_int("PDF_MAX_PAGES"),
+        "first_n": optional_int("PDF_FIRST_PAGES"),
+        "last_n": optional_int("PDF_LAST_PAGES"),
+    }
+
+
+def _extract_pages(path: str, page_numbers: List[int]) -> List[str]:
+    global _worker_document, _worker_path
+    if _worker_path != path:
+        if _worker_document is not None:
+            _worker_document.close()
+        _worker_document, _worker_path = fitz.open(path), path
+    return [_worker_document.load_page(page_number).get_text() for page_number in page_numbers]
+
+
+def get_pool(workers: int = None) -> ProcessPoolExecutor:
+    """
+    Returns the worker-wide extraction pool, started on first use with `workers` processes (PDF_WORKERS).
+
+    Workers come from a forkserver (spawn where that is unavailable) rather than fork: forking the host
+    process would copy its threads' locks and its Redis and HTTP connections into every worker.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                context = multiprocessing.get_context(method)
+                if method == "forkserver":
+                    context.set_forkserver_preload([__name__])
+                _pool = ProcessPoolExecutor(max_workers=workers or PDF_WORKERS, mp_context=context)
+    return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _spool(source: Union[str, bytes, BinaryIO]) -> Tuple[str, bool]:
+    """
+    Returns a file path for the PDF, copying streams to a temp file in fixed-size chunks.
+    The boolean says whether the caller owns (and must delete) the file.
+    """
+    if isinstance(source, str):
+        return source, False
+
+    handle = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+    with handle:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            handle.write(source)
+        else:
+            shutil.copyfileobj(source, handle, 1024 * 1024)
+    return handle.name, True
+
+
+def iter_pdf_pages(source: Union[str, bytes, BinaryIO], page_range: Optional[Tuple[int, int]] = None,
+                   max_pages: Optional[int] = None, first_n: Optional[int] = None, last_n: Optional[int] = None,
+                   workers: Optional[int] = None) -> Iterator[str]:
+    """
+    Yields the text of each selected page, in order, as soon as it is extracted.
+
+    Streams (e.g. a blob InputStream) are spooled to a temp file instead of being read into memory. Large
+    selections are extracted in the shared process pool (get_pool) in batches of PDF_PAGES_PER_TASK pages;
+    small ones inline.
+
+    Parameters:
+        source: A file path, the PDF bytes, or a binary file-like object.
+        page_range, max_pages, first_n, last_n: Page selection, see select_pages.
+        workers (int): Worker processes (PDF_WORKERS, defaults to the CPU count). Sizes the pool when it is
+            first started; after that it only sets how many batches this document keeps in flight.
+    """
+    # Extraction time is accumulated around the work itself, not the consumer's time between pages
+    busy, pages = 0.0, 0
+    started = time.perf_counter()
+    path, owned = _spool(source)
+    busy += time.perf_counter() - started
+    try:
+        with fitz.open(path) as document:
+            page_numbers = select_pages(document.page_count, page_range, max_pages, first_n, last_n)
+            workers = workers or PDF_WORKERS
+            if workers <= 1 or len(page_numbers) < PDF_PARALLEL_MIN_PAGES:
+                for page_number in page_numbers:
+                    started = time.perf_counter()
+                    text = document.load_page(page_number).get_text()
+                    busy += time.perf_counter() - started
+                    pages += 1
+                    yield text
+                return
+
+        batches = [page_numbers[i:i + PDF_PAGES_PER_TASK] for i in range(0, len(page_numbers), PDF_PAGES_PER_TASK)]
+        pool = get_pool(workers)
+        # Keep a bounded window of batches in flight and yield them back in page order
+        in_flight = [pool.submit(_extract_pages, path, batch) for batch in batches[:workers * 2]]
+        next_batch = len(in_flight)
+        try:
+            while in_flight:
+                started = time.perf_counter()
+                texts = in_flight.pop(0).result()
+                busy += time.perf_counter() - started
+                pages += len(texts)
+                if next_batch < len(batches):
+                    in_flight.append(pool.submit(_extract_pages, path, batches[next_batch]))
+                    next_batch += 1
+                yield from texts
+        except BrokenProcessPool:
+            _discard_pool(pool)  # A worker died; the next document starts a fresh pool
+            raise
+        finally:
+            # The consumer may stop early: drop the batches not started and let the running ones finish
+            # before the temp file is removed
+            for future in in_flight:
+                future.cancel()
+            for future in in_flight:
+                if not future.cancelled():
+                    future.exception()
+    finally:
+        metrics.observe("stage_latency_ms", busy * 1000, stage="pdf_extract")
+        metrics.observe("pdf_pages", pages)
+        if owned:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not remove temp file {path}: {e}")
+
+
+def extract_pdf_text(source: Union[str, bytes, BinaryIO], separator: str = "", **kwargs) -> str:
+    """
+    Returns the text of the selected pages as one string, built with a StringIO rather than repeated +=.
+    Accepts the same keyword arguments as iter_pdf_pages.
+    """
+    buffer = io.StringIO()
+    for i, text in enumerate(iter_pdf_pages(source, **kwargs)):
+        if i and separator:
+            buffer.write(separator)
+        buffer.write(text)
+    return buffer.getvalue()
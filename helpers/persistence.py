@@ -0,0 +1,206 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from helpers import metrics
+from helpers.llm_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Fixed namespace so the same (state, source, content) always maps to the same document id
+DOCUMENT_NAMESPACE = uuid.UUID("5b8f0c2e-3d4a-4f7e-9a61-2c1d8e0b7a44")
+
+PERSISTENCE_MODE = os.getenv("PERSISTENCE_MODE", "source")  # "source" or "change"
+PERSISTENCE_BATCH_SIZE = int(os.getenv("PERSISTENCE_BATCH_SIZE", "100"))
+PERSISTENCE_FLUSH_SECONDS = float(os.getenv("PERSISTENCE_FLUSH_SECONDS", "5"))
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class ContentHasher:
+    """
+    Hashes a document incrementally while it streams past, e.g. PDF pages on their way to the LLM.
+    """
+    def __init__(self):
+        self._digest = hashlib.sha256()
+
+    def update(self, text: str) -> None:
+        self._digest.update(normalize_text(text).encode("utf-8"))
+        self._digest.update(b"\n")
+
+    def wrap(self, pages: Iterable[str]) -> Iterator[str]:
+        for page in pages:
+            self.update(page)
+            yield page
+
+    def hexdigest(self) -> str:
+        return self._digest.hexdigest()
+
+
+def document_id(*parts: Any) -> str:
+    """
+    Deterministic id from its parts, so replays and re-crawls upsert the same document instead of adding one.
+    """
+    return str(uuid.uuid5(DOCUMENT_NAMESPACE, "|".join(str(part).strip().lower() for part in parts)))
+
+
+def build_documents(state: str, source: str, json_response: Any, content_sha: str, created_at: Optional[str] = None,
+                    depth: Any = "", scraped_urls: str = "", mode: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Builds the Cosmos DB documents for one extracted source.
+
+    Parameters:
+        state (str): The state the source belongs to.
+        source (str): The source identifier, e.g. the URL or "blob: states/PA/file.pdf".
+        json_response: The extracted changes (a list of TaxChange dicts).
+        content_sha (str): Hash of the source content; part of every id so changed content gets new documents.
+        mode (str): "source" for one document per source (the original layout) or "change" for one document
+            per TaxChange. Defaults to PERSISTENCE_MODE.
+    """
+    mode = mode or PERSISTENCE_MODE
+    created_at = created_at or datetime.now(timezone.utc).isoformat()
+
+    if mode == "change":
+        changes = json_response if isinstance(json_response, list) else [json_response] if json_response else []
+        return [{
+            "id": document_id(state, source, content_sha, change.get("category", ""), change.get("subcategory", "")),
+            "state": state,
+            "url": source,
+            "created_at": created_at,
+            "depth": depth,
+            "content_hash": content_sha,
+            "change": change,
+        } for change in changes]
+
+    return [{
+        "id": document_id(state, source, content_sha),
+        "state": state,
+        "url": source,
+        "created_at": created_at,
+        "depth": depth,
+        "content_hash": content_sha,
+        "llm_response": json_response,
+        "scraped_urls": scraped_urls
+    }]
+
+
+class BindingSink:
+    """
+    Sink for a Cosmos DB output binding. A binding can only be set once per invocation, so documents are
+    collected and written together when the writer is closed; the binding upserts them by id.
+    """
+    def __init__(self, output):
+        self.output = output
+        self.documents = []
+
+    def write(self, documents: List[Dict[str, Any]]) -> None:
+        self.documents.extend(documents)
+
+    def close(self) -> None:
+        if self.documents:
+            import azure.functions as func
+            self.output.set(func.DocumentList([func.Document.from_dict(document) for document in self.documents]))
+
+
+class ContainerSink:
+    """
+    Sink that upserts straight into a Cosmos DB container with the azure-cosmos SDK, concurrently per flush.
+    """
+    def __init__(self, container, max_workers: int = 8):
+        self.container = container
+        self.max_workers = max_workers
+
+    def write(self, documents: List[Dict[str, Any]]) -> None:
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(self.container.upsert_item, documents))
+
+    def close(self) -> None:
+        pass
+
+
+_container = None
+_container_lock = threading.Lock()
+
+
+def get_cosmos_container(database_name: str = "dfas", container_name: str = "items"):
+    """
+    Returns a shared azure-cosmos container client built from COSMOS_DB_CONNECTION.
+    """
+    global _container
+    if _container is None:
+        with _container_lock:
+            if _container is None:
+                from azure.cosmos import CosmosClient
+                client = CosmosClient.from_connection_string(os.getenv("COSMOS_DB_CONNECTION"))
+                _container = client.get_database_client(database_name).get_container_client(container_name)
+    return _container
+
+
+class DocumentWriter:
+    """
+    Buffers documents and flushes them to a sink in bulk, when the buffer reaches max_batch documents or
+    the oldest buffered document is older than max_interval seconds. Documents with the same id in one
+    buffer are collapsed, keeping the last one. Used as a context manager, the rest is flushed on exit
+    unless the block raised.
+    """
+    def __init__(self, sink, max_batch: int = None, max_interval: float = None):
+        self.sink = sink
+        self.max_batch = max_batch or PERSISTENCE_BATCH_SIZE
+        self.max_interval = PERSISTENCE_FLUSH_SECONDS if max_interval is None else max_interval
+        self._buffer: Dict[str, Dict[str, Any]] = {}
+        self._first_added = None
+        self._lock = threading.Lock()
+        self.written = 0
+
+    def add(self, documents: Iterable[Dict[str, Any]]) -> None:
+        with self._lock:
+            for document in documents:
+                self._buffer[document["id"]] = document
+            if self._buffer and self._first_added is None:
+                self._first_added = time.monotonic()
+            due = len(self._buffer) >= self.max_batch or (
+                self._first_added is not None and time.monotonic() - self._first_added >= self.max_interval)
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            documents = list(self._buffer.values())
+            self._buffer.clear()
+            self._first_added = None
+        if documents:
+            with metrics.timer("cosmos_write", sink=type(self.sink).__name__):
+                self.sink.write(documents)
+            self.written += len(documents)
+            logger.info(f"Flushed {len(documents)} document(s) to Cosmos DB")
+
+    def close(self) -> None:
+        self.flush()
+        self.sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Flush only when the body succeeded: the caller retries the failed work, and a binding sink must
+        # not be set for an invocation that is about to fail
+        if exc_type is None:
+            self.close()
+
+
+def create_writer(output=None) -> DocumentWriter:
+    """
+    Returns a writer for the configured sink: the function's Cosmos DB output binding (default) or, with
+    PERSISTENCE_SINK=sdk, direct bulk upserts through azure-cosmos.
+    """
+    if os.getenv("PERSISTENCE_SINK", "binding").lower() == "sdk" or output is None:
+        return DocumentWriter(ContainerSink(get_cosmos_container()))
+    return DocumentWriter(BindingSink(output))
@@ -0,0 +1,363 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+# Screen documents locally before they are sent to the LLM
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "true").lower() == "true"
+# Keyword score a document needs to be sent to the LLM (sum of term weights, each term counted at most 3 times)
+PREFILTER_MIN_SCORE = float(os.getenv("PREFILTER_MIN_SCORE", "4"))
+# Distinct terms a document needs, so one repeated word (e.g. "employer" in a footer) does not qualify it
+PREFILTER_MIN_TERMS = int(os.getenv("PREFILTER_MIN_TERMS", "2"))
+# Paragraphs kept on each side of a matching paragraph when a document is shrunk
+PREFILTER_CONTEXT_PARAGRAPHS = int(os.getenv("PREFILTER_CONTEXT_PARAGRAPHS", "1"))
+# Pages (or plain documents) shorter than this are sent whole; longer ones are cut down to the relevant paragraphs
+PREFILTER_SHRINK_MIN_CHARS = int(os.getenv("PREFILTER_SHRINK_MIN_CHARS", "3000"))
+# JSON file with extra terms: {"*": {"term": weight, ...}, "PA": {...}}. A trailing * matches any word ending.
+PREFILTER_TERMS_PATH = os.getenv("PREFILTER_TERMS_PATH")
+# Optional local classifier: JSON {"bias": float, "weights": {"token": float}, "threshold": float}
+PREFILTER_CLASSIFIER_PATH = os.getenv("PREFILTER_CLASSIFIER_PATH")
+
+_MAX_COUNT_PER_TERM = 3
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_TOKEN = re.compile(r"[a-z][a-z0-9'-]+")
+
+# Terms from the categories in llm_prompt.md. A trailing * matches any word ending (withhold* -> withholding).
+DEFAULT_TERMS: Dict[str, float] = {
+    # Strong signals: payroll tax vocabulary
+    "payroll tax*": 3, "withhold*": 3, "unemployment compensation": 3, "unemployment insurance": 3,
+    "taxable wage*": 3, "wage base": 3, "workers' compensation": 3, "workers compensation": 3,
+    "income tax": 3, "tax credit*": 3, "cafeteria plan*": 3, "section 125": 3, "fringe benefit*": 3,
+    "health savings account*": 3, "medical savings account*": 3, "flexible spending account*": 3,
+    "stock option*": 3, "incentive stock option*": 3, "alternative minimum tax": 3, "tuition reimbursement": 3,
+    "educational assistance": 3, "student loan repayment": 3, "disability benefit*": 3, "mileage rate*": 3,
+    "garnish*": 3, "wage attachment*": 3, "child support withholding": 3, "income withholding order*": 3,
+    "earned income tax": 3, "local services tax": 3, "tax rate*": 3, "contribution rate*": 3,
+    # Supporting context
+    "employer*": 1, "employee*": 1, "payroll": 1.5, "wage*": 1, "compensation": 1, "taxable": 1.5,
+    "tax year": 1.5, "effective date": 1, "effective for": 1, "retirement": 1, "pension*": 1, "annuit*": 1,
+    "401(k)": 2, "roth": 1, "dependent care": 2, "child care": 1, "commuter benefit*": 2, "transit pass*": 2,
+    "reimburse*": 1, "w-2": 2, "w-4": 2, "department of revenue": 1.5, "legislation": 1, "bill": 0.5,
+}
+
+# State-specific programs and agencies, added to DEFAULT_TERMS for that state
+STATE_TERMS: Dict[str, Dict[str, float]] = {
+    "PA": {"uc fund": 3, "pa uc": 3, "act 32": 2, "pa-40": 2},
+    "NY": {"mctmt": 3, "metropolitan commuter transportation mobility tax": 3, "paid family leave": 3, "nys-45": 2},
+    "CA": {"state disability insurance": 3, "sdi": 2, "edd": 1.5, "de 9": 2, "employment training tax": 3},
+    "NJ": {"family leave insurance": 3, "temporary disability insurance": 3, "nj-927": 2},
+    "WA": {"paid family and medical leave": 3, "wa cares": 3, "long-term services and supports": 3},
+    "MA": {"paid family and medical leave": 3, "pfml": 3, "massachusetts health insurance": 2},
+    "OR": {"statewide transit tax": 3, "paid leave oregon": 3},
+}
+
+
+class ScreenResult(BaseModel):
+    """
+    Outcome of screening one document.
+    """
+    relevant: bool = False
+    score: float = 0.0
+    matched_terms: Dict[str, int] = Field(default_factory=dict)
+    classifier_score: Optional[float] = None
+    pages: int = 0
+    original_chars: int = 0
+    kept_chars: int = 0
+    reason: str = ""
+
+    @property
+    def shrunk(self) -> bool:
+        return self.relevant and self.kept_chars < self.original_chars
+
+
+def _load_term_file() -> Dict[str, Dict[str, float]]:
+    if not PREFILTER_TERMS_PATH:
+        return {}
+    try:
+        with open(PREFILTER_TERMS_PATH, "r", encoding="utf-8") as f:
+            return {key.upper() if key != "*" else key: value for key, value in json.load(f).items()}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not load prefilter terms from '{PREFILTER_TERMS_PATH}': {e}")
+        return {}
+
+
+def get_terms(state: str) -> Dict[str, float]:
+    """
+    Returns the weighted terms for a state: the defaults, the state's own terms and any from PREFILTER_TERMS_PATH.
+    """
+    state = state.strip().upper()
+    extra = _load_term_file()
+    terms = dict(DEFAULT_TERMS)
+    terms.update(extra.get("*", {}))
+    terms.update(STATE_TERMS.get(state, {}))
+    terms.update(extra.get(state, {}))
+    return {term.lower(): float(weight) for term, weight in terms.items() if weight}
+
+
+def _trie_pattern(terms: Iterable[str]) -> str:
+    """
+    Builds a regex from a character trie of the terms, so shared prefixes are matched once and the longest
+    term wins ("tax" / "tax rate" -> "tax(?:\\s+rate|(?!\\w))"). Spaces in terms match any run of whitespace,
+    plain terms end at a word boundary and terms ending in * take any word ending.
+    """
+    trie: dict = {}
+    for term in terms:
+        node = trie
+        for ch in term.rstrip("*"):
+            node = node.setdefault(ch, {})
+        node["*" if term.endswith("*") else ""] = None
+
+    def build(node: dict) -> str:
+        alternatives = [(r"\s+" if ch == " " else re.escape(ch)) + build(child)
+                        for ch, child in sorted(node.items()) if ch not in ("", "*")]
+        if "*" in node:
+            alternatives.append(r"\w*")
+        elif "" in node:
+            alternatives.append(r"(?!\w)")
+        return alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+
+    return build(trie)
+
+
+class TermMatcher:
+    """
+    Scores text against a weighted term dictionary with a single compiled trie regex.
+    """
+    def __init__(self, terms: Dict[str, float]):
+        self.weights = {term.rstrip("*"): weight for term, weight in terms.items()}
+        self.prefixes = {term[:-1] for term in terms if term.endswith("*")}
+        self.pattern = re.compile(r"(?<!\w)" + _trie_pattern(terms), re.IGNORECASE) if terms else None
+
+    def _term(self, matched: str) -> str:
+        matched = " ".join(matched.lower().split())
+        if matched in self.weights:
+            return matched
+        # A prefix term with a word ending ("withholding" -> "withhold")
+        for end in range(len(matched) - 1, 0, -1):
+            if matched[:end] in self.prefixes:
+                return matched[:end]
+        return matched
+
+    def count(self, text: str) -> Counter:
+        counts: Counter = Counter()
+        if self.pattern is None or not text:
+            return counts
+        for match in self.pattern.finditer(text):
+            counts[self._term(match.group())] += 1
+        return counts
+
+    def score(self, counts: Counter) -> float:
+        return sum(self.weights.get(term, 0.0) * min(count, _MAX_COUNT_PER_TERM) for term, count in counts.items())
+
+
+@lru_cache(maxsize=64)
+def get_matcher(state: str) -> TermMatcher:
+    return TermMatcher(get_terms(state))
+
+
+class LinearClassifier:
+    """
+    Minimal local relevance classifier: logistic regression over log token counts, loaded from JSON
+    ({"bias": float, "weights": {"token": float}, "threshold": float}).
+    """
+    def __init__(self, weights: Dict[str, float], bias: float = 0.0, threshold: float = 0.5):
+        self.weights = weights
+        self.bias = bias
+        self.threshold = threshold
+
+    @classmethod
+    def load(cls, path: str) -> "LinearClassifier":
+        with open(path, "r", encoding="utf-8") as f:
+            model = json.load(f)
+        return cls(model["weights"], model.get("bias", 0.0), model.get("threshold", 0.5))
+
+    def predict(self, text: str) -> float:
+        counts = Counter(token for token in _TOKEN.findall(text.lower()) if token in self.weights)
+        z = self.bias + sum(self.weights[token] * math.log1p(count) for token, count in counts.items())
+        return 1 / (1 + math.exp(-max(-50.0, min(50.0, z))))
+
+
+_classifier = None
+_classifier_loaded = False
+_classifier_lock = threading.Lock()
+
+
+def get_classifier() -> Optional[LinearClassifier]:
+    """
+    Returns the classifier from PREFILTER_CLASSIFIER_PATH, or None if none is configured or it fails to load.
+    """
+    global _classifier, _classifier_loaded
+    if not _classifier_loaded:
+        with _classifier_lock:
+            if not _classifier_loaded:
+                if PREFILTER_CLASSIFIER_PATH:
+                    try:
+                        _classifier = LinearClassifier.load(PREFILTER_CLASSIFIER_PATH)
+                    except (OSError, ValueError, KeyError) as e:
+                        logger.warning(f"Prefilter classifier unavailable, using keywords only: {e}")
+                _classifier_loaded = True
+    return _classifier
+
+
+def select_paragraphs(paragraphs: List[str], scores: List[float], context: int) -> str:
+    """
+    Keeps the paragraphs that scored, plus `context` paragraphs on each side. Gaps are marked with "[...]".
+    """
+    keep = set()
+    for index, score in enumerate(scores):
+        if score > 0:
+            keep.update(range(max(0, index - context), min(len(paragraphs), index + context + 1)))
+    parts, previous = [], None
+    for index in sorted(keep):
+        if previous is not None and index != previous + 1:
+            parts.append("[...]")
+        parts.append(paragraphs[index])
+        previous = index
+    return "\n\n".join(parts)
+
+
+class PageScreen:
+    """
+    Screens a document page by page, as the pages stream past on their way to the LLM.
+
+    Pages without matching terms are dropped (as empty pages, so page numbers stay right), long pages are cut
+    down to their relevant paragraphs, and a page the classifier accepts is kept whole. Nothing is passed on until
+    the document has reached the keyword thresholds, and if it never does the LLM sees nothing at all. Only the
+    kept text is held back while undecided, never whole pages.
+
+        screen = PageScreen(state, source="blob")
+        call_llm_api_chunked(screen.filter(pages), state)
+        if not screen.result.relevant:
+            ...
+    """
+    def __init__(self, state: str, source: str = "document", min_score: Optional[float] = None,
+                 min_terms: Optional[int] = None, context: Optional[int] = None, shrink_min_chars: Optional[int] = None):
+        self.state = state
+        self.source = source
+        self.min_score = PREFILTER_MIN_SCORE if min_score is None else min_score
+        self.min_terms = PREFILTER_MIN_TERMS if min_terms is None else min_terms
+        self.context = PREFILTER_CONTEXT_PARAGRAPHS if context is None else context
+        self.shrink_min_chars = PREFILTER_SHRINK_MIN_CHARS if shrink_min_chars is None else shrink_min_chars
+        self.matcher = get_matcher(state)
+        self.classifier = get_classifier()
+        self.result = ScreenResult()
+        self._counts: Counter = Counter()
+        self._accepted_by_classifier = False
+
+    def _screen_page(self, page: str) -> str:
+        self.result.pages += 1
+        self.result.original_chars += len(page)
+        paragraphs = [paragraph for paragraph in _PARAGRAPH_BREAK.split(page) if paragraph.strip()]
+        paragraph_counts = [self.matcher.count(paragraph) for paragraph in paragraphs]
+        for counts in paragraph_counts:
+            self._counts.update(counts)
+
+        if self.classifier is not None:
+            probability = self.classifier.predict(page)
+            self.result.classifier_score = max(self.result.classifier_score or 0.0, probability)
+            if probability >= self.classifier.threshold:
+                self._accepted_by_classifier = True
+                return page
+        if not any(paragraph_counts):
+            return ""
+        if len(page) < self.shrink_min_chars:
+            return page
+        return select_paragraphs(paragraphs, [self.matcher.score(counts) for counts in paragraph_counts], self.context)
+
+    def _passes(self) -> bool:
+        return self._accepted_by_classifier or (
+            self.matcher.score(self._counts) >= self.min_score and len(self._counts) >= self.min_terms)
+
+    def filter(self, pages: Iterable[str]) -> Iterator[str]:
+        if not PREFILTER_ENABLED:
+            self.result.relevant = True
+            self.result.reason = "prefilter disabled"
+            for page in pages:
+                self.result.pages += 1
+                self.result.original_chars += len(page or "")
+                self.result.kept_chars += len(page or "")
+                yield page
+            return
+
+        held: List[str] = []
+        for page in pages:
+            kept = self._screen_page(page or "")
+            if self.result.relevant:
+                self.result.kept_chars += len(kept)
+                yield kept
+                continue
+            held.append(kept)
+            if self._passes():
+                self.result.relevant = True
+                for page_text in held:
+                    self.result.kept_chars += len(page_text)
+                    yield page_text
+                held.clear()
+        self._finish()
+
+    def _finish(self) -> None:
+        result = self.result
+        result.score = round(self.matcher.score(self._counts), 2)
+        result.matched_terms = dict(self._counts.most_common())
+        if not result.relevant:
+            result.reason = (f"keyword score {result.score} < {self.min_score} or {len(self._counts)} distinct "
+                             f"term(s) < {self.min_terms}" + (f", classifier {result.classifier_score:.2f}"
+                                                              if result.classifier_score is not None else ""))
+        record(result, self.state, self.source)
+
+
+def screen(text: Optional[str], state: str, source: str = "document", **kwargs) -> Tuple[ScreenResult, str]:
+    """
+    Screens a whole document. Returns the result and the text to send to the LLM (empty when not relevant).
+
+    Parameters:
+        text (str): The document text.
+        state (str): The state whose term dictionary is used.
+        source (str): Tag for the skip-rate metrics, e.g. "queue" or "blob".
+        **kwargs: Threshold overrides passed to PageScreen.
+    """
+    page_screen = PageScreen(state, source=source, **kwargs)
+    kept = "".join(page_screen.filter([text or ""]))
+    return page_screen.result, kept
+
+
+_stats_lock = threading.Lock()
+_stats = Counter()
+
+
+def record(result: ScreenResult, state: str, source: str) -> None:
+    """
+    Counts a screened document in helpers.metrics and in the local totals behind get_stats().
+    """
+    outcome = "skipped" if not result.relevant else "shrunk" if result.shrunk else "passed"
+    metrics.increment("prefilter_documents", outcome=outcome, source=source, state=state)
+    if result.original_chars:
+        metrics.observe("prefilter_kept_ratio", result.kept_chars / result.original_chars, source=source)
+    with _stats_lock:
+        _stats["documents"] += 1
+        _stats[outcome] += 1
+        _stats["original_chars"] += result.original_chars
+        _stats["kept_chars"] += result.kept_chars
+
+
+def get_stats() -> Dict[str, float]:
+    """
+    Returns the documents screened by this worker so far, by outcome, with the skip rate and the share of
+    characters that still went to the LLM.
+    """
+    with _stats_lock:
+        stats = {key: _stats[key] for key in ("documents", "skipped", "shrunk", "passed", "original_chars", "kept_chars")}
+    stats["skip_rate"] = round(stats["skipped"] / stats["documents"], 4) if stats["documents"] else 0.0
+    stats["kept_ratio"] = round(stats["kept_chars"] / stats["original_chars"], 4) if stats["original_chars"] else 0.0
+    return stats
@@ -0,0 +1,175 @@
+import io
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+QUEUE_NAME = "url-job-q"
+# "storage" for the Azure Storage queue or "redis_stream" for the Redis stream in helpers.redis_streams
+QUEUE_BACKEND = os.getenv("QUEUE_BACKEND", "storage").lower()
+FANOUT_URLS_PER_MESSAGE = int(os.getenv("FANOUT_URLS_PER_MESSAGE", "10"))
+FANOUT_MAX_WORKERS = int(os.getenv("FANOUT_MAX_WORKERS", "16"))
+# Storage queue messages are limited to 64 KB after base64 encoding
+MAX_MESSAGE_BYTES = 48 * 1024
+
+
+class FanoutError(RuntimeError):
+    """
+    Raised by send_items when some messages could not be sent. The others were sent; `unsent` holds the
+    single-URL items of the failed messages so the caller can retry or release just those.
+    """
+    def __init__(self, message: str, sent: int, unsent: List[Dict[str, Any]]):
+        super().__init__(message)
+        self.sent = sent
+        self.unsent = unsent
+
+
+def make_queue_item(state: str, url: str, depth: int = 0) -> Dict[str, Any]:
+    return {
+        "state": state,
+        "url": url,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "depth": depth
+    }
+
+
+def iter_url_lines(stream: BinaryIO, encoding: str = "utf-8") -> Iterator[str]:
+    """
+    Yields the non-empty, non-comment lines of a URL list blob without reading the whole blob into memory.
+    """
+    for line in io.TextIOWrapper(stream, encoding=encoding, errors="replace"):
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def batch_messages(items: Iterable[Dict[str, Any]], urls_per_message: int = None) -> Iterator[str]:
+    """
+    Packs queue items into compact JSON messages.
+
+    Consecutive items with the same state and depth share one message of the form
+    {"state", "urls": [...], "created_at", "depth"}, up to urls_per_message URLs and MAX_MESSAGE_BYTES.
+    With urls_per_message=1 every item is sent in the original single-URL format.
+    """
+    urls_per_message = urls_per_message or FANOUT_URLS_PER_MESSAGE
+    if urls_per_message <= 1:
+        for item in items:
+            yield json.dumps(item)
+        return
+
+    current, size = None, 0
+    for item in items:
+        url_size = len(item["url"]) + 4
+        if current is not None and (
+                (current["state"], current["depth"]) != (item["state"], item["depth"])
+                or len(current["urls"]) >= urls_per_message
+                or size + url_size > MAX_MESSAGE_BYTES):
+            yield json.dumps(current)
+            current = None
+        if current is None:
+            current = {"state": item["state"], "urls": [], "created_at": item["created_at"], "depth": item["depth"]}
+            size = 128
+        current["urls"].append(item["url"])
+        size += url_size
+    if current is not None:
+        yield json.dumps(current)
+
+
+def expand_payload(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Turns a (possibly batched) queue payload back into single-URL payloads.
+    """
+    if "urls" not in payload:
+        return [payload]
+    base = {key: value for key, value in payload.items() if key != "urls"}
+    return [dict(base, url=url) for url in payload["urls"]]
+
+
+_queue_clients = {}
+_queue_clients_lock = threading.Lock()
+
+
+def get_queue_client(queue_name: str = QUEUE_NAME, connection_setting: str = "STORAGE_CONNECTION"):
+    """
+    Returns a QueueClient shared by the worker process for the given queue. Messages are base64 encoded,
+    which is what the Functions queue trigger expects by default.
+    """
+    key = (queue_name, connection_setting)
+    client = _queue_clients.get(key)
+    if client is None:
+        with _queue_clients_lock:
+            client = _queue_clients.get(key)
+            if client is None:
+                from azure.storage.queue import QueueClient, TextBase64EncodePolicy
+                client = QueueClient.from_connection_string(
+                    conn_str=os.getenv(connection_setting),
+                    queue_name=queue_name,
+                    message_encode_policy=TextBase64EncodePolicy()
+                )
+                _queue_clients[key] = client
+    return client
+
+
+def send_items(items: Iterable[Dict[str, Any]], queue_name: str = QUEUE_NAME, urls_per_message: int = None,
+               max_workers: int = None) -> int:
+    """
+    Batches queue items into messages and sends them concurrently on a pooled QueueClient.
+
+    Items are consumed lazily and at most 2 x max_workers messages are in flight, so arbitrarily large
+    iterables (e.g. a URL blob read line by line) use constant memory.
+
+    With QUEUE_BACKEND=redis_stream the messages are appended to the Redis stream instead.
+
+    Returns the number of messages sent.
+
+    Raises:
+        FanoutError: If any message could not be sent to the Storage queue, after the rest were sent.
+    """
+    if QUEUE_BACKEND == "redis_stream":
+        from helpers.redis_streams import add_messages
+        return add_messages(batch_messages(items, urls_per_message))
+
+    max_workers = max_workers or FANOUT_MAX_WORKERS
+    client = get_queue_client(queue_name)
+    sent, failed = 0, []
+    in_flight = {}  # future -> message
+
+    def collect(done) -> None:
+        nonlocal sent
+        for future in done:
+            message = in_flight.pop(future)
+            try:
+                future.result()
+                sent += 1
+            except Exception as e:
+                failed.append(message)
+                logger.error(f"Failed to send message to queue '{queue_name}': {e}")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for message in batch_messages(items, urls_per_message):
+            in_flight[executor.submit(client.send_message, message)] = message
+            if len(in_flight) >= max_workers * 2:
+                collect(wait(in_flight, return_when=FIRST_COMPLETED)[0])
+        collect(wait(in_flight)[0])
+
+    logger.info(f"Sent {sent} messages to queue '{queue_name}'" + (f", {len(failed)} failed" if failed else ""))
+    if failed:
+        raise FanoutError(f"{len(failed)} of {sent + len(failed)} messages could not be sent to queue '{queue_name}'",
+                          sent, [item for message in failed for item in expand_payload(json.loads(message))])
+    return sent
+
+
+def set_output_messages(output, items: Iterable[Dict[str, Any]], urls_per_message: int = None) -> int:
+    """
+    Writes batched messages through a list-typed queue output binding (func.Out[List[str]]).
+    Returns the number of messages.
+    """
+    messages = list(batch_messages(items, urls_per_message))
+    if messages:
+        output.set(messages)
+    return len(messages)
@@ -0,0 +1,322 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+import helpers.crawl_frontier
+import helpers.fetch_store
+import helpers.fetcher
+import helpers.llm
+import helpers.metrics
+import helpers.persistence
+import helpers.prefilter
+import helpers.queue_fanout
+
+
+# Plain HTTP fetch (pooled session, timeouts, HTML-to-text) without escalating to Selenium.
+def get_url_content(url):
+    result = helpers.fetcher.fetch(url, allow_selenium=False)
+    if result.error:
+        logging.error(f"Failed to fetch {url}: {result.error}")
+        return None
+    return result.text  # Return the text content of the page
+
+
+QUEUE_BATCH_SIZE = int(os.getenv("QUEUE_BATCH_SIZE", "32"))  # Payloads per round of concurrent processing
+QUEUE_MAX_CONCURRENCY = int(os.getenv("QUEUE_MAX_CONCURRENCY", "4"))  # Payloads fetched/extracted at once
+
+
+class QueuePayload(BaseModel):
+    """
+    A single-URL work item from the queue.
+    """
+    state: str
+    url: str
+    created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    depth: int = 0
+
+    @field_validator("state")
+    @classmethod
+    def strip_state(cls, value: str) -> str:
+        return value.strip()  # Case is kept: the state is stored on the documents as the message gave it
+
+    @field_validator("url")
+    @classmethod
+    def strip_url(cls, value: str) -> str:
+        return value.strip()
+
+
+class PayloadResult(BaseModel):
+    """
+    What processing one payload produced: documents to store, links to crawl next and the fetch to remember.
+    """
+    payload: QueuePayload
+    cosmos_docs: List[dict] = Field(default_factory=list)
+    next_urls: List[str] = Field(default_factory=list)
+    fetched: helpers.fetcher.FetchResult
+
+
+class BatchOutcome(BaseModel):
+    processed: List[helpers.fetcher.FetchResult] = Field(default_factory=list)
+    unchanged: int = 0
+    invalid: int = 0
+    failed: List[Tuple[str, str]] = Field(default_factory=list)  # (url, error)
+    enqueued: int = 0
+
+    def raise_for_failures(self) -> None:
+        """
+        Raises if any URL failed, so the message is retried. Call it after the documents are written and the
+        processed pages' fetch metadata is saved: the retry then skips those pages as unchanged and only the
+        failed URLs are extracted again.
+        """
+        if self.failed:
+            raise RuntimeError(f"{len(self.failed)} URL(s) failed: {self.failed}")
+
+
+class PreparedPayload(BaseModel):
+    """
+    A payload fetched and screened, waiting for extraction. prompt_text is None when the prefilter skipped it.
+    """
+    payload: QueuePayload
+    fetched: helpers.fetcher.FetchResult
+    body: str = ""
+    prompt_text: Optional[str] = None
+    next_urls: List[str] = Field(default_factory=list)
+
+
+def prepare_payload(payload: QueuePayload, frontier: Optional[helpers.crawl_frontier.Frontier] = None) -> Optional[PreparedPayload]:
+    """
+    Fetches and screens a single-URL queue payload and collects its follow-up links.
+
+    Returns None when the content is unchanged since the last crawl. Raises when the page could not be fetched.
+    """
+    logging.info(f"Parsed message: State = {payload.state}, URL = {payload.url}, Created at = {payload.created_at}, Depth = {payload.depth}")
+
+    """
+    No longer needed. Superceded by getting Body content and URLs in one go, below.
+    logging.info(f"Scrapping URL: {payload['url']}")
+    page_content = helpers.web_scraper.WebScraper().scrape_url(payload['url'])
+    logging.info(f"Scraped content length: {len(page_content)}")
+    """
+    logging.info(f"Scraped Content AND URLs...")
+
+    urls, next_urls = [], []
+    # Conditional fetch: skip the LLM call and Cosmos write when the page has not changed since the last crawl
+    fetch_metadata = helpers.fetch_store.get_metadata(payload.url)
+    conditional_headers = helpers.fetch_store.conditional_headers(fetch_metadata)
+
+    if payload.depth == 0:
+        # Static pages are served by the HTTP tier; Selenium is only used when the page needs JavaScript
+        fetched = helpers.fetcher.fetch(payload.url, headers=conditional_headers)
+        urls = fetched.links
+        logging.info(f"Fetch tier: {fetched.tier}, escalation: {fetched.escalation_reason}, elapsed: {fetched.elapsed}s")
+    else:
+        # Plain HTTP only at depth 1
+        fetched = helpers.fetcher.fetch(payload.url, allow_selenium=False, headers=conditional_headers)
+    if fetched.error:
+        raise RuntimeError(f"Fetch failed: {fetched.error}")
+    if helpers.fetch_store.is_unchanged(fetch_metadata, fetched):
+        logging.info(f"Content unchanged since last crawl, skipping: {payload.url}")
+        return None
+    body = fetched.text
+
+    # Screen the page locally first: navigation and contact pages never reach the LLM, long pages are cut
+    # down to their relevant paragraphs. Links are still followed from skipped pages.
+    screened, prompt_text = helpers.prefilter.screen(body, payload.state, source="queue")
+    if not screened.relevant:
+        logging.info(f"Prefilter skipped {payload.url}: {screened.reason}")
+        prompt_text = None
+
+    # Collect the page's new, relevant links to queue one level deeper. Off unless ENQUEUE_LINKS=true.
+    if payload.depth == 0 and len(urls) > 1 and os.getenv("ENQUEUE_LINKS", "false").lower() == "true":
+        frontier = frontier or helpers.crawl_frontier.Frontier(payload.state)
+        next_urls = frontier.filter_links(urls, payload.url, payload.depth)
+
+    logging.info(f"# of Scraped Links: {len(urls)}")
+    return PreparedPayload(payload=payload, fetched=fetched, body=body, prompt_text=prompt_text, next_urls=next_urls)
+
+
+def finish_payload(prepared: PreparedPayload, json_response) -> PayloadResult:
+    """
+    Builds the PayloadResult of a prepared payload from its extraction. Pages the prefilter skipped are not stored.
+    """
+    payload = prepared.payload
+    cosmos_docs = []
+    if prepared.prompt_text is not None:
+        cosmos_docs = helpers.persistence.build_documents(
+            payload.state, payload.url, json_response, helpers.persistence.content_hash(prepared.body),
+            created_at=payload.created_at, depth=payload.depth, scraped_urls=payload.url
+        )
+    return PayloadResult(payload=payload, cosmos_docs=cosmos_docs, next_urls=prepared.next_urls, fetched=prepared.fetched)
+
+
+def process_payload(payload: QueuePayload, frontier: Optional[helpers.crawl_frontier.Frontier] = None) -> Optional[PayloadResult]:
+    """
+    Fetches, extracts and prepares the Cosmos DB document for a single-URL queue payload.
+
+    Returns a PayloadResult, or None when the content is unchanged since the last crawl. Follow-up pages
+    (depth 1) are screened, extracted and stored like the pages they were linked from.
+    """
+    prepared = prepare_payload(payload, frontier)
+    if prepared is None:
+        return None
+    json_response = None
+    if prepared.prompt_text is not None:
+        # Call LLM API with the scraped content
+        response, json_response, pydantic_response = helpers.llm.call_llm_api(prepared.prompt_text, payload.state)
+        logging.info(f"LLM Response: {response}")
+
+    # Token usage is recorded by helpers.llm, where the completion's usage object is still available
+    return finish_payload(prepared, json_response)
+
+
+def process_round_packed(items: List[QueuePayload], frontiers: Dict[str, helpers.crawl_frontier.Frontier],
+                         executor: ThreadPoolExecutor) -> List[Tuple[Optional[PayloadResult], Optional[Exception]]]:
+    """
+    Packed variant of a processing round (LLM_PACKING=true): every payload is fetched and screened first, then
+    the relevant pages are extracted together with helpers.llm.call_llm_api_packed, so short pages share
+    requests and the fixed prompt, and the documents are built last.
+
+    Returns a (PayloadResult or None, error or None) pair per item, like the unpacked round.
+    """
+    def prepare(item: QueuePayload):
+        helpers.metrics.record_queue_lag(item.created_at, state=item.state, depth=item.depth)
+        try:
+            return prepare_payload(item, frontiers[item.state]), None
+        except Exception as e:
+            logging.error(f"Failed to process {item.url}: {e}")
+            return None, e
+
+    prepared = list(executor.map(prepare, items))
+    relevant = [position for position, (ready, _) in enumerate(prepared) if ready is not None and ready.prompt_text is not None]
+    extracted = dict(zip(relevant, helpers.llm.call_llm_api_packed(
+        helpers.llm.PackedDocument(source_id=prepared[position][0].payload.url, state=prepared[position][0].payload.state,
+                                   text=prepared[position][0].prompt_text)
+        for position in relevant
+    )))
+
+    outcomes = []
+    for position, (ready, error) in enumerate(prepared):
+        if ready is None:
+            outcomes.append((None, error))
+            continue
+        result = extracted.get(position)
+        if result is not None and result.error:
+            logging.error(f"Failed to process {ready.payload.url}: {result.error}")
+            outcomes.append((None, RuntimeError(result.error)))
+            continue
+        outcomes.append((finish_payload(ready, result.json_response if result else None), None))
+    return outcomes
+
+
+def validate_payloads(payloads: Iterable[dict], outcome: Optional[BatchOutcome] = None) -> List[QueuePayload]:
+    """
+    Expands batched messages and validates every item into a QueuePayload, in message order.
+    Invalid items are logged and counted in outcome.invalid.
+    """
+    items = []
+    for payload in payloads:
+        for item in helpers.queue_fanout.expand_payload(payload):
+            try:
+                validated = QueuePayload.model_validate(item)
+            except ValidationError as e:
+                logging.error(f"Skipping invalid queue payload {item}: {e}")
+                if outcome is not None:
+                    outcome.invalid += 1
+                continue
+            items.append(validated)
+    return items
+
+
+def process_payloads(payloads: Iterable[dict], writer, batch_size: int = None, max_workers: int = None) -> BatchOutcome:
+    """
+    Processes a batch of queue payloads (single-URL or batched messages) concurrently.
+
+    Payloads are validated once, in message order. Each round of batch_size payloads is fetched and extracted
+    on max_workers threads (with LLM_PACKING=true, short pages of a round are extracted together, see
+    process_round_packed); its documents go to `writer` and its follow-up links are sent to the queue in one
+    fan-out. Failures are collected in BatchOutcome.failed instead of stopping the batch, including pages
+    whose follow-up links could not all be queued (the unsent links are released to the frontier).
+
+    Parameters:
+        payloads: Decoded queue messages.
+        writer (DocumentWriter): Receives the Cosmos DB documents.
+        batch_size (int): Payloads per round. Defaults to QUEUE_BATCH_SIZE.
+        max_workers (int): Payloads processed at once. Defaults to QUEUE_MAX_CONCURRENCY.
+
+    Returns:
+        BatchOutcome: The processed FetchResults (for helpers.fetch_store.save_metadata once the documents are
+        written) and counts of unchanged, invalid, failed and enqueued items.
+    """
+    batch_size = batch_size or QUEUE_BATCH_SIZE
+    max_workers = max_workers or QUEUE_MAX_CONCURRENCY
+    outcome = BatchOutcome()
+    items = validate_payloads(payloads, outcome)
+    frontiers = {state: helpers.crawl_frontier.Frontier(state) for state in {item.state for item in items}}
+
+    def run(item: QueuePayload):
+        helpers.metrics.record_queue_lag(item.created_at, state=item.state, depth=item.depth)
+        try:
+            return process_payload(item, frontiers[item.state]), None
+        except Exception as e:
+            logging.error(f"Failed to process {item.url}: {e}")
+            return None, e
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for start in range(0, len(items), batch_size):
+            round_items = items[start:start + batch_size]
+            next_items = []
+            if helpers.llm.LLM_PACKING:
+                round_outcomes = process_round_packed(round_items, frontiers, executor)
+            else:
+                round_outcomes = executor.map(run, round_items)
+            round_results = []
+            for item, (result, error) in zip(round_items, round_outcomes):
+                if error is not None:
+                    outcome.failed.append((item.url, str(error)))
+                elif result is None:
+                    outcome.unchanged += 1
+                else:
+                    round_results.append(result)
+                    writer.add(result.cosmos_docs)
+                    next_items.extend(helpers.queue_fanout.make_queue_item(item.state, url, depth=item.depth + 1)
+                                      for url in result.next_urls)
+            unsent_items = []
+            if next_items:
+                try:
+                    outcome.enqueued += helpers.queue_fanout.send_items(next_items)
+                except helpers.queue_fanout.FanoutError as e:
+                    outcome.enqueued += e.sent
+                    unsent_items = e.unsent
+                except Exception as e:
+                    logging.error(f"Failed to queue {len(next_items)} follow-up link(s): {e}")
+                    unsent_items = next_items
+            unsent = {(next_item["state"], next_item["url"]) for next_item in unsent_items}
+            # Give the unsent links back to the frontier so the retried message can enqueue them again
+            for state, frontier in frontiers.items():
+                frontier.release([url for url_state, url in unsent if url_state == state])
+            for result in round_results:
+                if any((result.payload.state, url) in unsent for url in result.next_urls):
+                    # Not processed until its links are queued: the retry must not skip the page as unchanged
+                    outcome.failed.append((result.payload.url, "Follow-up links could not be queued"))
+                else:
+                    outcome.processed.append(result.fetched)
+
+    logging.info(f"Batch of {len(items)} payload(s): {len(outcome.processed)} processed, {outcome.unchanged} unchanged, "
+                 f"{len(outcome.failed)} failed, {outcome.invalid} invalid, {outcome.enqueued} message(s) enqueued.")
+    return outcome
+
+
+def process_message(payload: dict, writer) -> BatchOutcome:
+    """
+    Processes one queue message (a single URL or a batch of URLs for one state) and adds its documents to
+    `writer`. Shared by the Storage queue trigger and the Redis stream consumer.
+
+    One failed URL does not fail the others. Once the documents have been written, save the fetch metadata
+    of outcome.processed and then call outcome.raise_for_failures(), so the message is retried for the
+    failed URLs alone.
+    """
+    return process_payloads([payload], writer)
@@ -1,54 +1,304 @@
 import redis
 import json
+import logging
 import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 from dotenv import load_dotenv
 
+from helpers import resilience
+
+logger = logging.getLogger(__name__)
+
 # Get the Redis connection details from environment variables
 REDIS_HOST = os.getenv("REDIS_HOST")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6380))  # Default to 6380 for SSL connections
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD")
+REDIS_SSL = os.getenv("REDIS_SSL", "true").lower() == "true"  # Use SSL for Azure Redis connections
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "5"))
 
-# Connect to Redis using host, port, and password
-redis_client = redis.StrictRedis(
-    host=REDIS_HOST,
-    port=REDIS_PORT,
-    password=REDIS_PASSWORD,
-    ssl=True  # Use SSL for Azure Redis connections
-)
+# Attempts and backoff (seconds) for dropped connections and timeouts; see _run
+REDIS_RETRY_ATTEMPTS = int(os.getenv("REDIS_RETRY_ATTEMPTS", "3"))
+REDIS_RETRY_BASE_DELAY = float(os.getenv("REDIS_RETRY_BASE_DELAY", "0.05"))
+REDIS_RETRY_MAX_DELAY = float(os.getenv("REDIS_RETRY_MAX_DELAY", "1"))
+_TRANSIENT_ERRORS = (redis.ConnectionError, redis.TimeoutError)
+_UNAVAILABLE = object()
 
+# Keys per MGET / pipeline round-trip for the bulk helpers
+BULK_CHUNK_SIZE = 500
+
+# In-process read-through cache for hot keys (see get_cached_json)
+LOCAL_CACHE_TTL_SECONDS = float(os.getenv("REDIS_LOCAL_CACHE_TTL_SECONDS", "30"))
+LOCAL_CACHE_MAX_AGE_SECONDS = float(os.getenv("REDIS_LOCAL_CACHE_MAX_AGE_SECONDS", "300"))
+VERSION_KEY_PREFIX = "version:"
+
+_pool = None
+_client = None
+_pool_lock = threading.RLock()
+
+
+def get_connection_pool() -> redis.ConnectionPool:
+    """
+    Returns the process-wide connection pool, created on first use rather than at import time.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = redis.ConnectionPool(
+                    connection_class=redis.SSLConnection if REDIS_SSL else redis.Connection,
+                    host=REDIS_HOST,
+                    port=REDIS_PORT,
+                    password=REDIS_PASSWORD,
+                    max_connections=REDIS_MAX_CONNECTIONS,
+                    health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+                    socket_timeout=REDIS_SOCKET_TIMEOUT,
+                    socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+                    socket_keepalive=True,
+                    retry_on_timeout=True
+                )
+    return _pool
 
-# List all keys
-def list_all_keys():
-    try:
-        keys = redis_client.keys('*')
-        if keys:
-            return [key.decode('utf-8') for key in keys]  # Decode from bytes to string
-        else:
-            print("No keys found.")
-    except redis.RedisError as error:
-        print(f"Error listing keys: {error}")
 
+def get_client() -> redis.StrictRedis:
+    """
+    Returns the shared Redis client backed by the connection pool.
+    """
+    global _client
+    if _client is None:
+        with _pool_lock:
+            if _client is None:
+                _client = redis.StrictRedis(connection_pool=get_connection_pool())
+    return _client
 
-# Store data in Redis
-def store_data(key, value):
+
+def __getattr__(name):
+    # Keeps `redis_handler.redis_client` working without connecting at import time
+    if name == "redis_client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _run(description: str, operation, default=None):
+    """
+    Runs one Redis operation behind the "redis" circuit breaker. Dropped connections and timeouts are retried
+    with jittered backoff (REDIS_RETRY_ATTEMPTS attempts); once the circuit opens, calls fail fast instead of
+    each waiting out the socket timeout. Any Redis error left is logged and `default` returned.
+    """
     try:
-        # Convert the value to a string (JSON) and store in Redis
-        redis_client.set(key, json.dumps(value))
-        print(f"Data stored successfully with key: {key}")
-    except redis.RedisError as error:
-        print(f"Error storing data in Redis: {error}")
+        return resilience.call_with_retry(operation, "redis", retry_on=_TRANSIENT_ERRORS, max_attempts=REDIS_RETRY_ATTEMPTS,
+                                          base_delay=REDIS_RETRY_BASE_DELAY, max_delay=REDIS_RETRY_MAX_DELAY)
+    except (redis.RedisError, resilience.CircuitOpenError) as error:
+        logger.warning(f"Error {description}: {error}")
+        return default
+
+
+def _decode(value) -> Optional[str]:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+# Iterate over keys matching a pattern with cursor-based SCAN (never blocks the server like KEYS)
+def iter_keys(pattern: str = '*', count: int = 1000) -> Iterator[str]:
+    for key in get_client().scan_iter(match=pattern, count=count):
+        yield _decode(key)
+
+
+# List all keys, optionally filtered by pattern and capped at `limit` keys
+def list_all_keys(pattern: str = '*', count: int = 1000, limit: Optional[int] = None) -> List[str]:
+    def scan():
+        keys = []
+        for key in iter_keys(pattern, count):
+            keys.append(key)
+            if limit is not None and len(keys) >= limit:
+                break
+        return keys
+
+    return _run("listing keys", scan, [])
+
+
+# Store data in Redis, optionally expiring after `ex` seconds
+def store_data(key, value, ex=None):
+    # Convert the value to a string (JSON) and store in Redis
+    return bool(_run("storing data in Redis", lambda: get_client().set(key, json.dumps(value), ex=ex), False))
 
 # Retrieve data from Redis
 def get_data(key):
-    try:
-        # Retrieve the data from Redis
-        value = redis_client.get(key)
-        if value:
-            # Deserialize the stored JSON string back to a Python object
-            return value.decode("utf-8")
-        else:
-            print(f"No data found for key: {key}")
-            return None
-    except redis.RedisError as error:
-        print(f"Error retrieving data from Redis: {error}")
-        return None
\ No newline at end of file
+    value = _run("retrieving data from Redis", lambda: get_client().get(key), _UNAVAILABLE)
+    if value is _UNAVAILABLE:
+        return None
+    if value:
+        # Deserialize the stored JSON string back to a Python object
+        return value.decode("utf-8")
+    return None
+
+
+# Retrieve many keys with pipelined MGET calls. Missing keys map to None.
+def get_many(keys: Iterable[str]) -> Dict[str, Optional[str]]:
+    keys = list(keys)
+    results = {}
+    for start in range(0, len(keys), BULK_CHUNK_SIZE):
+        chunk = keys[start:start + BULK_CHUNK_SIZE]
+        values = _run("retrieving data from Redis", lambda: get_client().mget(chunk))
+        if values is None:
+            break
+        results.update(zip(chunk, (_decode(value) for value in values)))
+    return results
+
+
+# Store many values (JSON encoded) in pipelined batches, optionally expiring after `ex` seconds
+def store_many(mapping: Dict[str, Any], ex=None) -> int:
+    items = list(mapping.items())
+    stored = 0
+    for start in range(0, len(items), BULK_CHUNK_SIZE):
+        def write_batch(batch=items[start:start + BULK_CHUNK_SIZE]):
+            pipe = get_client().pipeline(transaction=False)
+            for key, value in batch:
+                pipe.set(key, json.dumps(value), ex=ex)
+            return pipe.execute()
+
+        results = _run("storing data in Redis", write_batch)
+        if results is None:
+            break
+        stored += sum(1 for ok in results if ok)
+    return stored
+
+
+# Store a dict as a Redis hash, one JSON-encoded value per field, so fields can be read and updated individually
+def store_hash(key: str, mapping: Dict[str, Any], ex=None, replace: bool = False):
+    def write():
+        pipe = get_client().pipeline(transaction=True)
+        if replace:
+            pipe.delete(key)
+        if mapping:
+            pipe.hset(key, mapping={field: json.dumps(value) for field, value in mapping.items()})
+        if ex:
+            pipe.expire(key, ex)
+        pipe.execute()
+
+    _run("storing hash in Redis", write)
+
+
+# Retrieve a hash (or just some of its fields) with the JSON values decoded
+def get_hash(key: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    def read():
+        if fields:
+            return dict(zip(fields, get_client().hmget(key, fields)))
+        return {_decode(field): value for field, value in get_client().hgetall(key).items()}
+
+    values = _run("retrieving hash from Redis", read)
+    if values is None:
+        return None
+    return {field: json.loads(value) for field, value in values.items() if value is not None}
+
+
+# Retrieve a JSON value stored either as a string (store_data) or as a hash (store_hash)
+def get_json(key: str) -> Any:
+    key_type = _decode(_run("retrieving data from Redis", lambda: get_client().type(key)))
+    if key_type == "hash":
+        return get_hash(key)
+    if key_type == "string":
+        value = get_data(key)
+        return json.loads(value) if value else None
+    return None
+
+
+# Version keys: writers bump a key's version so every worker's local copy is refreshed on its next check
+def get_version(key: str) -> Optional[str]:
+    version = _run("retrieving version from Redis", lambda: get_client().get(VERSION_KEY_PREFIX + key), _UNAVAILABLE)
+    if version is _UNAVAILABLE:
+        return None
+    return _decode(version) or "0"
+
+
+def bump_version(key: str) -> None:
+    _run("updating version in Redis", lambda: get_client().incr(VERSION_KEY_PREFIX + key))
+    _local_cache.invalidate(key)
+
+
+class ReadThroughCache:
+    """
+    In-process cache of parsed values for hot, rarely changing keys such as web_resources.
+
+    An entry is served from memory for ttl_seconds. After that the key's version is checked with a single
+    GET; if it has not been bumped the entry is kept for another ttl_seconds without reloading the value.
+    Entries are reloaded unconditionally after max_age_seconds, so writes that do not bump the version
+    still show up eventually. If Redis is unreachable the last known value keeps being served.
+    Cached values are shared between callers and must be treated as read-only.
+    """
+    def __init__(self, ttl_seconds: float = None, max_age_seconds: float = None):
+        self.ttl_seconds = LOCAL_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.max_age_seconds = LOCAL_CACHE_MAX_AGE_SECONDS if max_age_seconds is None else max_age_seconds
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0  # Served from memory, no network round-trip
+        self.revalidations = 0  # Version check only
+        self.misses = 0  # Value loaded from Redis
+
+    def get(self, key: str, loader=None) -> Any:
+        loader = loader or get_json
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now < entry["expires_at"]:
+                self.hits += 1
+                return entry["value"]
+
+        version = get_version(key)
+        if entry and (version is None or (version == entry["version"] and now - entry["loaded_at"] < self.max_age_seconds)):
+            with self._lock:
+                entry["expires_at"] = now + self.ttl_seconds
+                self.revalidations += 1
+            return entry["value"]
+
+        value = loader(key)
+        with self._lock:
+            self.misses += 1
+            if value is not None:
+                self._entries[key] = {"value": value, "version": version, "loaded_at": now,
+                                      "expires_at": now + self.ttl_seconds}
+            else:
+                self._entries.pop(key, None)
+        return value
+
+    def invalidate(self, key: str = None) -> None:
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.revalidations + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "revalidations": self.revalidations,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+_local_cache = ReadThroughCache()
+
+
+# Read a JSON value (string or hash layout) through the in-process cache
+def get_cached_json(key: str) -> Any:
+    return _local_cache.get(key)
+
+
+# Write a JSON value and bump its version so cached copies in every worker pick it up
+def update_cached_json(key: str, value: Any, as_hash: bool = False, ex=None) -> None:
+    if as_hash:
+        store_hash(key, value, ex=ex, replace=True)
+    else:
+        store_data(key, value, ex=ex)
+    bump_version(key)
+
+
+def local_cache_stats() -> Dict[str, Any]:
+    return _local_cache.stats()
@@ -0,0 +1,341 @@
+import argparse
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from pydantic import BaseModel, Field
+
+import helpers.redis_handler as rh
+
+logger = logging.getLogger(__name__)
+
+STREAM_NAME = os.getenv("REDIS_STREAM_NAME", "url-job-stream")
+STREAM_GROUP = os.getenv("REDIS_STREAM_GROUP", "url-workers")
+STREAM_BATCH_SIZE = int(os.getenv("REDIS_STREAM_BATCH_SIZE", "10"))
+STREAM_BLOCK_MS = int(os.getenv("REDIS_STREAM_BLOCK_MS", "2000"))
+# Pending messages idle longer than this are assumed to belong to a crashed worker and are reclaimed
+STREAM_MIN_IDLE_MS = int(os.getenv("REDIS_STREAM_MIN_IDLE_MS", str(10 * 60 * 1000)))
+STREAM_MAX_DELIVERIES = int(os.getenv("REDIS_STREAM_MAX_DELIVERIES", "5"))
+STREAM_MAXLEN = int(os.getenv("REDIS_STREAM_MAXLEN", "100000"))  # Approximate cap, trimmed on XADD
+
+# Messages one drain run is expected to get through; sizes the number of drains dispatched for a backlog
+STREAM_MESSAGES_PER_DRAIN = int(os.getenv("REDIS_STREAM_MESSAGES_PER_DRAIN", "100"))
+STREAM_MAX_DRAINERS = int(os.getenv("REDIS_STREAM_MAX_DRAINERS", "16"))
+# How long a dispatched drain counts as in flight unless it finishes first: queue wait plus the run itself.
+# A drain that dies without releasing its lease holds a slot until then.
+STREAM_DRAIN_LEASE_SECONDS = int(os.getenv("REDIS_STREAM_DRAIN_LEASE_SECONDS", "600"))
+
+
+def _decode(value) -> Optional[str]:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def dead_letter_stream(stream: str = STREAM_NAME) -> str:
+    return f"{stream}:dead"
+
+
+class StreamMessage(BaseModel):
+    id: str
+    body: str
+    deliveries: int = 1
+
+
+class ConsumeStats(BaseModel):
+    """
+    Outcome of one StreamConsumer.consume() run.
+    """
+    batches: int = 0
+    processed: int = 0
+    failed: int = 0
+    reclaimed: int = 0
+    dead_lettered: int = 0
+    acked_ids: List[str] = Field(default_factory=list)  # Ids handled successfully (acknowledged unless auto_ack=False)
+
+
+def ensure_group(stream: str = STREAM_NAME, group: str = STREAM_GROUP) -> None:
+    """
+    Creates the consumer group (and the stream) if they do not exist yet.
+    """
+    try:
+        rh.get_client().xgroup_create(stream, group, id="0", mkstream=True)
+        logger.info(f"Created consumer group '{group}' on stream '{stream}'")
+    except rh.redis.ResponseError as error:
+        if "BUSYGROUP" not in str(error):
+            raise
+
+
+def add_messages(messages: Iterable[str], stream: str = STREAM_NAME, maxlen: int = None) -> int:
+    """
+    Appends messages (JSON strings, e.g. from helpers.queue_fanout.batch_messages) to the stream with
+    pipelined XADD calls. Returns the number of messages added.
+    """
+    maxlen = maxlen or STREAM_MAXLEN
+    client = rh.get_client()
+    added, pipe = 0, client.pipeline(transaction=False)
+    pending = 0
+    for message in messages:
+        pipe.xadd(stream, {"body": message}, maxlen=maxlen, approximate=True)
+        pending += 1
+        if pending >= rh.BULK_CHUNK_SIZE:
+            added += len(pipe.execute())
+            pipe, pending = client.pipeline(transaction=False), 0
+    if pending:
+        added += len(pipe.execute())
+    logger.info(f"Added {added} messages to stream '{stream}'")
+    return added
+
+
+class StreamConsumer:
+    """
+    Reads work from a Redis stream as a member of a consumer group.
+
+    Each read first reclaims messages left pending by crashed workers (XAUTOCLAIM after min_idle_ms) and then
+    reads new messages with a batched XREADGROUP. Handled messages are acknowledged; failed ones stay pending
+    and are retried once reclaimed, until they have been delivered max_deliveries times, after which they are
+    moved to the dead-letter stream.
+    """
+    def __init__(self, stream: str = STREAM_NAME, group: str = STREAM_GROUP, consumer: Optional[str] = None,
+                 batch_size: int = None, block_ms: int = None, min_idle_ms: int = None, max_deliveries: int = None):
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.batch_size = batch_size or STREAM_BATCH_SIZE
+        self.block_ms = STREAM_BLOCK_MS if block_ms is None else block_ms
+        self.min_idle_ms = STREAM_MIN_IDLE_MS if min_idle_ms is None else min_idle_ms
+        self.max_deliveries = max_deliveries or STREAM_MAX_DELIVERIES
+        self._group_ready = False
+        self._reclaim_cursor = "0-0"  # XAUTOCLAIM resumes where the previous call stopped
+
+    def _ensure_group(self) -> None:
+        if not self._group_ready:
+            ensure_group(self.stream, self.group)
+            self._group_ready = True
+
+    @staticmethod
+    def _messages(entries) -> List[StreamMessage]:
+        messages = []
+        for message_id, fields in entries:
+            if fields is None:  # Entry was trimmed from the stream while pending
+                continue
+            body = fields.get(b"body", b"")
+            messages.append(StreamMessage(id=_decode(message_id), body=_decode(body)))
+        return messages
+
+    def reclaim(self, count: int) -> List[StreamMessage]:
+        """
+        Claims up to `count` messages that have been pending longer than min_idle_ms. Each call continues the
+        scan of the pending entries list from the cursor the previous one returned, wrapping around at the end.
+        """
+        client = rh.get_client()
+        response = client.xautoclaim(self.stream, self.group, self.consumer, self.min_idle_ms,
+                                     start_id=self._reclaim_cursor, count=count)
+        self._reclaim_cursor = _decode(response[0]) or "0-0"
+        messages = self._messages(response[1])
+        if messages:
+            pending = client.xpending_range(self.stream, self.group, min=messages[0].id, max=messages[-1].id,
+                                            count=len(messages), consumername=self.consumer)
+            deliveries = {_decode(entry["message_id"]): entry["times_delivered"] for entry in pending}
+            for message in messages:
+                message.deliveries = deliveries.get(message.id, self.max_deliveries)
+            logger.info(f"Reclaimed {len(messages)} pending message(s) from stream '{self.stream}'")
+        return messages
+
+    def read(self, count: int = None, block_ms: int = None) -> List[StreamMessage]:
+        """
+        Returns the next batch: reclaimed messages first, then new ones.
+        """
+        self._ensure_group()
+        count = count or self.batch_size
+        messages = self.reclaim(count)
+        if len(messages) < count:
+            response = rh.get_client().xreadgroup(self.group, self.consumer, {self.stream: ">"},
+                                                   count=count - len(messages),
+                                                   block=self.block_ms if block_ms is None else block_ms)
+            for _, entries in response or []:
+                messages.extend(self._messages(entries))
+        return messages
+
+    def close(self) -> None:
+        """
+        Removes this consumer from the group if it holds no pending messages. Drain runs use a fresh consumer
+        name each time, so this keeps the group's consumer list from growing without bound.
+        """
+        client = rh.get_client()
+        for consumer in client.xinfo_consumers(self.stream, self.group):
+            if _decode(consumer["name"]) == self.consumer and not consumer["pending"]:
+                client.xgroup_delconsumer(self.stream, self.group, self.consumer)
+
+    def ack(self, ids: List[str]) -> int:
+        if not ids:
+            return 0
+        return rh.get_client().xack(self.stream, self.group, *ids)
+
+    def dead_letter(self, message: StreamMessage, error: str) -> None:
+        """
+        Moves a message to the dead-letter stream and acknowledges it.
+        """
+        pipe = rh.get_client().pipeline(transaction=True)
+        pipe.xadd(dead_letter_stream(self.stream), {
+            "body": message.body,
+            "source_id": message.id,
+            "deliveries": message.deliveries,
+            "error": error[:1000],
+            "failed_at": time.time()
+        }, maxlen=STREAM_MAXLEN, approximate=True)
+        pipe.xack(self.stream, self.group, message.id)
+        pipe.execute()
+        logger.error(f"Moved message {message.id} to '{dead_letter_stream(self.stream)}' after "
+                     f"{message.deliveries} deliveries: {error}")
+
+    def consume(self, handler: Callable[[Dict[str, Any]], Any], deadline: Optional[float] = None,
+                max_batches: Optional[int] = None, auto_ack: bool = True) -> ConsumeStats:
+        """
+        Reads batches and calls handler(payload) for each message until the stream is drained, the
+        time.monotonic() deadline passes or max_batches batches have been read.
+
+        Parameters:
+            handler: Called with the decoded JSON payload. Raising leaves the message pending for a retry.
+            auto_ack (bool): Set to False to acknowledge ConsumeStats.acked_ids yourself, e.g. only after the
+                documents produced by the batch have been written.
+        """
+        stats = ConsumeStats()
+        while (deadline is None or time.monotonic() < deadline) and (max_batches is None or stats.batches < max_batches):
+            messages = self.read()
+            if not messages:
+                break
+            stats.batches += 1
+            stats.reclaimed += sum(1 for message in messages if message.deliveries > 1)
+            handled = []
+            for message in messages:
+                try:
+                    payload = json.loads(message.body)
+                except ValueError as e:
+                    self.dead_letter(message, f"Invalid JSON: {e}")
+                    stats.dead_lettered += 1
+                    continue
+                try:
+                    handler(payload)
+                    handled.append(message.id)
+                except Exception as e:
+                    stats.failed += 1
+                    if message.deliveries >= self.max_deliveries:
+                        self.dead_letter(message, str(e))
+                        stats.dead_lettered += 1
+                    else:
+                        logger.warning(f"Message {message.id} failed (delivery {message.deliveries} of "
+                                       f"{self.max_deliveries}), will be retried: {e}")
+            stats.processed += len(handled)
+            stats.acked_ids.extend(handled)
+            if auto_ack:
+                self.ack(handled)
+        return stats
+
+
+def backlog(stream: str = STREAM_NAME, group: str = STREAM_GROUP) -> Dict[str, int]:
+    """
+    Work waiting for the group: entries not delivered yet (lag) and entries delivered but not acknowledged.
+    """
+    ensure_group(stream, group)
+    client = rh.get_client()
+    for info in client.xinfo_groups(stream):
+        if _decode(info["name"]) == group:
+            lag = info.get("lag")
+            if lag is None:  # Redis < 7 or a trimmed stream: assume the whole stream is outstanding
+                lag = client.xlen(stream)
+            return {"lag": int(lag), "pending": int(info["pending"])}
+    return {"lag": 0, "pending": 0}
+
+
+def drains_needed(stream: str = STREAM_NAME, group: str = STREAM_GROUP, messages_per_drain: int = None,
+                  max_drainers: int = None) -> int:
+    """
+    How many drain runs to start for the current backlog: one per messages_per_drain undelivered entries,
+    at least one while messages are pending (so stuck ones get reclaimed), at most max_drainers.
+    """
+    messages_per_drain = messages_per_drain or STREAM_MESSAGES_PER_DRAIN
+    max_drainers = max_drainers or STREAM_MAX_DRAINERS
+    work = backlog(stream, group)
+    needed = -(-work["lag"] // messages_per_drain)
+    if not needed and work["pending"]:
+        needed = 1
+    return min(needed, max_drainers)
+
+
+def drain_leases_key(stream: str = STREAM_NAME) -> str:
+    return f"{stream}:drains"
+
+
+def lease_drains(needed: int, stream: str = STREAM_NAME, lease_seconds: int = None) -> List[str]:
+    """
+    Takes leases for the drains to dispatch: `needed` minus the drains still in flight, so a backlog that outlasts
+    one timer tick does not queue another round of drains on top of the running ones.
+
+    In-flight drains are the unexpired leases in a sorted set scored by expiry. The dispatcher is a singleton
+    timer, so the count and the new leases need no transaction.
+
+    Returns:
+        list: One lease id per drain to dispatch; pass each to release_drain when that drain finishes.
+    """
+    lease_seconds = lease_seconds or STREAM_DRAIN_LEASE_SECONDS
+    client = rh.get_client()
+    key = drain_leases_key(stream)
+    now = time.time()
+    pipe = client.pipeline(transaction=False)
+    pipe.zremrangebyscore(key, "-inf", now)
+    pipe.zcard(key)
+    in_flight = pipe.execute()[1]
+
+    leases = [uuid.uuid4().hex for _ in range(max(0, needed - in_flight))]
+    if leases:
+        pipe = client.pipeline(transaction=False)
+        pipe.zadd(key, {lease: now + lease_seconds for lease in leases})
+        pipe.expire(key, lease_seconds)
+        pipe.execute()
+    logger.info(f"{in_flight} drain(s) in flight, {len(leases)} more needed for stream '{stream}'")
+    return leases
+
+
+def release_drain(lease: Optional[str], stream: str = STREAM_NAME) -> None:
+    """
+    Ends a drain's lease so the next dispatch can replace it. Errors are logged, not raised: an unreleased
+    lease only delays a replacement until it expires.
+    """
+    if not lease:
+        return
+    try:
+        rh.get_client().zrem(drain_leases_key(stream), lease)
+    except rh.redis.RedisError as error:
+        logger.warning(f"Could not release drain lease {lease}: {error}")
+
+
+def get_stream_stats(stream: str = STREAM_NAME, group: str = STREAM_GROUP) -> Dict[str, Any]:
+    client = rh.get_client()
+    pending = client.xpending(stream, group)
+    return {
+        "stream": stream,
+        "length": client.xlen(stream),
+        "pending": pending["pending"],
+        "consumers": len(pending["consumers"] or []),
+        "dead_lettered": client.xlen(dead_letter_stream(stream))
+    }
+
+
+if __name__ == "__main__":
+    # Example: REDIS_SSL=false REDIS_HOST=localhost REDIS_PORT=6379 python -m helpers.redis_streams stats
+    parser = argparse.ArgumentParser(description="Inspect or feed the Redis stream work queue.")
+    parser.add_argument("command", choices=["stats", "add"], help="'stats' prints queue depth, 'add' enqueues URLs read from stdin")
+    parser.add_argument("--state", help="State for the URLs passed to 'add'")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        ensure_group()
+        print(json.dumps(get_stream_stats(), indent=2))
+    else:
+        import sys
+        from helpers.queue_fanout import batch_messages, make_queue_item
+        urls = (line.strip() for line in sys.stdin if line.strip())
+        print(add_messages(batch_messages(make_queue_item(args.state, url) for url in urls)))
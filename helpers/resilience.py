@@ -0,0 +1,467 @@
+import asyncio
+import email.utils
+import logging
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+from helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+# Defaults for call_with_retry; each dependency passes its own where it needs different ones
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "20"))
+# Consecutive failures that open a dependency's circuit, and how long it stays open before a probe call
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised instead of calling a dependency whose circuit is open.
+    """
+
+
+class RetryableResponse(Exception):
+    """
+    Raised by an operation to retry on an HTTP response (e.g. 429 or 503) rather than an exception.
+    The response is kept so the caller can still use it once the retries are exhausted.
+    """
+    def __init__(self, response: Any, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {getattr(response, 'status_code', '?')}")
+        self.response = response
+        self.retry_after = retry_after
+
+
+def _header(headers: Any, name: str) -> Optional[str]:
+    if headers is None:
+        return None
+    value = headers.get(name)
+    if value is None and isinstance(headers, dict):
+        value = next((v for k, v in headers.items() if k.lower() == name), None)
+    return value
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parses the durations used by rate limit headers ("20ms", "1s", "6m0s", "1h2m3.5s", or plain seconds).
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def retry_after_seconds(headers: Any) -> Optional[float]:
+    """
+    Seconds to wait according to retry-after-ms or Retry-After (seconds or an HTTP date), or None.
+    """
+    milliseconds = _header(headers, "retry-after-ms")
+    if milliseconds is not None:
+        try:
+            return max(0.0, float(milliseconds) / 1000)
+        except ValueError:
+            pass
+    value = _header(headers, "retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base_delay: float = None, max_delay: float = None,
+                  retry_after: Optional[float] = None) -> float:
+    """
+    Seconds to wait before retry number `attempt` (0-based): exponential backoff with full jitter, so
+    concurrent callers spread out instead of retrying in lockstep. A server-provided Retry-After wins, with a
+    little jitter on top.
+    """
+    base_delay = RETRY_BASE_DELAY if base_delay is None else base_delay
+    max_delay = RETRY_MAX_DELAY if max_delay is None else max_delay
+    if retry_after is not None:
+        return retry_after + random.uniform(0, base_delay)
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+class _Bucket:
+    """
+    One per-minute budget (requests or tokens). Unlimited until a limit is configured or learned from headers.
+    """
+    def __init__(self, per_minute: Optional[float] = None):
+        self.capacity = float(per_minute) if per_minute else None
+        self.available = self.capacity or 0.0
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        if self.capacity:
+            self.available = min(self.capacity, self.available + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        if not self.capacity:
+            return 0.0
+        amount = min(amount, self.capacity)  # A request larger than the whole budget would otherwise wait forever
+        return max(0.0, (amount - self.available) * 60.0 / self.capacity)
+
+    def take(self, amount: float) -> None:
+        if self.capacity:
+            self.available -= min(amount, self.capacity)
+
+    def observe(self, limit: Optional[str], remaining: Optional[str]) -> None:
+        try:
+            if limit is not None and float(limit) > 0:
+                if not self.capacity:
+                    self.available = float(limit)
+                self.capacity = float(limit)
+            if remaining is not None and self.capacity:
+                # The provider's count includes other workers sharing the key; never assume more than it reports
+                self.available = min(self.available, float(remaining))
+        except ValueError:
+            pass
+
+
+class AdaptiveRateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute token buckets shared by every thread (and event loop) of a worker.
+
+    The buckets start from the configured limits, or unlimited, and are corrected after every response from the
+    provider's x-ratelimit-limit-* / x-ratelimit-remaining-* headers, so the limiter learns the real budget,
+    including what other workers on the same key use. A 429 empties the buckets and holds every caller until
+    Retry-After, instead of each thread retrying into the limit on its own. Throughput settles just under
+    the limit rather than oscillating around it.
+    """
+    def __init__(self, name: str, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        self.name = name
+        self.requests = _Bucket(requests_per_minute)
+        self.tokens = _Bucket(tokens_per_minute)
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self.throttled_seconds = 0.0
+
+    def reserve(self, tokens: int = 0) -> float:
+        """
+        Takes one request and `tokens` tokens if they are available now and returns 0, otherwise returns how
+        many seconds to wait before trying again.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            wait = max(self.requests.wait_for(1), self.tokens.wait_for(tokens))
+            if wait <= 0:
+                self.requests.take(1)
+                self.tokens.take(tokens)
+            return wait
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        Blocks until one request and `tokens` tokens fit in the budget. Returns the seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            wait = self.reserve(tokens)
+            if wait <= 0:
+                break
+            wait = min(wait, 5.0) + random.uniform(0, 0.05)  # Re-check regularly; the headers may have changed
+            time.sleep(wait)
+            waited += wait
+        self._record_wait(waited)
+        return waited
+
+    async def acquire_async(self, tokens: int = 0) -> float:
+        waited = 0.0
+        while True:
+            wait = self.reserve(tokens)
+            if wait <= 0:
+                break
+            wait = min(wait, 5.0) + random.uniform(0, 0.05)
+            await asyncio.sleep(wait)
+            waited += wait
+        self._record_wait(waited)
+        return waited
+
+    def _record_wait(self, waited: float) -> None:
+        if waited > 0:
+            with self._lock:
+                self.throttled_seconds += waited
+            metrics.observe("rate_limit_wait_ms", waited * 1000, limiter=self.name)
+
+    def update_from_headers(self, headers: Any) -> None:
+        """
+        Corrects the buckets from x-ratelimit-limit-{requests,tokens} and x-ratelimit-remaining-{requests,tokens}.
+        """
+        if headers is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            self.requests.observe(_header(headers, "x-ratelimit-limit-requests"),
+                                  _header(headers, "x-ratelimit-remaining-requests"))
+            self.tokens.observe(_header(headers, "x-ratelimit-limit-tokens"),
+                                _header(headers, "x-ratelimit-remaining-tokens"))
+
+    def penalize(self, retry_after: Optional[float] = None, headers: Any = None) -> None:
+        """
+        Records a rate limit response: empties the buckets and, with a Retry-After, holds all callers until then.
+        """
+        retry_after = retry_after if retry_after is not None else retry_after_seconds(headers)
+        if retry_after is None:
+            # No Retry-After: wait for the reset the headers announce, if any
+            resets = [parse_duration(_header(headers, name)) for name in
+                      ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")] if headers is not None else []
+            retry_after = max([reset for reset in resets if reset is not None], default=None)
+        with self._lock:
+            now = time.monotonic()
+            self.requests.available = min(self.requests.available, 0.0)
+            self.tokens.available = min(self.tokens.available, 0.0)
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+        metrics.increment("rate_limited", limiter=self.name)
+
+    def settle(self, reserved_tokens: int, used_tokens: Optional[int]) -> None:
+        """
+        Returns the tokens reserved for a request but not used (e.g. max_tokens it did not generate).
+        """
+        if used_tokens is None or not self.tokens.capacity:
+            return
+        with self._lock:
+            self.tokens.available = min(self.tokens.capacity, self.tokens.available + max(0, reserved_tokens - used_tokens))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests_per_minute": self.requests.capacity,
+                "tokens_per_minute": self.tokens.capacity,
+                "requests_available": round(self.requests.available, 2),
+                "tokens_available": round(self.tokens.available, 2),
+                "throttled_seconds": round(self.throttled_seconds, 3),
+            }
+
+
+class CircuitBreaker:
+    """
+    Per-dependency circuit breaker. After failure_threshold consecutive failures the circuit opens and calls
+    fail fast with CircuitOpenError for reset_seconds; then one probe call is let through, which closes the
+    circuit on success or opens it again on failure.
+    """
+    def __init__(self, name: str, failure_threshold: int = None, reset_seconds: float = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or CIRCUIT_FAILURE_THRESHOLD
+        self.reset_seconds = CIRCUIT_RESET_SECONDS if reset_seconds is None else reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str) -> None:
+        if state != self.state:
+            logger.warning(f"Circuit '{self.name}' {self.state} -> {state} ({self.failures} consecutive failure(s))")
+            metrics.increment("circuit_transitions", dependency=self.name, state=state)
+            self.state = state
+
+    def allow(self) -> None:
+        """
+        Raises CircuitOpenError if the dependency should not be called now.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._transition("half_open")
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return
+            raise CircuitOpenError(f"Circuit for '{self.name}' is open; failing fast")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._probing = False
+            self._transition("closed")
+            self.failures = 0
+
+    def release_probe(self) -> None:
+        """
+        Gives up a probe that was interrupted before the dependency answered, so the next call may probe.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._transition("open")
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_limiters: Dict[str, AdaptiveRateLimiter] = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """
+    Returns the worker-wide circuit breaker for a dependency, e.g. "llm", "redis" or "http:example.gov".
+    """
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _registry_lock:
+            breaker = _breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+
+def get_rate_limiter(name: str, requests_per_minute: Optional[int] = None,
+                     tokens_per_minute: Optional[int] = None) -> AdaptiveRateLimiter:
+    """
+    Returns the worker-wide adaptive limiter for a name (e.g. the model or deployment), creating it with the
+    given starting limits on first use.
+    """
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _registry_lock:
+            limiter = _limiters.setdefault(name, AdaptiveRateLimiter(name, requests_per_minute, tokens_per_minute))
+    return limiter
+
+
+def _plan_retry(error: BaseException, attempt: int, dependency: str, max_attempts: int, base_delay: float,
+                max_delay: float, max_retry_after: Optional[float],
+                retry_after: Optional[Callable[[BaseException], Optional[float]]]) -> Optional[float]:
+    """
+    Returns the delay before the next attempt, or None if the error should be raised now.
+    """
+    if attempt + 1 >= max_attempts:
+        return None
+    server_delay = error.retry_after if isinstance(error, RetryableResponse) else None
+    if server_delay is None and retry_after is not None:
+        server_delay = retry_after(error)
+    if server_delay is not None and max_retry_after is not None and server_delay > max_retry_after:
+        logger.warning(f"{dependency}: server asked to wait {server_delay:.1f}s, more than {max_retry_after}s; giving up")
+        return None
+    delay = backoff_delay(attempt, base_delay, max_delay, server_delay)
+    metrics.increment("retries", dependency=dependency, reason=type(error).__name__)
+    logger.info(f"{dependency}: {type(error).__name__}: {error}; retry {attempt + 1}/{max_attempts - 1} in {delay:.2f}s")
+    return delay
+
+
+def call_with_retry(operation: Callable[[], Any], dependency: str, retry_on: Tuple[Type[BaseException], ...] = (Exception,),
+                    max_attempts: int = None, base_delay: float = None, max_delay: float = None,
+                    max_retry_after: Optional[float] = None, retry_after: Callable[[BaseException], Optional[float]] = None,
+                    is_failure: Callable[[BaseException], bool] = None, breaker: Optional[CircuitBreaker] = None) -> Any:
+    """
+    Calls operation() through the dependency's circuit breaker, retrying retry_on errors with jittered
+    exponential backoff (or the server's Retry-After).
+
+    Parameters:
+        operation: Zero-argument callable doing one attempt.
+        dependency (str): Breaker and metrics name, e.g. "llm" or "redis".
+        retry_on: Exception types worth retrying; anything else is raised at once.
+        max_attempts (int): Total attempts, the first included (RETRY_MAX_ATTEMPTS).
+        base_delay, max_delay (float): Backoff scale and cap in seconds (RETRY_BASE_DELAY, RETRY_MAX_DELAY).
+        max_retry_after (float): Give up instead of waiting when the server asks for a longer wait.
+        retry_after: Extracts a server-requested delay from an error, if it carries one.
+        is_failure: Whether a retryable error counts against the breaker (default: all do). Rate limiting
+            usually should not: the dependency is healthy, just busy.
+        breaker (CircuitBreaker): Defaults to get_breaker(dependency).
+
+    Raises:
+        CircuitOpenError: If the circuit is open.
+    """
+    max_attempts = max_attempts or RETRY_MAX_ATTEMPTS
+    base_delay = RETRY_BASE_DELAY if base_delay is None else base_delay
+    max_delay = RETRY_MAX_DELAY if max_delay is None else max_delay
+    breaker = breaker or get_breaker(dependency)
+    attempt = 0
+    while True:
+        breaker.allow()
+        try:
+            result = operation()
+        except retry_on as error:
+            if is_failure is None or is_failure(error):
+                breaker.record_failure()
+                if breaker.state == "open":
+                    raise  # This failure opened the circuit; retrying now would only fail fast
+            else:
+                breaker.record_success()
+            delay = _plan_retry(error, attempt, dependency, max_attempts, base_delay, max_delay, max_retry_after, retry_after)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+            continue
+        except Exception:
+            # Not a dependency failure (e.g. a 400); it still answered, so a probe call counts as healthy
+            breaker.record_success()
+            raise
+        except BaseException:
+            # Interrupted or cancelled: says nothing about the dependency's health
+            breaker.release_probe()
+            raise
+        breaker.record_success()
+        return result
+
+
+async def call_with_retry_async(operation: Callable[[], Awaitable[Any]], dependency: str,
+                                retry_on: Tuple[Type[BaseException], ...] = (Exception,), max_attempts: int = None,
+                                base_delay: float = None, max_delay: float = None, max_retry_after: Optional[float] = None,
+                                retry_after: Callable[[BaseException], Optional[float]] = None,
+                                is_failure: Callable[[BaseException], bool] = None,
+                                breaker: Optional[CircuitBreaker] = None) -> Any:
+    """
+    Async version of call_with_retry; operation returns an awaitable.
+    """
+    max_attempts = max_attempts or RETRY_MAX_ATTEMPTS
+    base_delay = RETRY_BASE_DELAY if base_delay is None else base_delay
+    max_delay = RETRY_MAX_DELAY if max_delay is None else max_delay
+    breaker = breaker or get_breaker(dependency)
+    attempt = 0
+    while True:
+        breaker.allow()
+        try:
+            result = await operation()
+        except retry_on as error:
+            if is_failure is None or is_failure(error):
+                breaker.record_failure()
+                if breaker.state == "open":
+                    raise  # This failure opened the circuit; retrying now would only fail fast
+            else:
+                breaker.record_success()
+            delay = _plan_retry(error, attempt, dependency, max_attempts, base_delay, max_delay, max_retry_after, retry_after)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        except Exception:
+            breaker.record_success()
+            raise
+        except BaseException:  # Includes asyncio.CancelledError
+            breaker.release_probe()
+            raise
+        breaker.record_success()
+        return result
@@ -0,0 +1,223 @@
+import json
+import logging
+import re
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+
+logger = logging.getLogger(__name__)
+
+# A fenced block anywhere in the text (```json ... ```); the closing fence may be missing when the output was cut off
+_FENCE = re.compile(r"```[\w-]*[ \t]*\n?(.*?)(?:```|\Z)", re.DOTALL)
+
+
+class StructuredOutputError(ValueError):
+    """
+    Raised when a model response cannot be turned into JSON, even after the repair pass.
+    """
+
+
+class InvalidItem(BaseModel):
+    """
+    An element of the response list that failed validation and was dropped.
+    """
+    index: int
+    item: Any = None
+    error: str
+
+
+class ParsedOutput(BaseModel):
+    """
+    Result of parsing a model response into a list of validated items.
+    """
+    items: List[Any] = Field(default_factory=list)  # Validated model instances
+    json_items: List[Any] = Field(default_factory=list)  # The raw dicts of the valid items, in the same order
+    invalid: List[InvalidItem] = Field(default_factory=list)
+    repaired: bool = False
+
+
+def strip_code_fence(text: str) -> str:
+    """
+    Returns the content of the first Markdown code fence in the text, or the text itself if there is none.
+    Unlike str.strip('```json'), this removes the fence as a prefix/suffix and never eats characters of the payload.
+    """
+    match = _FENCE.search(text)
+    return (match.group(1) if match else text).strip()
+
+
+def _drop_trailing_comma(out: List[str]) -> None:
+    index = len(out) - 1
+    while index >= 0 and out[index].isspace():
+        index -= 1
+    if index >= 0 and out[index] == ",":
+        del out[index:]
+
+
+def repair_json(text: str) -> str:
+    """
+    Cheap local repair of the usual ways model output breaks JSON, tried before paying for another completion:
+    prose before or after the JSON value, trailing commas, and output truncated at max_tokens (cut back to the
+    last complete element and closed).
+
+    Parameters:
+        text (str): The model output, with any code fence already removed.
+
+    Returns:
+        str: The repaired JSON text. Still invalid JSON if the damage is beyond these fixes.
+    """
+    start = next((i for i, ch in enumerate(text) if ch in "[{"), None)
+    if start is None:
+        return text
+
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = escape = False
+    safe_length, safe_stack = 0, None  # End of the last complete nested value, and the brackets still open there
+    for ch in text[start:]:
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+
+        if ch == '"':
+            in_string = True
+        elif ch in "[{":
+            stack.append("]" if ch == "[" else "}")
+        elif ch in "]}":
+            if not stack:
+                break
+            _drop_trailing_comma(out)
+            out.append(stack.pop())
+            if not stack:
+                return "".join(out)  # Complete top-level value; anything after it is prose
+            safe_length, safe_stack = len(out), list(stack)
+            continue
+        out.append(ch)
+
+    if safe_stack is None:
+        return "".join(out)
+    # Truncated: keep everything up to the last complete element and close what was open at that point
+    out = out[:safe_length]
+    _drop_trailing_comma(out)
+    return "".join(out) + "".join(reversed(safe_stack))
+
+
+def extract_items(data: Any, list_key: str) -> Optional[list]:
+    """
+    Finds the item list in decoded JSON: a bare list, {list_key: [...]}, an object holding exactly one list,
+    or a single item object (which is how prompts often describe the "no match" answer).
+    """
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        if isinstance(data.get(list_key), list):
+            return data[list_key]
+        lists = [value for value in data.values() if isinstance(value, list)]
+        if len(data) == 1 and len(lists) == 1:
+            return lists[0]
+        return [data]
+    return None
+
+
+@lru_cache(maxsize=None)
+def list_adapter(item_model: Type[BaseModel]) -> TypeAdapter:
+    """
+    Returns the cached TypeAdapter validating a list of item_model; building one compiles a validator.
+    """
+    return TypeAdapter(List[item_model])
+
+
+def validate_items(items: list, item_model: Type[BaseModel]) -> Tuple[list, list, List[InvalidItem]]:
+    """
+    Validates all items in one pass. Items that fail are dropped and reported instead of failing the whole list.
+
+    Returns:
+        tuple: (valid model instances, their raw items, InvalidItem for every dropped element)
+    """
+    adapter = list_adapter(item_model)
+    try:
+        return adapter.validate_python(items), list(items), []
+    except ValidationError as e:
+        errors = {}
+        for error in e.errors(include_url=False):
+            location = error["loc"]
+            if location and isinstance(location[0], int):
+                field = ".".join(str(part) for part in location[1:]) or "item"
+                errors.setdefault(location[0], []).append(f"{field}: {error['msg']}")
+
+    kept = [item for index, item in enumerate(items) if index not in errors]
+    invalid = [InvalidItem(index=index, item=items[index], error="; ".join(messages))
+               for index, messages in sorted(errors.items())]
+    return (adapter.validate_python(kept) if kept else []), kept, invalid
+
+
+def parse_items(text: Optional[str], item_model: Type[BaseModel], list_key: str = "changes") -> ParsedOutput:
+    """
+    Parses a model response into validated items: strips code fences, decodes the JSON (repairing it if it
+    does not decode as is) and validates the items in bulk, keeping the valid ones.
+
+    Parameters:
+        text (str): The response content.
+        item_model: The pydantic model of one item.
+        list_key (str): The key holding the list when the response is an object (structured output mode).
+
+    Returns:
+        ParsedOutput: The valid items and the reasons the others were dropped.
+
+    Raises:
+        StructuredOutputError: If the response is empty or no JSON list of items can be recovered from it.
+    """
+    if not text or not text.strip():
+        raise StructuredOutputError("Empty response")
+    candidate = strip_code_fence(text)
+    repaired = False
+    try:
+        data = json.loads(candidate)
+    except json.JSONDecodeError as e:
+        try:
+            data = json.loads(repair_json(candidate))
+            repaired = True
+        except json.JSONDecodeError:
+            raise StructuredOutputError(f"Response is not valid JSON: {e}") from e
+
+    items = extract_items(data, list_key)
+    if items is None:
+        raise StructuredOutputError(f"Expected a JSON list or object, got {type(data).__name__}")
+    valid, json_items, invalid = validate_items(items, item_model)
+    return ParsedOutput(items=valid, json_items=json_items, invalid=invalid, repaired=repaired)
+
+
+def strict_json_schema(model: Type[BaseModel]) -> dict:
+    """
+    JSON schema of a pydantic model in the subset accepted by strict structured outputs: every property
+    required, no additional properties, and no titles or defaults.
+    """
+    schema = model.model_json_schema()
+
+    def visit(node: Any) -> None:
+        if isinstance(node, list):
+            for value in node:
+                visit(value)
+            return
+        if not isinstance(node, dict):
+            return
+        node.pop("title", None)
+        node.pop("default", None)
+        if node.get("type") == "object" and "properties" in node:
+            node["required"] = list(node["properties"])
+            node["additionalProperties"] = False
+        for key, value in node.items():
+            if key in ("properties", "$defs"):
+                for subschema in value.values():
+                    visit(subschema)
+            else:
+                visit(value)
+
+    visit(schema)
+    return schema
@@ -0,0 +1,105 @@
+import codecs
+import logging
+import os
+import re
+import time
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the reader's resident buffers (raw read + decoded text waiting to be cut), in MB
+BLOB_STREAM_MAX_MEMORY_MB = float(os.getenv("BLOB_STREAM_MAX_MEMORY_MB", "16"))
+# Largest segment handed to extraction, in characters; segments end on paragraph boundaries where possible
+BLOB_SEGMENT_CHARS = int(os.getenv("BLOB_SEGMENT_CHARS", "200000"))
+# Bytes requested from the blob stream per read
+BLOB_STREAM_READ_BYTES = int(os.getenv("BLOB_STREAM_READ_BYTES", str(1024 * 1024)))
+
+# Blank line, allowing for \r\n line endings and trailing spaces
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t\r]*\n")
+# Worst-case bytes per decoded character held in memory (CPython stores non-Latin-1 text as UCS-2 or UCS-4)
+_BYTES_PER_CHAR = 4
+
+
+def segment_settings(max_memory_mb: Optional[float] = None, segment_chars: Optional[int] = None,
+                     read_bytes: Optional[int] = None) -> dict:
+    """
+    Returns segment_chars and read_bytes for iter_text_segments, shrunk where needed so the reader's buffers
+    stay within max_memory_mb. The reader holds at most one read plus just under one segment plus that read
+    of decoded text at a time.
+    """
+    budget = int((BLOB_STREAM_MAX_MEMORY_MB if max_memory_mb is None else max_memory_mb) * 1024 * 1024)
+    segment_chars = segment_chars or BLOB_SEGMENT_CHARS
+    read_bytes = read_bytes or BLOB_STREAM_READ_BYTES
+    # A read costs its bytes plus their decoded text; give reads at most a quarter of the budget
+    read_bytes = max(4096, min(read_bytes, budget // (4 * (1 + _BYTES_PER_CHAR))))
+    segment_chars = max(1024, min(segment_chars, (budget - read_bytes * (1 + _BYTES_PER_CHAR)) // _BYTES_PER_CHAR))
+    return {"segment_chars": segment_chars, "read_bytes": read_bytes}
+
+
+def segment_settings_from_env() -> dict:
+    """
+    Segment settings for triggers: BLOB_STREAM_MAX_MEMORY_MB, BLOB_SEGMENT_CHARS and BLOB_STREAM_READ_BYTES.
+    """
+    return segment_settings()
+
+
+def _cut_position(buffer: str, limit: int) -> int:
+    """
+    Where to end the next segment of at most `limit` characters: after the last paragraph break, else the last
+    line break, else the last space, else at the limit.
+    """
+    last_break = None
+    for last_break in _PARAGRAPH_BREAK.finditer(buffer, 0, limit):
+        pass
+    if last_break is not None:
+        return last_break.end()
+    for separator in ("\n", " "):
+        position = buffer.rfind(separator, 0, limit)
+        if position > 0:
+            return position + 1
+    return limit
+
+
+def iter_text_segments(stream: BinaryIO, segment_chars: Optional[int] = None, read_bytes: Optional[int] = None,
+                       encoding: str = "utf-8") -> Iterator[str]:
+    """
+    Yields the text of a byte stream (e.g. a blob InputStream) in segments of at most segment_chars characters,
+    decoding incrementally as it reads. Segments end on paragraph boundaries where possible, so paragraphs reach
+    chunking intact, and they are exact slices of the text: joined, they equal stream.read().decode().
+
+    Parameters:
+        stream: A binary file-like object.
+        segment_chars (int): Maximum characters per segment (BLOB_SEGMENT_CHARS).
+        read_bytes (int): Bytes per read (BLOB_STREAM_READ_BYTES).
+        encoding (str): Text encoding; undecodable bytes are replaced rather than failing the blob.
+
+    This bounds the text held by the reader, not what the source already holds: a blob trigger's
+    func.InputStream arrives with the whole blob in memory, so there it only avoids the decoded copy and one
+    full-size string. For a constant footprint, stream from the storage SDK instead, e.g. a file object over
+    BlobClient.download_blob().chunks().
+    """
+    settings = segment_settings(segment_chars=segment_chars, read_bytes=read_bytes)
+    segment_chars, read_bytes = settings["segment_chars"], settings["read_bytes"]
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    # Read and decode time is accumulated around the work itself, not the consumer's time between segments
+    busy, total_chars, segments = 0.0, 0, 0
+    buffer = ""
+    try:
+        while True:
+            started = time.perf_counter()
+            data = stream.read(read_bytes)
+            buffer += decoder.decode(data or b"", final=not data)
+            busy += time.perf_counter() - started
+            while len(buffer) >= segment_chars or (not data and buffer):
+                cut = _cut_position(buffer, segment_chars) if len(buffer) > segment_chars else len(buffer)
+                segment, buffer = buffer[:cut], buffer[cut:]
+                total_chars += len(segment)
+                segments += 1
+                yield segment
+            if not data:
+                break
+    finally:
+        metrics.observe("stage_latency_ms", busy * 1000, stage="blob_read")
+        logger.info(f"Streamed {total_chars} characters in {segments} segment(s) of up to {segment_chars} characters")
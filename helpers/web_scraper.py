@@ -1,5 +1,18 @@
 import os
-from typing import List, Dict, Any, Tuple
+import sys
+import json
+import asyncio
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager
+from typing import List, Dict, Any, Tuple, Callable, Iterable, Iterator, AsyncIterator, Optional
+from urllib.parse import urlparse
+from dotenv import load_dotenv
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -7,6 +20,159 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, WebDriverException
 import argparse
 
+from helpers import resilience
+
+logger = logging.getLogger(__name__)
+
+# Attempts per page for browser timeouts and WebDriver errors
+SCRAPE_MAX_ATTEMPTS = int(os.getenv("SCRAPE_MAX_ATTEMPTS", "2"))
+
+
+class DriverPool:
+    """
+    Thread-safe pool of reusable WebDriver sessions.
+
+    Sessions are created lazily up to `size`, health-checked when checked out, reset (cookies, storage,
+    about:blank) when returned, and recycled after `max_uses` pages or when they stop responding.
+    """
+    def __init__(self, factory: Callable[[], Any], size: int = 4, max_uses: int = 50, checkout_timeout: float = 120):
+        self.factory = factory
+        self.size = size
+        self.max_uses = max_uses
+        self.checkout_timeout = checkout_timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._uses = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @staticmethod
+    def _is_healthy(driver) -> bool:
+        try:
+            driver.current_url  # Round-trips to the session; raises if the browser or grid node is gone
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _reset(driver) -> None:
+        driver.delete_all_cookies()
+        driver.execute_script("try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}")
+        driver.get("about:blank")
+
+    def _discard(self, driver) -> None:
+        with self._lock:
+            self._uses.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.warning(f"Error quitting WebDriver session: {e}")
+
+    def _checkout(self):
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                driver = self.factory()
+                with self._lock:
+                    self._uses[id(driver)] = 0
+                return driver
+            if self._is_healthy(driver):
+                return driver
+            logger.info("Discarding unhealthy WebDriver session")
+            self._discard(driver)
+
+    def _checkin(self, driver, failed: bool) -> None:
+        with self._lock:
+            uses = self._uses.get(id(driver), 0) + 1
+            self._uses[id(driver)] = uses
+
+        if self._closed or uses >= self.max_uses or (failed and not self._is_healthy(driver)):
+            self._discard(driver)
+            return
+        try:
+            self._reset(driver)
+        except Exception as e:
+            logger.info(f"Discarding WebDriver session that failed to reset: {e}")
+            self._discard(driver)
+            return
+        self._idle.put(driver)
+
+    @contextmanager
+    def driver(self):
+        """
+        Checks a driver out of the pool for the duration of the with-block.
+        """
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise WebDriverException(f"Timed out after {self.checkout_timeout}s waiting for a pooled WebDriver session")
+        driver, failed = None, False
+        try:
+            driver = self._checkout()
+            yield driver
+        except Exception:
+            failed = True
+            raise
+        finally:
+            if driver is not None:
+                self._checkin(driver, failed)
+            self._slots.release()
+
+    def close(self) -> None:
+        """
+        Quits every idle session. Checked-out sessions are quit when they are returned.
+        """
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+# One pool per Selenium endpoint, shared by every WebScraper in the worker process
+_pools: Dict[str, DriverPool] = {}
+_pools_lock = threading.Lock()
+
+
+def create_driver(selenium_url: str):
+    options = webdriver.ChromeOptions()
+    options.add_argument('--headless')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    return webdriver.Remote(
+        command_executor=selenium_url,
+        options=options
+    )
+
+
+def get_driver_pool(selenium_url: str) -> DriverPool:
+    """
+    Returns the shared driver pool for a Selenium endpoint, sized by SELENIUM_POOL_SIZE and recycled after
+    SELENIUM_MAX_PAGES_PER_DRIVER pages.
+    """
+    pool = _pools.get(selenium_url)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(selenium_url)
+            if pool is None:
+                pool = DriverPool(
+                    factory=lambda: create_driver(selenium_url),
+                    size=int(os.getenv('SELENIUM_POOL_SIZE', '4')),
+                    max_uses=int(os.getenv('SELENIUM_MAX_PAGES_PER_DRIVER', '50')),
+                    checkout_timeout=float(os.getenv('SELENIUM_CHECKOUT_TIMEOUT', '120')),
+                )
+                _pools[selenium_url] = pool
+    return pool
+
+
+@atexit.register
+def close_driver_pools() -> None:
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
 class WebScraper:
     def __init__(self):
         load_dotenv()
@@ -15,23 +181,19 @@ class WebScraper:
         self.selenium_url = os.getenv('SELENIUM_SCRAPER_URL', f'http://localhost:{self.port}/wd/hub')#f'http://localhost:{self.port}/wd/hub'
 
     def _create_driver(self):
-        options = webdriver.ChromeOptions()
-        options.add_argument('--headless')
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-dev-shm-usage')
-        return webdriver.Remote(
-            command_executor=self.selenium_url,
-            options=options
-        )
+        return create_driver(self.selenium_url)
 
+    @property
+    def pool(self) -> DriverPool:
+        return get_driver_pool(self.selenium_url)
 
-    def scrape_url(self, url: str) -> str:
+
+    def _render(self, url: str, extract_links: bool) -> Tuple[str, List[str]]:
         """
-        Scrapes the webpage for its text content in the body tag.
-        """        
-        driver = None
-        try:
-            driver = self._create_driver()
+        One attempt at loading a page in a pooled browser session: the body text and, if asked, the <a> links.
+        """
+        with self.pool.driver() as driver:
+            driver.set_page_load_timeout(self.timeout)  # Bounds driver.get, not just the wait for <body> below
             driver.get(url)
 
             # Wait until the body tag is present, indicating the page has fully loaded
@@ -39,19 +201,36 @@ class WebScraper:
                 EC.presence_of_element_located((By.TAG_NAME, "body"))
             )
 
-            # Once loaded, extract the entire page text
+            # Extract the entire page text
             page_text = driver.find_element(By.TAG_NAME, "body").text
-            return page_text
+            if not extract_links:
+                return page_text, []
 
-        except (TimeoutException, WebDriverException) as e:
-            print(f"Error occurred while scraping {url}: {e}")
-            return ""  # Return a blank string in case of an error
-
-        finally:
-            if driver:
-                driver.quit()
+            # Extract all URLs from <a> tags
+            anchor_elements = driver.find_elements(By.TAG_NAME, "a")
+            urls = [anchor.get_attribute("href") for anchor in anchor_elements if anchor.get_attribute("href")]
+            return page_text, urls
 
+    def _render_with_retry(self, url: str, extract_links: bool) -> Tuple[str, List[str]]:
+        """
+        Renders a page, retrying timeouts and WebDriver errors (SCRAPE_MAX_ATTEMPTS attempts) behind the
+        "selenium" circuit breaker. Page load timeouts do not count against the breaker, since they are usually
+        the site's fault rather than the grid's. Returns ("", []) if every attempt fails or the circuit is open.
+        """
+        try:
+            return resilience.call_with_retry(
+                lambda: self._render(url, extract_links), "selenium", retry_on=(TimeoutException, WebDriverException),
+                max_attempts=SCRAPE_MAX_ATTEMPTS, base_delay=1.0, max_delay=10.0,
+                is_failure=lambda e: not isinstance(e, TimeoutException))
+        except (TimeoutException, WebDriverException, resilience.CircuitOpenError) as e:
+            logger.warning(f"Error occurred while scraping {url}: {e}")
+            return "", []  # Return a blank result in case of an error
 
+    def scrape_url(self, url: str) -> str:
+        """
+        Scrapes the webpage for its text content in the body tag.
+        """
+        return self._render_with_retry(url, extract_links=False)[0]
 
     def scrape_url_and_extract_links(self, url: str) -> Tuple[str, List[str]]:
         """
@@ -59,43 +238,112 @@ class WebScraper:
         
         Returns a tuple where the first element is the text and the second is a list of URLs.
         """
-        driver = None
-        try:
-            driver = self._create_driver()
-            driver.get(url)
+        return self._render_with_retry(url, extract_links=True)
 
-            # Wait until the body tag is present, indicating the page has fully loaded
-            WebDriverWait(driver, self.timeout).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
 
-            # Extract the entire page text
-            page_text = driver.find_element(By.TAG_NAME, "body").text
+    def _scrape_result(self, url: str, extract_links: bool) -> Dict[str, Any]:
+        started = time.perf_counter()
+        result = {"url": url}
+        if extract_links:
+            result["content"], result["links"] = self.scrape_url_and_extract_links(url)
+        else:
+            result["content"] = self.scrape_url(url)
+        result["elapsed"] = round(time.perf_counter() - started, 3)
+        return result
 
-            # Extract all URLs from <a> tags
-            anchor_elements = driver.find_elements(By.TAG_NAME, "a")
-            urls = [anchor.get_attribute("href") for anchor in anchor_elements if anchor.get_attribute("href")]
+    def iter_bulk_scrape(self, urls: Iterable[str], max_workers: Optional[int] = None,
+                         per_host_limit: Optional[int] = None, min_delay: Optional[float] = None,
+                         deadline: Optional[float] = None, extract_links: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Scrapes URLs concurrently on pooled drivers and yields each result as soon as its page finishes.
 
-            return page_text, urls
+        Parameters:
+            urls: The URLs to scrape.
+            max_workers (int): Concurrent scrapes (defaults to SELENIUM_POOL_SIZE).
+            per_host_limit (int): Maximum concurrent scrapes per host (SCRAPE_PER_HOST_LIMIT, default 2).
+            min_delay (float): Minimum seconds between two request starts on the same host (SCRAPE_MIN_DELAY, default 1).
+            deadline (float): Overall time budget in seconds; URLs not started by then are skipped. Scrapes already
+                running are left to finish, each bounded by the page load timeout (TIMEOUT) per attempt.
+            extract_links (bool): Also return the <a href> links of each page.
+
+        Yields dicts with url, content, elapsed and, if requested, links.
+        """
+        max_workers = max_workers or self.pool.size
+        per_host_limit = per_host_limit or int(os.getenv('SCRAPE_PER_HOST_LIMIT', '2'))
+        min_delay = float(os.getenv('SCRAPE_MIN_DELAY', '1')) if min_delay is None else min_delay
+        stop_at = time.monotonic() + deadline if deadline else None
 
-        except (TimeoutException, WebDriverException) as e:
-            print(f"Error occurred while scraping {url}: {e}")
-            return "", []
+        pending_by_host: Dict[str, deque] = {}
+        for url in urls:
+            pending_by_host.setdefault(urlparse(url).netloc.lower(), deque()).append(url)
+        in_flight_by_host: Dict[str, int] = {host: 0 for host in pending_by_host}
+        next_start_by_host: Dict[str, float] = {host: 0.0 for host in pending_by_host}
+        futures = {}
 
-        finally:
-            if driver:
-                driver.quit()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            try:
+                while futures or any(pending_by_host.values()):
+                    now = time.monotonic()
+                    if stop_at is not None and now >= stop_at:
+                        skipped = sum(len(pending) for pending in pending_by_host.values())
+                        if skipped:
+                            logger.warning(f"Scrape deadline reached, skipping {skipped} URLs not yet started")
+                            pending_by_host.clear()
 
+                    # Start every URL whose host has a free slot and has waited out its politeness delay
+                    wake_at = None
+                    for host, pending in pending_by_host.items():
+                        while (pending and len(futures) < max_workers and in_flight_by_host[host] < per_host_limit
+                               and next_start_by_host[host] <= now):
+                            url = pending.popleft()
+                            futures[executor.submit(self._scrape_result, url, extract_links)] = host
+                            in_flight_by_host[host] += 1
+                            next_start_by_host[host] = now + min_delay
+                        if pending and in_flight_by_host[host] < per_host_limit and next_start_by_host[host] > now:
+                            wake_at = next_start_by_host[host] if wake_at is None else min(wake_at, next_start_by_host[host])
 
-    def bulk_scrape(self, urls: List[str]) -> List[Dict[str, Any]]:
-        results = []
-        for url in urls:
-            content = self.scrape_url(url)
-            results.append({
-                "url": url,
-                "content": content
-            })
-        return results
+                    if not futures:
+                        if wake_at is not None:
+                            time.sleep(max(0.0, wake_at - now))
+                        continue
+
+                    timeout = None if wake_at is None else max(0.0, wake_at - now)
+                    if stop_at is not None and now < stop_at and any(pending_by_host.values()):
+                        # Wake up at the deadline to drop the URLs not started yet. Once they are dropped, only
+                        # in-flight scrapes remain and we block until one finishes (each is bounded by self.timeout)
+                        timeout = stop_at - now if timeout is None else min(timeout, stop_at - now)
+                    done, _ = wait(list(futures), timeout=timeout, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        host = futures.pop(future)
+                        in_flight_by_host[host] -= 1
+                        yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    async def aiter_bulk_scrape(self, urls: Iterable[str], **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Async iterator over iter_bulk_scrape, for callers running inside an event loop.
+        """
+        loop = asyncio.get_running_loop()
+        results = self.iter_bulk_scrape(urls, **kwargs)
+        done = object()
+        try:
+            while True:
+                result = await loop.run_in_executor(None, next, results, done)
+                if result is done:
+                    break
+                yield result
+        finally:
+            results.close()
+
+    def bulk_scrape(self, urls: List[str], **kwargs) -> List[Dict[str, Any]]:
+        """
+        Scrapes URLs concurrently (see iter_bulk_scrape) and returns the results in input order.
+        """
+        order = {url: i for i, url in enumerate(urls)}
+        results = list(self.iter_bulk_scrape(urls, **kwargs))
+        return sorted(results, key=lambda result: order[result["url"]])
 
     def set_timeout(self, timeout: int) -> None:
         self.timeout = timeout
@@ -110,7 +358,13 @@ def main():
     parser = argparse.ArgumentParser(description="Web scraper with Selenium")
     
     # Add arguments for the URL and output type
-    parser.add_argument("url", help="The URL to scrape")
+    parser.add_argument("url", nargs="?", help="The URL to scrape")
+    parser.add_argument("--url-file", help="Scrape every URL in this file (one per line) concurrently")
+    parser.add_argument("--jsonl", default="-", help="With --url-file: write results as JSON Lines to this path (default stdout)")
+    parser.add_argument("--workers", type=int, default=None, help="With --url-file: concurrent scrapes")
+    parser.add_argument("--per-host", type=int, default=None, help="With --url-file: concurrent scrapes per host")
+    parser.add_argument("--min-delay", type=float, default=None, help="With --url-file: seconds between requests to one host")
+    parser.add_argument("--deadline", type=float, default=None, help="With --url-file: overall time budget in seconds")
     parser.add_argument(
         "--output", 
         choices=["text", "length", "urls", "text_and_urls"], 
@@ -120,12 +374,28 @@ def main():
 
     # Parse the arguments
     args = parser.parse_args()
+    if not args.url and not args.url_file:
+        parser.error("either a URL or --url-file is required")
 
     # Create the WebScraper instance
     scraper = WebScraper()
 
     # Handle the different output options
-    if args.output == "length":
+    if args.url_file:
+        # Bulk mode: stream one JSON line per URL as each page finishes
+        with open(args.url_file, "r") as url_file:
+            urls = [line.strip() for line in url_file if line.strip()]
+        output = sys.stdout if args.jsonl == "-" else open(args.jsonl, "w")
+        try:
+            for result in scraper.iter_bulk_scrape(urls, max_workers=args.workers, per_host_limit=args.per_host,
+                                                   min_delay=args.min_delay, deadline=args.deadline,
+                                                   extract_links=args.output in ("urls", "text_and_urls")):
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+        finally:
+            if output is not sys.stdout:
+                output.close()
+    elif args.output == "length":
         # Scrape only the text and print the length
         content = scraper.scrape_url(args.url)
         print(f"Total length of characters: {len(content)}")
@@ -2,9 +2,7 @@ import azure.functions as func
 import logging
 from datetime import datetime
 import json
-import redis
 import os
-import helpers.redis_handler as rh
 
 bp = func.Blueprint()  # Create a blueprint
 
@@ -12,24 +10,34 @@ bp = func.Blueprint()  # Create a blueprint
 # Define the queue name
 QUEUE_NAME = "url-job-q"
 
+# Upper bound on keys sampled for the request log; SCAN stops once it is reached
+REDIS_KEY_SAMPLE_LIMIT = int(os.getenv("REDIS_KEY_SAMPLE_LIMIT", "100"))
+
 @bp.function_name(name="http_redis_trigger")
 @bp.route(route="redis", methods=["GET","POST","PUT", "DELETE"])
 def redis_trigger(req: func.HttpRequest) -> func.HttpResponse:
 
     # Extract the state and name from the request body
     
+    import helpers.redis_handler as rh  # Imported on first request, not at cold start
+
     # Log the info
     logging.info(f"Redis Request Received!")
-    keys = rh.list_all_keys()
-    logging.info(f"Keys: {keys}")
+    # Listing keys costs a SCAN round-trip, so only do it when asked (?keys=true)
+    if req.params.get('keys', '').lower() == 'true':
+        keys = rh.list_all_keys(limit=REDIS_KEY_SAMPLE_LIMIT)
+        logging.info(f"Keys (first {REDIS_KEY_SAMPLE_LIMIT}): {keys}")
 
     try:
-        retrieved_data = rh.get_data('web_resources')
-        parsed_data = json.loads(retrieved_data)
+        # web_resources is either the legacy JSON string {"resources": [...]} or a hash of name -> resource
+        # Served from the in-process cache; Redis is only consulted when the local copy is due for a version check
+        parsed_data = rh.get_cached_json('web_resources') or {}
+        resources = parsed_data['resources'] if 'resources' in parsed_data else list(parsed_data.values())
 
-        for resource in parsed_data['resources']:
+        for resource in resources:
             print(f"Name: {resource['name']}, URL: {resource['url']}")
     except Exception as e:
         logging.error(f"Error retrieving data from Redis: {str(e)}")
+    logging.info(f"Local Redis cache stats: {rh.local_cache_stats()}")
     
     return func.HttpResponse("Redis Request Received!", status_code=200)
\ No newline at end of file
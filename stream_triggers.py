@@ -0,0 +1,83 @@
+import azure.functions as func
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import List
+
+bp = func.Blueprint()  # Blueprint for the Redis stream consumer, registered when QUEUE_BACKEND=redis_stream
+
+STREAM_POLL_SCHEDULE = os.getenv("REDIS_STREAM_POLL_SCHEDULE", "*/15 * * * * *")
+# Storage queue carrying drain requests from the dispatcher to the (scaled out) drain function
+STREAM_DRAIN_QUEUE = os.getenv("REDIS_STREAM_DRAIN_QUEUE", "stream-drain-q")
+# Keep each run well inside the function timeout and below REDIS_STREAM_MIN_IDLE_MS, so a live run's
+# pending messages are never reclaimed by another worker
+STREAM_MAX_RUN_SECONDS = float(os.getenv("REDIS_STREAM_MAX_RUN_SECONDS", "240"))
+
+
+@bp.function_name(name="DispatchStreamDrains")
+@bp.timer_trigger(arg_name="timer", schedule=STREAM_POLL_SCHEDULE, run_on_startup=False)
+@bp.queue_output(arg_name="drains", queue_name=STREAM_DRAIN_QUEUE, connection="STORAGE_CONNECTION")
+def dispatch_stream_drains(timer: func.TimerRequest, drains: func.Out[List[str]]):
+    """
+    Sizes the Redis work stream's backlog and queues one drain request per consumer it needs, less the
+    drains still in flight from earlier ticks.
+
+    Timer triggers run as a singleton, so the timer only dispatches. The drain requests are handled by
+    drain_stream, a queue trigger the host scales out across instances, so several consumers read the
+    stream at once as members of the consumer group. Each request carries a lease that counts it as in
+    flight until the drain releases it or the lease expires.
+    """
+    import helpers.redis_streams
+
+    leases = helpers.redis_streams.lease_drains(helpers.redis_streams.drains_needed())
+    if leases:
+        requested_at = datetime.now(timezone.utc).isoformat()
+        drains.set([json.dumps({"requested_at": requested_at, "drain": index, "lease": lease})
+                    for index, lease in enumerate(leases)])
+    logging.info(f"Dispatched {len(leases)} stream drain(s)")
+
+
+@bp.function_name(name="DrainStream")
+@bp.queue_trigger(arg_name="msg", queue_name=STREAM_DRAIN_QUEUE, connection="STORAGE_CONNECTION")
+def drain_stream(msg: func.QueueMessage):
+    """
+    Drains the Redis work stream in batches with the same processing as the 'url-job-q' queue trigger.
+
+    Documents are upserted with the Cosmos DB SDK rather than an output binding: a binding is only written
+    after the function returns, too late to know whether it succeeded. Messages are acknowledged only once
+    the writer has flushed without error, so a failed write or a worker that dies mid-run leaves its messages
+    pending for another drain to reclaim.
+    """
+    import helpers.fetch_store
+    import helpers.persistence
+    import helpers.queue_processing
+    import helpers.redis_streams
+
+    try:
+        lease = json.loads(msg.get_body()).get("lease")
+    except (ValueError, AttributeError):
+        lease = None
+    consumer = helpers.redis_streams.StreamConsumer()
+    processed = []
+    deadline = time.monotonic() + STREAM_MAX_RUN_SECONDS
+
+    def handle(payload: dict) -> None:
+        # Pages that succeeded are remembered even when the message fails, so its retry skips them
+        outcome = helpers.queue_processing.process_message(payload, writer)
+        processed.extend(outcome.processed)
+        outcome.raise_for_failures()
+
+    try:
+        with helpers.persistence.create_writer() as writer:
+            stats = consumer.consume(handle, deadline=deadline, auto_ack=False)
+        consumer.ack(stats.acked_ids)
+        consumer.close()
+    finally:
+        helpers.redis_streams.release_drain(lease)
+    logging.info(f"Stream run: {stats.batches} batches, {stats.processed} messages processed, {stats.failed} failed, "
+                 f"{stats.reclaimed} reclaimed, {stats.dead_lettered} dead-lettered, {writer.written} document(s) stored.")
+
+    for fetched in processed:
+        helpers.fetch_store.save_metadata(fetched)
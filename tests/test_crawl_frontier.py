@@ -0,0 +1,45 @@
+import fakeredis
+import pytest
+
+import helpers.redis_handler as rh
+from helpers.crawl_frontier import Frontier, FrontierConfig, score_url
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(rh, "get_client", lambda: client)
+    return client
+
+
+def test_score_url_matches_whole_words():
+    assert score_url("https://revenue.example.gov/taxonomy/lawn") == 0
+    assert score_url("https://revenue.example.gov/withholding-taxes/changes") == 4 + 3 + 2
+    assert score_url("https://revenue.example.gov/about/careers") == -3
+
+
+def test_released_links_can_be_claimed_again(client):
+    frontier = Frontier("PA", FrontierConfig(domain_budget=2))
+    links = ["/tax/a", "/tax/b"]
+    source = "https://revenue.example.gov/"
+
+    accepted = frontier.filter_links(links, source, depth=0)
+    assert len(accepted) == 2
+    assert frontier.filter_links(links, source, depth=0) == []
+
+    frontier.release(accepted)
+    assert sorted(frontier.filter_links(links, source, depth=0)) == sorted(accepted)
+
+
+def test_links_over_the_domain_budget_stay_unseen(client):
+    frontier = Frontier("PA", FrontierConfig(domain_budget=1))
+    source = "https://revenue.example.gov/"
+
+    [first] = frontier.filter_links(["/tax/a", "/tax/b"], source, depth=0)
+    [rejected] = {"https://revenue.example.gov/tax/a", "https://revenue.example.gov/tax/b"} - {first}
+    assert frontier.unseen([first, rejected]) == [rejected]
+    assert int(client.get(frontier._budget_key("revenue.example.gov"))) == 1
+
+    frontier.release([first])
+    assert len(frontier.filter_links(["/tax/a", "/tax/b"], source, depth=0)) == 1
+    assert int(client.get(frontier._budget_key("revenue.example.gov"))) == 1
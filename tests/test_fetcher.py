@@ -0,0 +1,50 @@
+import requests
+
+import helpers.fetcher as fetcher
+from helpers import metrics
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, content_type="text/html", text="", content=b""):
+        self.status_code = status_code
+        self.url = "https://example.gov/page"
+        self.headers = {"Content-Type": content_type}
+        self.text = text
+        self.content = content
+
+
+class FakeScraper:
+    def scrape_url_and_extract_links(self, url):
+        return "rendered text", []
+
+
+def test_pdf_extraction_error_is_reported(monkeypatch):
+    monkeypatch.setattr(fetcher, "_get_with_retry", lambda url, headers: FakeResponse(
+        content_type="application/pdf", content=b"not a pdf"))
+    result = fetcher.fetch("https://example.gov/file.pdf", allow_selenium=False)
+
+    assert result.error.startswith("PDF extraction failed")
+    assert result.tier == "http" and result.escalation_reason is None
+
+
+def test_http_failure_without_browser_is_an_error(monkeypatch):
+    monkeypatch.setattr(fetcher, "_get_with_retry", lambda url, headers: FakeResponse(status_code=403))
+    result = fetcher.fetch("https://example.gov/page", allow_selenium=False)
+
+    assert result.error == "HTTP 403" and result.escalation_reason == "http_403"
+
+
+def test_scrape_metric_covers_http_tier_before_escalation(monkeypatch):
+    def slow_failure(url, headers):
+        fetcher.time.sleep(0.05)
+        raise requests.exceptions.ConnectionError("refused")
+
+    monkeypatch.setattr(fetcher, "_get_with_retry", slow_failure)
+    observed = []
+    monkeypatch.setattr(metrics, "observe", lambda name, value, **tags: observed.append((value, tags)))
+    result = fetcher.fetch("https://example.gov/page", scraper=FakeScraper())
+
+    assert result.tier == "selenium" and result.escalation_reason == "http_error"
+    [(value, tags)] = observed
+    assert tags["tier"] == "selenium" and value >= 50
+    assert result.elapsed < 0.05
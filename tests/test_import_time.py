@@ -0,0 +1,8 @@
+from benchmarks import check_import_time
+
+
+def test_function_app_cold_start_stays_lazy():
+    cumulative, _ = check_import_time.measure("function_app")
+
+    assert check_import_time.loaded_at_startup(cumulative) == []
+    assert cumulative["function_app"] / 1000 <= check_import_time.IMPORT_BUDGET_MS
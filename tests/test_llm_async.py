@@ -0,0 +1,38 @@
+import asyncio
+import threading
+
+import helpers.llm as llm
+
+
+class RecordingCache:
+    def __init__(self):
+        self.threads, self.values = [], {}
+
+    def get(self, key):
+        self.threads.append(threading.current_thread())
+        return self.values.get(key)
+
+    def set(self, key, value):
+        self.threads.append(threading.current_thread())
+        self.values[key] = value
+
+
+def test_async_cache_lookups_run_off_the_event_loop(monkeypatch):
+    cache = RecordingCache()
+    monkeypatch.setenv("LLM_CACHE_ENABLED", "true")
+    monkeypatch.setattr(llm, "get_result_cache", lambda: cache)
+    monkeypatch.setattr(llm, "get_async_client", lambda: None)
+    monkeypatch.setattr(llm, "_completion_request", lambda client, prompt, model: {"model": "test"})
+
+    async def create_completion(client, request, state):
+        return object()
+
+    monkeypatch.setattr(llm, "_create_completion_async", create_completion)
+    monkeypatch.setattr(llm, "_parse_completion", lambda response, state: ("{}", [], llm.TaxChangeResponse(changes=[])))
+
+    first = asyncio.run(llm.call_llm_api_async("Withholding notice", "PA"))
+    second = asyncio.run(llm.call_llm_api_async("Withholding notice", "PA"))
+
+    assert first[0] == second[0] == "{}"
+    assert len(cache.threads) == 3  # Miss, store, hit
+    assert threading.main_thread() not in cache.threads
@@ -0,0 +1,87 @@
+import fakeredis
+import pytest
+
+import helpers.llm_cache as llm_cache
+import helpers.redis_handler as rh
+from helpers.llm_cache import LLMResultCache, LRUCache, make_cache_key, normalize_text
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(rh, "get_client", lambda: client)
+    return client
+
+
+@pytest.mark.parametrize("first, second", [
+    ("Tax  rate\n\nchanges", "Tax rate changes"),
+    ("  padded  ", "padded"),
+    ("ﬁscal year", "fiscal year"),  # NFKC folds the ligature
+])
+def test_cosmetic_differences_share_a_key(first, second):
+    assert normalize_text(first) == normalize_text(second)
+    assert make_cache_key(first, "pa", "gpt", "p1") == make_cache_key(second, "PA", "gpt", "p1")
+
+
+@pytest.mark.parametrize("changed", [
+    ("other text", "PA", "gpt", "p1"),
+    ("text", "NJ", "gpt", "p1"),
+    ("text", "PA", "gpt-mini", "p1"),
+    ("text", "PA", "gpt", "p2"),
+])
+def test_any_input_changes_the_key(changed):
+    assert make_cache_key(*changed) != make_cache_key("text", "PA", "gpt", "p1")
+
+
+def test_lru_evicts_least_recently_used_entry():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.evictions == 1
+
+
+def test_lru_evicts_by_size_and_skips_oversized_values():
+    cache = LRUCache(max_bytes=10)
+    cache.set("a", "a", size=6)
+    cache.set("b", "b", size=6)
+    cache.set("huge", "h", size=11)
+
+    assert cache.get("a") is None and cache.get("b") == "b"
+    assert cache.get("huge") is None
+
+
+def test_lru_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(llm_cache.time, "monotonic", lambda: now[0])
+    cache = LRUCache(ttl_seconds=10)
+    cache.set("a", 1)
+
+    now[0] += 9
+    assert cache.get("a") == 1
+    now[0] += 2
+    assert cache.get("a") is None and len(cache) == 0
+
+
+def test_results_are_shared_through_redis(client):
+    value = {"raw_response": "[]", "json_response": []}
+    LLMResultCache().set("key", value)
+
+    other_worker = LLMResultCache()
+    assert other_worker.get("key") == value
+    assert other_worker.get("key") == value
+    assert other_worker.get("missing") is None
+    assert (other_worker.redis_hits, other_worker.local_hits, other_worker.misses) == (1, 1, 1)
+    assert client.ttl("llmcache:key") > 0
+
+
+def test_unreadable_redis_entry_is_a_miss(client):
+    client.set("llmcache:key", "{not json")
+    cache = LLMResultCache()
+
+    assert cache.get("key") is None
+    assert cache.stats()["misses"] == 1
@@ -0,0 +1,29 @@
+import pytest
+
+import helpers.llm as llm
+
+
+def fake_call(fail_on=None):
+    def call_llm_api(text, state, model=None):
+        if fail_on and fail_on in text:
+            raise RuntimeError("rate limited")
+        return "{}", [], llm.TaxChangeResponse(changes=[])
+    return call_llm_api
+
+
+def test_chunked_extraction_returns_all_chunks(monkeypatch):
+    monkeypatch.setattr(llm, "call_llm_api", fake_call())
+    responses, json_response, _, reports = llm.call_llm_api_chunked(
+        ["first page " * 50, "second page " * 50], "PA", max_chunk_tokens=200, overlap_tokens=0)
+
+    assert len(reports) > 1 and len(responses) == len(reports)
+    assert not any(report.error for report in reports)
+
+
+def test_chunked_extraction_raises_on_partial_failure(monkeypatch):
+    monkeypatch.setattr(llm, "call_llm_api", fake_call(fail_on="second"))
+    with pytest.raises(llm.ChunkedExtractionError) as raised:
+        llm.call_llm_api_chunked(["first page " * 50, "second page " * 50], "PA", max_chunk_tokens=200, overlap_tokens=0)
+
+    failed = [report for report in raised.value.reports if report.error]
+    assert failed and len(failed) < len(raised.value.reports)
@@ -0,0 +1,48 @@
+import pytest
+
+import helpers.llm as llm
+from helpers.llm_cache import LLMResultCache
+
+DOCUMENTS = [llm.PackedDocument(source_id=f"doc-{index}", state="PA", text=f"Withholding notice {index}")
+             for index in range(3)]
+
+
+@pytest.fixture(autouse=True)
+def cache(monkeypatch):
+    cache = LLMResultCache(use_redis=False)
+    monkeypatch.setattr(llm, "get_result_cache", lambda: cache)
+    monkeypatch.setattr(llm, "get_client", lambda: None)
+    monkeypatch.setenv("LLM_CACHE_ENABLED", "true")
+    monkeypatch.delenv("LLM_MODEL", raising=False)
+    return cache
+
+
+def single_result(text, state, model=None, use_cache=True):
+    return "single", [], llm.TaxChangeResponse(changes=[])
+
+
+def test_failed_pack_falls_back_to_single_requests(monkeypatch):
+    def fail(documents, model):
+        raise RuntimeError("context length exceeded")
+
+    monkeypatch.setattr(llm, "_call_pack", fail)
+    monkeypatch.setattr(llm, "call_llm_api", single_result)
+    results = llm.call_llm_api_packed(DOCUMENTS, pack_tokens=10_000, max_document_tokens=1_000)
+
+    assert [result.error for result in results] == [None] * 3
+    assert [result.raw_response for result in results] == ["single"] * 3
+    assert not any(result.packed for result in results)
+
+
+def test_packed_results_are_not_served_to_single_requests(monkeypatch):
+    monkeypatch.setattr(llm, "_call_pack", lambda documents, model: {
+        index: ("packed", [], llm.TaxChangeResponse(changes=[])) for index in range(len(documents))})
+    results = llm.call_llm_api_packed(DOCUMENTS, pack_tokens=10_000, max_document_tokens=1_000)
+    assert all(result.packed for result in results)
+
+    document = DOCUMENTS[0]
+    single_key = llm._cache_key_for(document.text, document.state, {"model": None}, True)
+    assert llm._cached_result(single_key) is None
+
+    monkeypatch.setattr(llm, "_call_pack", lambda documents, model: pytest.fail("served from the cache"))
+    assert [result.raw_response for result in llm.call_llm_api_packed(DOCUMENTS)] == ["packed"] * 3
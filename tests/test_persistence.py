@@ -0,0 +1,104 @@
+import pytest
+
+from helpers.persistence import BindingSink, DocumentWriter, build_documents, document_id
+
+
+class ListSink:
+    def __init__(self):
+        self.batches = []
+        self.closed = False
+
+    def write(self, documents):
+        self.batches.append(list(documents))
+
+    def close(self):
+        self.closed = True
+
+
+class FakeOutput:
+    def __init__(self):
+        self.calls = []
+
+    def set(self, value):
+        self.calls.append(value)
+
+
+@pytest.mark.parametrize("first, second", [
+    (("PA", "https://example.gov/a", "sha"), ("pa", " https://EXAMPLE.gov/a ", "sha")),
+    (("PA", 1), ("PA", "1")),
+])
+def test_document_id_is_stable(first, second):
+    assert document_id(*first) == document_id(*second)
+
+
+@pytest.mark.parametrize("other", [
+    ("NJ", "https://example.gov/a", "sha"),
+    ("PA", "https://example.gov/b", "sha"),
+    ("PA", "https://example.gov/a", "sha2"),
+])
+def test_document_id_depends_on_every_part(other):
+    assert document_id(*other) != document_id("PA", "https://example.gov/a", "sha")
+
+
+def test_change_mode_builds_one_document_per_change():
+    changes = [{"category": "Withholding", "subcategory": "Rates"}, {"category": "Withholding", "subcategory": "Forms"}]
+    documents = build_documents("PA", "https://example.gov/a", changes, "sha", mode="change")
+    source_documents = build_documents("PA", "https://example.gov/a", changes, "sha", mode="source")
+
+    assert [document["change"] for document in documents] == changes
+    assert len({document["id"] for document in documents}) == 2
+    assert [document["id"] for document in source_documents] == [document_id("PA", "https://example.gov/a", "sha")]
+    assert build_documents("PA", "u", changes, "sha", mode="change")[0]["id"] == \
+        build_documents("PA", "u", changes, "sha", mode="change", created_at="later")[0]["id"]
+
+
+def test_writer_flushes_full_batches_and_collapses_ids():
+    sink = ListSink()
+    writer = DocumentWriter(sink, max_batch=3, max_interval=60)
+    writer.add([{"id": "a", "v": 1}, {"id": "b"}])
+    writer.add([{"id": "a", "v": 2}])
+    assert sink.batches == []
+
+    writer.add([{"id": "c"}])
+    assert sink.batches == [[{"id": "a", "v": 2}, {"id": "b"}, {"id": "c"}]]
+    assert writer.written == 3
+
+
+def test_writer_flushes_the_rest_on_close():
+    sink = ListSink()
+    with DocumentWriter(sink, max_batch=10, max_interval=60) as writer:
+        writer.add([{"id": "a"}])
+    assert sink.batches == [[{"id": "a"}]] and sink.closed
+    assert writer.written == 1
+
+
+def test_writer_does_not_flush_when_the_body_raises():
+    sink, output = ListSink(), FakeOutput()
+    with pytest.raises(RuntimeError):
+        with DocumentWriter(sink, max_batch=10, max_interval=60) as writer:
+            writer.add([{"id": "a"}])
+            raise RuntimeError("extraction failed")
+    with pytest.raises(RuntimeError):
+        with DocumentWriter(BindingSink(output)) as writer:
+            writer.add([{"id": "a"}])
+            raise RuntimeError("extraction failed")
+
+    assert sink.batches == [] and not sink.closed
+    assert output.calls == []
+
+
+def test_binding_sink_sets_the_binding_once():
+    output = FakeOutput()
+    with DocumentWriter(BindingSink(output), max_batch=1, max_interval=60) as writer:
+        writer.add([{"id": "a"}])
+        writer.add([{"id": "b"}])
+
+    [documents] = output.calls
+    assert [document["id"] for document in documents] == ["a", "b"]
+
+
+def test_binding_sink_without_documents_leaves_the_binding_unset():
+    output = FakeOutput()
+    with DocumentWriter(BindingSink(output)):
+        pass
+    assert output.calls == []
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from helpers import prefilter
+
+
+@pytest.mark.parametrize("state", ["PA", "pa", " Pa "])
+def test_state_terms_ignore_case(state):
+    terms = prefilter.get_terms(state)
+    assert terms["uc fund"] == 3.0
+
+
+@pytest.mark.parametrize("state", ["WA", "wa"])
+def test_term_file_terms_ignore_case(tmp_path, monkeypatch, state):
+    path = tmp_path / "terms.json"
+    path.write_text(json.dumps({"*": {"payroll notice": 2}, "wa": {"cares fund": 4}}), encoding="utf-8")
+    monkeypatch.setattr(prefilter, "PREFILTER_TERMS_PATH", str(path))
+
+    terms = prefilter.get_terms(state)
+    assert terms["payroll notice"] == 2.0
+    assert terms["cares fund"] == 4.0
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Employers must update withholding tables.", {"employer": 1, "withhold": 1}),
+    ("The PAYROLL\n TAXES and the tax rate", {"payroll tax": 1, "tax rate": 1}),
+    ("Unwithholding and withholdings", {"withhold": 1}),
+    ("Syntax and taxonomy", {}),
+])
+def test_matcher_counts_whole_terms_and_prefixes(text, expected):
+    assert dict(prefilter.get_matcher("PA").count(text)) == expected
+
+
+def test_irrelevant_document_is_skipped():
+    result, kept = prefilter.screen("Office hours and parking information for visitors.", "PA")
+    assert not result.relevant and kept == ""
+    assert result.reason.startswith("keyword score")
+
+
+def test_relevant_document_is_kept_whole():
+    text = "New withholding tables apply. The unemployment insurance wage base rises."
+    result, kept = prefilter.screen(text, "PA")
+    assert result.relevant and kept == text
+
+
+def test_long_page_is_cut_to_relevant_paragraphs():
+    filler = ["Visitor parking is available on level two. " * 5 for _ in range(6)]
+    relevant = "The withholding tax rate for employers changes on January 1."
+    text = "\n\n".join(filler[:3] + [relevant] + filler[3:])
+    result, kept = prefilter.screen(text, "PA", shrink_min_chars=200, context=0)
+
+    assert result.relevant and result.shrunk
+    assert kept == relevant
+
+
+def test_pages_are_held_until_the_document_qualifies():
+    page_screen = prefilter.PageScreen("PA", shrink_min_chars=10_000)
+    pages = ["Withholding notice.", "Nothing here.", "The unemployment insurance wage base rises."]
+    kept = list(page_screen.filter(pages))
+
+    assert kept == ["Withholding notice.", "", "The unemployment insurance wage base rises."]
+    assert page_screen.result.pages == 3
@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+import helpers.queue_fanout as queue_fanout
+
+
+class FlakyQueueClient:
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, message):
+        if "/bad" in message:
+            raise ConnectionError("reset by peer")
+        self.sent.append(message)
+
+
+def test_partial_send_failure_reports_the_unsent_items(monkeypatch):
+    client = FlakyQueueClient()
+    monkeypatch.setattr(queue_fanout, "QUEUE_BACKEND", "storage")
+    monkeypatch.setattr(queue_fanout, "get_queue_client", lambda queue_name: client)
+    items = [queue_fanout.make_queue_item("PA", url, depth=1)
+             for url in ["https://example.gov/ok1", "https://example.gov/ok2", "https://example.gov/bad1",
+                         "https://example.gov/bad2", "https://example.gov/ok3"]]
+
+    with pytest.raises(queue_fanout.FanoutError) as raised:
+        queue_fanout.send_items(items, urls_per_message=1)
+
+    assert raised.value.sent == 3 and len(client.sent) == 3
+    assert sorted(item["url"] for item in raised.value.unsent) == ["https://example.gov/bad1", "https://example.gov/bad2"]
+    assert all(item["state"] == "PA" and item["depth"] == 1 for item in raised.value.unsent)
+    assert sorted(item["url"] for message in client.sent for item in queue_fanout.expand_payload(json.loads(message))) == [
+        "https://example.gov/ok1", "https://example.gov/ok2", "https://example.gov/ok3"]
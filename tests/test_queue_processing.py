@@ -0,0 +1,116 @@
+import fakeredis
+import pytest
+
+import helpers.fetcher
+import helpers.fetch_store
+import helpers.llm
+import helpers.queue_fanout
+import helpers.queue_processing as qp
+import helpers.redis_handler as rh
+from helpers.crawl_frontier import Frontier
+from helpers.persistence import DocumentWriter
+
+PAGE = "Withholding tax rate changes for employers. " * 40
+SOURCE_A = "https://revenue.example.gov/notice-a"
+SOURCE_B = "https://revenue.example.gov/notice-b"
+
+get_metadata = helpers.fetch_store.get_metadata
+
+
+class ListSink:
+    def __init__(self):
+        self.documents = []
+
+    def write(self, documents):
+        self.documents.extend(documents)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(rh, "get_client", lambda: client)
+    return client
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    monkeypatch.setattr(helpers.fetch_store, "get_metadata", lambda url: None)
+    monkeypatch.setattr(helpers.fetcher, "fetch", lambda url, **kwargs: helpers.fetcher.FetchResult(url=url, text=PAGE))
+    calls = []
+
+    def call_llm_api(text, state, **kwargs):
+        calls.append(state)
+        return "{}", [], helpers.llm.TaxChangeResponse(changes=[])
+
+    monkeypatch.setattr(helpers.llm, "call_llm_api", call_llm_api)
+    return calls
+
+
+def test_depth_zero_page_is_extracted_and_stored(offline):
+    result = qp.process_payload(qp.QueuePayload(state="Pa", url="https://revenue.example.gov/notice"))
+
+    assert offline == ["Pa"]
+    assert [document["state"] for document in result.cosmos_docs] == ["Pa"]
+
+
+def test_follow_up_page_is_extracted_and_stored(offline):
+    result = qp.process_payload(qp.QueuePayload(state="PA", url="https://revenue.example.gov/notice", depth=1))
+
+    assert offline == ["PA"]
+    assert [document["depth"] for document in result.cosmos_docs] == [1]
+
+
+def test_fetch_error_fails_the_payload(monkeypatch):
+    monkeypatch.setattr(helpers.fetcher, "fetch", lambda url, **kwargs: helpers.fetcher.FetchResult(url=url, error="HTTP 404"))
+    with pytest.raises(RuntimeError, match="HTTP 404"):
+        qp.process_payload(qp.QueuePayload(state="PA", url="https://revenue.example.gov/missing"))
+
+
+def test_retry_of_a_partly_failed_message_redoes_only_the_failed_url(offline, monkeypatch, client):
+    monkeypatch.setattr(helpers.fetch_store, "get_metadata", get_metadata)
+    broken = {SOURCE_B}
+    monkeypatch.setattr(helpers.fetcher, "fetch", lambda url, **kwargs: helpers.fetcher.FetchResult(
+        url=url, **({"error": "HTTP 503"} if url in broken else {"text": PAGE})))
+    message = {"state": "PA", "urls": [SOURCE_A, SOURCE_B], "created_at": "", "depth": 0}
+
+    outcome = qp.process_message(message, DocumentWriter(ListSink()))
+    assert [fetched.url for fetched in outcome.processed] == [SOURCE_A]
+    assert [url for url, _ in outcome.failed] == [SOURCE_B]
+    with pytest.raises(RuntimeError, match="1 URL"):
+        outcome.raise_for_failures()
+
+    for fetched in outcome.processed:
+        helpers.fetch_store.save_metadata(fetched)
+    broken.clear()
+    offline.clear()
+    retry = qp.process_message(message, DocumentWriter(ListSink()))
+
+    assert offline == ["PA"]
+    assert [fetched.url for fetched in retry.processed] == [SOURCE_B]
+    assert retry.unchanged == 1 and retry.failed == []
+
+
+def test_unsent_follow_up_links_fail_only_their_source_page(offline, monkeypatch, client):
+    monkeypatch.setenv("ENQUEUE_LINKS", "true")
+    links = {SOURCE_A: ["/tax/a1", "/tax/a2"], SOURCE_B: ["/tax/b1", "/tax/b2"]}
+    monkeypatch.setattr(helpers.fetcher, "fetch", lambda url, **kwargs: helpers.fetcher.FetchResult(
+        url=url, text=PAGE, links=links[url]))
+
+    def send_items(items):
+        items = list(items)
+        unsent = [item for item in items if "/tax/b" in item["url"]]
+        raise helpers.queue_fanout.FanoutError("1 of 2 messages could not be sent", 1, unsent)
+
+    monkeypatch.setattr(helpers.queue_fanout, "send_items", send_items)
+    outcome = qp.process_message({"state": "PA", "urls": [SOURCE_A, SOURCE_B], "depth": 0}, DocumentWriter(ListSink()))
+
+    assert [fetched.url for fetched in outcome.processed] == [SOURCE_A]
+    assert [url for url, _ in outcome.failed] == [SOURCE_B]
+    assert outcome.enqueued == 1
+    frontier = Frontier("PA")
+    sent = ["https://revenue.example.gov/tax/a1", "https://revenue.example.gov/tax/a2"]
+    released = ["https://revenue.example.gov/tax/b1", "https://revenue.example.gov/tax/b2"]
+    assert frontier.unseen(sent + released) == released
@@ -0,0 +1,34 @@
+import logging
+
+import fakeredis
+import pytest
+import redis
+
+import helpers.redis_handler as rh
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(rh, "get_client", lambda: client)
+    return client
+
+
+def test_store_and_get_are_silent_on_stdout(client, capsys):
+    assert rh.store_data("key", {"a": 1}) is True
+    assert rh.get_data("key") == '{"a": 1}'
+    assert rh.get_data("missing") is None
+    assert capsys.readouterr().out == ""
+
+
+def test_redis_errors_are_logged_not_printed(monkeypatch, capsys, caplog):
+    def unavailable():
+        raise redis.ResponseError("WRONGTYPE")
+
+    monkeypatch.setattr(rh, "get_client", unavailable)
+    with caplog.at_level(logging.WARNING, logger="helpers.redis_handler"):
+        assert rh.store_data("key", 1) is False
+        assert rh.get_data("key") is None
+
+    assert capsys.readouterr().out == ""
+    assert [record.levelname for record in caplog.records] == ["WARNING", "WARNING"]
@@ -0,0 +1,149 @@
+import json
+
+import fakeredis
+import pytest
+
+import helpers.redis_handler as rh
+import helpers.redis_streams as rs
+
+STREAM = "test-stream"
+GROUP = "test-workers"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(rh, "get_client", lambda: client)
+    return client
+
+
+def make_consumer(name="worker-1", **kwargs):
+    kwargs.setdefault("block_ms", 0)
+    return rs.StreamConsumer(stream=STREAM, group=GROUP, consumer=name, **kwargs)
+
+
+def add(*payloads):
+    return rs.add_messages((json.dumps(payload) for payload in payloads), stream=STREAM)
+
+
+def test_ensure_group_is_idempotent(client):
+    rs.ensure_group(STREAM, GROUP)
+    rs.ensure_group(STREAM, GROUP)
+    assert [rs._decode(group["name"]) for group in client.xinfo_groups(STREAM)] == [GROUP]
+
+
+def test_consume_acks_handled_messages(client):
+    assert add({"url": "a"}, {"url": "b"}, {"url": "c"}) == 3
+    seen = []
+    stats = make_consumer(batch_size=2).consume(seen.append)
+
+    assert [payload["url"] for payload in seen] == ["a", "b", "c"]
+    assert stats.processed == 3 and stats.batches == 2 and len(stats.acked_ids) == 3
+    assert client.xpending(STREAM, GROUP)["pending"] == 0
+
+
+def test_consume_without_auto_ack_leaves_messages_pending(client):
+    add({"url": "a"})
+    consumer = make_consumer()
+    stats = consumer.consume(lambda payload: None, auto_ack=False)
+
+    assert client.xpending(STREAM, GROUP)["pending"] == 1
+    assert consumer.ack(stats.acked_ids) == 1
+    assert client.xpending(STREAM, GROUP)["pending"] == 0
+
+
+def test_failed_message_is_reclaimed_by_another_consumer(client):
+    add({"url": "a"})
+
+    def fail(payload):
+        raise RuntimeError("boom")
+
+    stats = make_consumer("worker-1", min_idle_ms=0).consume(fail, max_batches=1)
+    assert stats.failed == 1 and client.xpending(STREAM, GROUP)["pending"] == 1
+
+    seen = []
+    stats = make_consumer("worker-2", min_idle_ms=0).consume(seen.append)
+    assert seen == [{"url": "a"}]
+    assert stats.reclaimed == 1 and stats.processed == 1
+    assert client.xpending(STREAM, GROUP)["pending"] == 0
+
+
+def test_reclaim_advances_cursor(client):
+    add(*({"url": str(index)} for index in range(3)))
+    make_consumer("worker-1").read(count=3)
+
+    consumer = make_consumer("worker-2", min_idle_ms=0)
+    first = consumer.reclaim(2)
+    second = consumer.reclaim(2)
+
+    assert len(first) == 2 and len(second) == 1
+    assert {message.id for message in first}.isdisjoint(message.id for message in second)
+
+
+def test_message_is_dead_lettered_after_max_deliveries(client):
+    add({"url": "a"})
+
+    def fail(payload):
+        raise RuntimeError("boom")
+
+    consumer = make_consumer(min_idle_ms=0, max_deliveries=2)
+    stats = consumer.consume(fail, max_batches=2)
+
+    assert stats.failed == 2 and stats.dead_lettered == 1
+    assert client.xpending(STREAM, GROUP)["pending"] == 0
+    [(_, fields)] = client.xrange(rs.dead_letter_stream(STREAM))
+    assert json.loads(fields[b"body"]) == {"url": "a"}
+    assert fields[b"error"] == b"boom"
+
+
+def test_invalid_json_is_dead_lettered(client):
+    rs.add_messages(["not json"], stream=STREAM)
+    stats = make_consumer().consume(lambda payload: None)
+
+    assert stats.dead_lettered == 1 and stats.processed == 0
+    assert client.xlen(rs.dead_letter_stream(STREAM)) == 1
+    assert client.xpending(STREAM, GROUP)["pending"] == 0
+
+
+def test_close_removes_idle_consumer_only(client):
+    add({"url": "a"})
+    busy = make_consumer("busy")
+    busy.read()
+    idle = make_consumer("idle")
+    idle.read()
+
+    idle.close()
+    busy.close()
+    assert [rs._decode(consumer["name"]) for consumer in client.xinfo_consumers(STREAM, GROUP)] == ["busy"]
+
+
+def test_drains_needed_scales_with_backlog(client):
+    assert rs.drains_needed(STREAM, GROUP, messages_per_drain=10, max_drainers=4) == 0
+
+    add(*({"url": str(index)} for index in range(25)))
+    assert rs.drains_needed(STREAM, GROUP, messages_per_drain=10, max_drainers=4) == 3
+    assert rs.drains_needed(STREAM, GROUP, messages_per_drain=5, max_drainers=4) == 4
+
+    make_consumer().consume(lambda payload: None, auto_ack=False)
+    assert rs.backlog(STREAM, GROUP) == {"lag": 0, "pending": 25}
+    assert rs.drains_needed(STREAM, GROUP, messages_per_drain=10, max_drainers=4) == 1
+
+
+def test_drains_in_flight_are_not_dispatched_again(client):
+    first = rs.lease_drains(3, STREAM, lease_seconds=60)
+    assert len(first) == 3
+    assert rs.lease_drains(3, STREAM, lease_seconds=60) == []
+    assert rs.lease_drains(4, STREAM, lease_seconds=60) != []
+
+    rs.release_drain(first[0], STREAM)
+    assert len(rs.lease_drains(4, STREAM, lease_seconds=60)) == 1
+    assert client.zcard(rs.drain_leases_key(STREAM)) == 4
+
+
+def test_expired_drain_leases_free_their_slot(client, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rs.time, "time", lambda: now[0])
+    rs.lease_drains(2, STREAM, lease_seconds=60)
+
+    now[0] += 61
+    assert len(rs.lease_drains(2, STREAM, lease_seconds=60)) == 2
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from helpers import resilience
+
+
+def open_breaker():
+    breaker = resilience.CircuitBreaker("test", failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    return breaker
+
+
+def interrupted():
+    raise KeyboardInterrupt
+
+
+def test_interrupted_probe_does_not_close_the_circuit():
+    breaker = open_breaker()
+    with pytest.raises(KeyboardInterrupt):
+        resilience.call_with_retry(interrupted, "test", breaker=breaker)
+
+    assert breaker.state == "half_open" and breaker.failures == 1
+    breaker.allow()  # The probe was released, so the next call may probe
+
+
+def test_cancelled_probe_does_not_close_the_circuit():
+    breaker = open_breaker()
+
+    async def cancelled():
+        raise asyncio.CancelledError
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(resilience.call_with_retry_async(cancelled, "test", breaker=breaker))
+    assert breaker.state == "half_open"
+
+
+def test_non_retryable_error_counts_as_healthy():
+    breaker = open_breaker()
+
+    def bad_request():
+        raise ValueError("400")
+
+    with pytest.raises(ValueError):
+        resilience.call_with_retry(bad_request, "test", retry_on=(ConnectionError,), breaker=breaker)
+    assert breaker.state == "closed"
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+from pydantic import BaseModel
+
+from helpers.structured_output import extract_items, parse_items, repair_json, validate_items
+
+
+class Item(BaseModel):
+    category: str
+    rate: float
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Truncated arrays: cut back to the last complete element
+    ('[{"category": "a", "rate": 1}, {"category": "b", "ra', [{"category": "a", "rate": 1}]),
+    ('[{"category": "a", "rate": 1}, {"category": "b", "rate": 2}, ', [{"category": "a", "rate": 1},
+                                                                       {"category": "b", "rate": 2}]),
+    ('[[1, 2], [3, 4], [5', [[1, 2], [3, 4]]),
+    # Truncated objects
+    ('{"changes": [{"category": "a", "rate": 1}, {"categ', {"changes": [{"category": "a", "rate": 1}]}),
+    ('{"changes": [{"category": "a", "rate": 1}], "note": "cut of', {"changes": [{"category": "a", "rate": 1}]}),
+    # Prose around the JSON
+    ('Here are the changes: [{"category": "a", "rate": 1}] Let me know!', [{"category": "a", "rate": 1}]),
+    ('Result:\n{"changes": []}\nThat is all.', {"changes": []}),
+    # Trailing commas
+    ('[{"category": "a", "rate": 1},]', [{"category": "a", "rate": 1}]),
+    ('{"changes": [1, 2, ], }', {"changes": [1, 2]}),
+    # Brackets inside strings are not structure
+    ('[{"category": "a ] }", "rate": 1}] trailing', [{"category": "a ] }", "rate": 1}]),
+])
+def test_repair_json(text, expected):
+    assert json.loads(repair_json(text)) == expected
+
+
+@pytest.mark.parametrize("text", ["no json at all", "", "{\"unterminated\": \"value"])
+def test_repair_json_leaves_unrecoverable_text_invalid(text):
+    with pytest.raises(json.JSONDecodeError):
+        json.loads(repair_json(text))
+
+
+@pytest.mark.parametrize("data, expected", [
+    ([{"category": "a"}], [{"category": "a"}]),
+    ([], []),
+    ({"changes": [{"category": "a"}]}, [{"category": "a"}]),
+    ({"changes": [], "other": [1]}, []),
+    # Single-key wrapper objects, whatever the key is called
+    ({"items": [{"category": "a"}]}, [{"category": "a"}]),
+    ({"results": []}, []),
+    # A single item object is a list of one
+    ({"category": "a", "rate": 1}, [{"category": "a", "rate": 1}]),
+    ({"first": [1], "second": [2]}, [{"first": [1], "second": [2]}]),
+    ("just a string", None),
+    (42, None),
+    (None, None),
+])
+def test_extract_items(data, expected):
+    assert extract_items(data, "changes") == expected
+
+
+@pytest.mark.parametrize("items, valid_indexes, invalid_indexes", [
+    ([{"category": "a", "rate": 1}, {"category": "b", "rate": "2.5"}], [0, 1], []),
+    ([{"category": "a", "rate": 1}, {"category": "b"}], [0], [1]),
+    ([{"rate": 1}, {"category": "b", "rate": 2}, "junk", {"category": "d", "rate": "high"}], [1], [0, 2, 3]),
+    (["junk", None], [], [0, 1]),
+    ([], [], []),
+])
+def test_validate_items_drops_invalid_items(items, valid_indexes, invalid_indexes):
+    valid, kept, invalid = validate_items(items, Item)
+
+    assert kept == [items[index] for index in valid_indexes]
+    assert [item.category for item in valid] == [items[index]["category"] for index in valid_indexes]
+    assert [entry.index for entry in invalid] == invalid_indexes
+    assert [entry.item for entry in invalid] == [items[index] for index in invalid_indexes]
+
+
+def test_validate_items_reports_the_failing_field():
+    _, _, [invalid] = validate_items([{"category": "a", "rate": 1}, {"category": "b"}], Item)
+    assert invalid.index == 1 and invalid.error.startswith("rate:")
+
+
+def test_parse_items_repairs_fenced_truncated_output():
+    text = '```json\n{"changes": [{"category": "a", "rate": 1}, {"category": "b", "rate": 2}, {"category": "c'
+    parsed = parse_items(text, Item)
+
+    assert parsed.repaired
+    assert [item.category for item in parsed.items] == ["a", "b"]
+    assert parsed.invalid == []
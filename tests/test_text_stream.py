@@ -0,0 +1,16 @@
+import os
+
+from benchmarks import bench_text_stream
+
+
+def test_streaming_rss_stays_flat_as_the_blob_grows(tmp_path):
+    growth = {}
+    for size_mb in (4, 32):
+        path = os.path.join(tmp_path, f"dump_{size_mb}.md")
+        bench_text_stream.write_blob(path, size_mb)
+        growth[size_mb] = bench_text_stream.measure("stream", path, max_memory_mb=16)["growth_mb"]
+        os.remove(path)
+
+    # The whole 32 MB blob is never resident, and growing the blob eightfold barely moves the peak
+    assert growth[32] < 32
+    assert abs(growth[32] - growth[4]) <= 24